@@ -7,6 +7,16 @@ import logging # for logging functions
 import random # for stochastic chosing of programs
 import time # for time.time()
 import math # for productionFunction evaluation of math functions
+import operator # for compiled productionFunction evaluation
+import hashlib # for model keys and cache keys
+import multiprocessing # for the default number of worker processes
+import os # for model cache paths
+import mmap # for loading cached models
+import pickle # for storing cached models
+import sys # for resolving classes of cached models
+import array # for packing states (steady-state detection)
+
+__version__ = "1.1"
 
 ##########################################################################
 # auxiliary definitions
@@ -106,6 +116,77 @@ dictOperatorTypes = {
         'FUNCTION_MAX': OperatorType.max,
         }
 
+# map between OperatorType and (number of operands, function) used by compiled production functions
+# binary functions receive their operands in the order in which they appear in the expression (op1, op2)
+dictOperatorFunctions = {
+        OperatorType.eq: (2, lambda op1, op2: int(op1 == op2)),
+        OperatorType.ne: (2, lambda op1, op2: int(op1 != op2)),
+        OperatorType.lt: (2, lambda op1, op2: int(op1 < op2)),
+        OperatorType.le: (2, lambda op1, op2: int(op1 <= op2)),
+        OperatorType.gt: (2, lambda op1, op2: int(op1 > op2)),
+        OperatorType.ge: (2, lambda op1, op2: int(op1 >= op2)),
+        OperatorType.add: (2, operator.add),
+        OperatorType.subtract: (2, operator.sub),
+        OperatorType.multiply: (2, operator.mul),
+        OperatorType.divide: (2, operator.truediv),
+        OperatorType.power: (2, operator.pow),
+        OperatorType.negate: (1, operator.neg),
+
+        OperatorType.sin: (1, math.sin),
+        OperatorType.sind: (1, lambda op: math.sin(math.radians(op))),
+        OperatorType.asin: (1, math.asin),
+        OperatorType.asind: (1, lambda op: math.degrees(math.asin(op))),
+        OperatorType.cos: (1, math.cos),
+        OperatorType.cosd: (1, lambda op: math.cos(math.radians(op))),
+        OperatorType.acos: (1, math.acos),
+        OperatorType.acosd: (1, lambda op: math.degrees(math.acos(op))),
+        OperatorType.tan: (1, math.tan),
+        OperatorType.tand: (1, lambda op: math.tan(math.radians(op))),
+        OperatorType.atan: (1, math.atan),
+        OperatorType.atand: (1, lambda op: math.degrees(math.atan(op))),
+        OperatorType.atan2: (2, math.atan2),
+        OperatorType.atan2d: (2, lambda op1, op2: math.degrees(math.atan2(op1, op2))),
+        OperatorType.cot: (1, lambda op: 1 / math.tan(op)),
+        OperatorType.cotd: (1, lambda op: 1 / math.tan(math.radians(op))),
+        OperatorType.acot: (1, lambda op: math.atan(1 / op)),
+        OperatorType.acotd: (1, lambda op: math.degrees(math.atan(1 / op))),
+
+        OperatorType.sqrt: (1, math.sqrt),
+        OperatorType.abs: (1, math.fabs),
+        OperatorType.log: (1, math.log),
+        OperatorType.log10: (1, math.log10),
+        OperatorType.log2: (1, math.log2),
+        # the interpreted form pops op2 first, so min / max receive (op2, op1) in order to select the same operand on ties
+        OperatorType.min: (2, lambda op1, op2: min(op2, op1)),
+        OperatorType.max: (2, lambda op1, op2: max(op2, op1)),
+        }
+
+# operators that always return 0 or 1 (as int) and never raise exceptions
+comparisonOperators = frozenset([OperatorType.eq, OperatorType.ne, OperatorType.lt, OperatorType.le, OperatorType.gt, OperatorType.ge])
+# operators that return an int and never raise exceptions if all their operands are ints
+integerOperators = frozenset([OperatorType.add, OperatorType.subtract, OperatorType.multiply, OperatorType.negate, OperatorType.min, OperatorType.max])
+
+class OperandType(IntEnum):
+
+    """Enumeration of operand types used while compiling production functions"""
+
+    constant     = 1 # numeric value known at compile time
+    reference    = 2 # object that stores its current value in the .value attribute (e.g. Pobject)
+    closure      = 3 # function without parameters that computes the value of a sub-expression
+    operator     = 4 # operator applied to sub-expressions (only used by ExpressionNode)
+
+# end class OperandType
+
+class FlatItemType(IntEnum):
+
+    """Enumeration of item types used by the flattened (index based) form of production functions"""
+
+    constant     = 1 # numeric value
+    variable     = 2 # index of a Pobject in FlatModel.names / FlatModel.initialValues
+    operator     = 3 # OperatorType value
+
+# end class FlatItemType
+
 # tuple used to describe parsed data
 Token = collections.namedtuple('Token', ['type', 'value', 'line', 'column'])
 
@@ -121,7 +202,12 @@ class NumericalPsystem():
     :ivar MembraneStructure structure: MembraneStructure object (list of structural elements) [1 [2 ]2 ]1
     :ivar list(Pobject) variables: list of Pobjects that appear throughtout the P system
     :ivar list(Pobject) enzymes: list of enzyme Pobjects that appear throughtout the P system
-    :ivar file csvFile: file used for Comma Separated Value output
+    :ivar CsvTraceWriter csvFile: Comma Separated Value output (see pep_trace.py)
+    :ivar BinaryTraceWriter traceFile: binary trace output (see pep_trace.py)
+    :ivar Random rng: random number generator used for the stochastic choice of programs (the random module by default)
+    :ivar dict parameters: map (dictionary) between String parameter_name: Parameter object
+    :ivar list parameterBindings: list of (Pobject, Parameter) tuples for Pobjects whose initial value is a parameter
+    :ivar dict sharedValues: values of the subexpressions shared by several production functions (see compile()), cleared at each simulation step
     """
 
     def __init__(self):
@@ -131,49 +217,73 @@ class NumericalPsystem():
         self.variables = []
         self.enzymes = []
         self.csvFile = None
+        self.traceFile = None
+        self.rng = random
+        self.parameters = collections.OrderedDict()
+        self.parameterBindings = []
+        self.sharedValues = {}
+
+    def __getstate__(self):
+        """Output files and the random number generator are not stored when pickling (e.g. in a model cache)"""
+        state = self.__dict__.copy()
+        state["csvFile"] = None
+        state["traceFile"] = None
+        del state["rng"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.rng = random
 
     def runSimulationStep(self):
         """Runs 1 simulation step consisting of executing one program (production & dispersion functions) for all membranes that have programs
-        If a membrane has more than one program, one is chosen randomly for execution"""
+        If a membrane has more than one program, one is chosen randomly for execution
+        Nothing is logged here, in order to keep the simulation loop free of formatting; see pep_trace.TracedEngine for a traced variant"""
+
+        # shared subexpressions are computed at most once per step (values only change after the production phase)
+        self.sharedValues.clear()
 
         # production phase for all membranes
         for membraneName in self.H:
             membrane = self.membranes[membraneName]
             if (len(membrane.programs) < 1):
                 continue
-            logging.debug("Production for membrane %s" % membraneName)
 
             # if this membrane does not use enzymes
             if (len(membrane.enzymes) == 0):
-                membrane.chosenProgramNr = 0 if len(membrane.programs) == 1 else random.randint(0, len(membrane.programs) - 1)
-            else:
-                membrane.chosenProgramNr = []
-                for prgNr, prg in enumerate(membrane.programs):
-                    if (prg.isActivatedByEnzyme()):
-                        logging.debug("Program %d activated by enzyme %s" % (prgNr, prg.enzyme.name))
-                        membrane.chosenProgramNr.append(prgNr)
+                membrane.chosenProgramNr = 0 if len(membrane.programs) == 1 else self.rng.randint(0, len(membrane.programs) - 1)
+            # the active programs are only determined again if one of the Pobjects they depend on has changed
+            elif (membrane.activationDirty):
+                # the activation condition Enzyme > min(PROD_FUNCTION_VARIABLES) of all programs is checked at once (see Program.isActivatedByEnzyme())
+                membrane.chosenProgramNr = [prgNr for prgNr, enzyme, pobjects in membrane.activationChecks
+                        if (len(pobjects) == 0 or enzyme.value > min([pobject.value for pobject in pobjects]))]
+                membrane.activationDirty = False
             try:
                 # if this membrane does not use enzymes
                 if (len(membrane.enzymes) == 0):
                     # produce a new value
-                    membrane.newValue = membrane.programs[membrane.chosenProgramNr].prodFunction.evaluate()
+                    membrane.newValue = membrane.programs[membrane.chosenProgramNr].prodFunction.compiledFunction()
                 else:
-                    membrane.newValue = [membrane.programs[prgNr].prodFunction.evaluate() for prgNr in membrane.chosenProgramNr ]
+                    membrane.newValue = [membrane.programs[prgNr].prodFunction.compiledFunction() for prgNr in membrane.chosenProgramNr ]
             except RuntimeError:
-                logging.error("Error encountered during production function of membrane %s, program %s" % (membraneName, membrane.chosenProgramNr))
+                logging.error("Error encountered during production function of membrane %s, program %s", membraneName, membrane.chosenProgramNr)
                 # re-raise the exception to stop the simulator
                 raise
 
         ## reset variable phase
-        logging.debug("Resetting all variables that are part of production functions to 0")
         for variable in self.variables:
             if (variable.wasConsumed):
+                if (variable.value != 0):
+                    for watcher in variable.watchers:
+                        watcher.activationDirty = True
                 variable.value = 0
                 variable.wasConsumed = False # if the program it is part of will be executed again, it will be marked as consumed
         ## reset enzymes phase
-        logging.debug("Resetting all enzymes that are part of production functions to 0")
         for enzyme in self.enzymes:
             if (enzyme.wasConsumed):
+                if (enzyme.value != 0):
+                    for watcher in enzyme.watchers:
+                        watcher.activationDirty = True
                 enzyme.value = 0
                 enzyme.wasConsumed = False # if the program it is part of will be executed again, it will be marked as consumed
 
@@ -189,62 +299,353 @@ class NumericalPsystem():
 
             # if this membrane does not use enzymes
             if (type(membrane.chosenProgramNr) == int):
-                logging.debug("Distribution for membrane %s of unitary value %.02f" % (
-                    membraneName,
-                    membrane.newValue / membrane.programs[membrane.chosenProgramNr].distribFunction.proportionTotal))
                 # distribute the previously produced value
                 membrane.programs[membrane.chosenProgramNr].distribFunction.distribute(membrane.newValue)
 
             # if this membrane uses enzymes (that allow multiple program execution)
             elif (type(membrane.chosenProgramNr) == list):
                 for i in range(len(membrane.chosenProgramNr)):
-                    logging.debug("Distribution for membrane %s program %d of unitary value %.02f" % (
-                        membraneName,
-                        membrane.chosenProgramNr[i],
-                        membrane.newValue[i] / membrane.programs[membrane.chosenProgramNr[i]].distribFunction.proportionTotal))
                     # distribute the previously produced value
                     membrane.programs[membrane.chosenProgramNr[i]].distribFunction.distribute(membrane.newValue[i])
-        logging.info("Simulation step finished succesfully")
     # end runSimulationStep()
 
-    def simulate(self, stepByStepConfirm = False, printEachSystemState = True, maxSteps = -1, maxTime = -1):
+    def compile(self, optimize = False):
+        """Compiles the production functions of all programs (see ProductionFunction.compile())
+        Should be called after all string identifiers were cross-referenced to Pobject instances
+
+        :optimize: True / False - whether or not to optimize the expression trees (see optimizeExpression()) and to compute
+            the subexpressions that appear in several places of the P system only once per simulation step"""
+
+        self.sharedValues.clear()
+
+        trees = []
+        for membrane in self.membranes.values():
+            for program in membrane.programs:
+                tree = program.prodFunction.buildTree()
+                if (optimize and tree != None):
+                    tree = optimizeExpression(tree)
+                trees.append((program.prodFunction, tree))
+
+        # each subexpression that is used more than once gets a slot in sharedValues
+        sharedSlots = {}
+        if (optimize):
+            counts = {}
+            for prodFunction, tree in trees:
+                if (tree != None):
+                    countSubexpressions(tree, counts)
+            for key, count in counts.items():
+                if (count > 1):
+                    sharedSlots[key] = len(sharedSlots)
+            logging.debug("Sharing %d subexpressions between production functions", len(sharedSlots))
+
+        nrCompiled = 0
+        for prodFunction, tree in trees:
+            if (tree != None and prodFunction.compile(tree, sharedSlots, self.sharedValues)):
+                nrCompiled += 1
+            elif (tree == None):
+                # keeps the interpreted evaluation
+                prodFunction.compile()
+
+        logging.debug("Compiled %d out of %d production functions", nrCompiled, len(trees))
+
+        self.prepareActivation()
+    # end compile()
+
+    def prepareActivation(self):
+        """Gathers the Pobjects used by the activation condition of each program (see Program.isActivatedByEnzyme())
+        and registers the membranes that use enzymes as watchers of these Pobjects and of the program enzymes,
+        so that the active programs of a membrane are only determined again after one of them has changed"""
+
+        for pobject in self.variables + self.enzymes:
+            pobject.watchers = ()
+
+        for membrane in self.membranes.values():
+            membrane.activationChecks = []
+            for prgNr, program in enumerate(membrane.programs):
+                activationObjects = []
+                for item in program.prodFunction.items:
+                    if (type(item) == Pobject and item not in activationObjects):
+                        activationObjects.append(item)
+                program.activationObjects = tuple(activationObjects)
+                membrane.activationChecks.append((prgNr, program.enzyme, program.activationObjects))
+
+                if (len(membrane.enzymes) > 0):
+                    for pobject in activationObjects + [program.enzyme]:
+                        if (type(pobject) == Pobject and membrane not in pobject.watchers):
+                            # most Pobjects are not watched, so a list is only created for the watched ones
+                            if (len(pobject.watchers) == 0):
+                                pobject.watchers = []
+                            pobject.watchers.append(membrane)
+
+            membrane.activationDirty = True
+
+        # the distribution functions refer to the watchers registered above
+        for membrane in self.membranes.values():
+            for program in membrane.programs:
+                program.distribFunction.prepare()
+    # end prepareActivation()
+
+    def discardParseData(self):
+        """Releases the data that is only needed while parsing or for printing the programs (low memory mode):
+        the structure tokens, the infix form of production functions, the textual form of distribution functions and the postfix conversion stacks
+        The simulation, flatten() and the engines are not affected; print(withPrograms = True) no longer shows the expressions"""
+
+        self.structure = None
+        for membrane in self.membranes.values():
+            for program in membrane.programs:
+                program.prodFunction.infixExpression = ""
+                program.prodFunction.postfixStack = None
+                program.distribFunction.expression = ""
+    # end discardParseData()
+
+    def invalidateActivation(self):
+        """Marks the active programs of all membranes as outdated; has to be called after Pobject values are changed directly"""
+
+        for membrane in self.membranes.values():
+            membrane.activationDirty = True
+    # end invalidateActivation()
+
+    def isDeterministic(self):
+        """Checks whether the simulation of this P system does not depend on random choices
+        (programs are chosen randomly only in membranes without enzymes that have more than one program)
+
+        :returns: True / False"""
+
+        for membrane in self.membranes.values():
+            if (len(membrane.enzymes) == 0 and len(membrane.programs) > 1):
+                return False
+        return True
+    # end isDeterministic()
+
+    def getValues(self):
+        """Returns the values of all Pobjects (variables followed by enzymes)
+
+        :returns: list of values"""
+
+        return [var.value for var in self.variables] + [enz.value for enz in self.enzymes]
+    # end getValues()
+
+    def setValues(self, values):
+        """Sets the values of all Pobjects (variables followed by enzymes) and clears their consumed state
+
+        :values: sequence of values, in the order returned by getValues()"""
+
+        for pobject, value in zip(self.variables + self.enzymes, values):
+            pobject.value = value
+            pobject.wasConsumed = False
+        self.invalidateActivation()
+    # end setValues()
+
+    def getParameters(self):
+        """Returns the current values of all parameters
+
+        :returns: OrderedDict between String parameter_name: value"""
+
+        return collections.OrderedDict((name, parameter.value) for name, parameter in self.parameters.items())
+    # end getParameters()
+
+    def setParameters(self, values):
+        """Re-binds the value of one or more parameters
+        Production functions read the new value at their next evaluation and Pobjects whose initial value is a parameter are set to the new value
+        Engines built from flatten() (e.g. pep_numpy.VectorizedEngine) have to be rebuilt in order to use the new values
+
+        :values: map (dictionary) between String parameter_name: value"""
+
+        for name, value in values.items():
+            if (name not in self.parameters):
+                raise RuntimeError("Unknown parameter '%s'" % name)
+            self.parameters[name].value = value
+
+        for pobject, parameter in self.parameterBindings:
+            if (parameter.name in values):
+                pobject.value = parameter.value
+        self.invalidateActivation()
+    # end setParameters()
+
+    def flatten(self):
+        """Constructs an index based representation of this P system (see FlatModel)
+        Should be called after all string identifiers were cross-referenced to Pobject instances
+
+        Parameters are stored as constants, using their value at the time of flattening
+
+        :returns: FlatModel object"""
+
+        model = FlatModel()
+        pobjects = self.variables + self.enzymes
+        model.names = [pobject.name for pobject in pobjects]
+        model.initialValues = [pobject.value for pobject in pobjects]
+        model.nrVariables = len(self.variables)
+        # Pobjects are identified by id() because the same name can be declared more than once
+        pobjectIndexes = {id(pobject): i for i, pobject in enumerate(pobjects)}
+
+        membraneIndexes = {id(self.membranes[membraneName]): i for i, membraneName in enumerate(self.H)}
+        for membraneName in self.H:
+            membrane = self.membranes[membraneName]
+            model.membraneNames.append(membraneName)
+            model.membraneParents.append(membraneIndexes.get(id(membrane.parent), -1))
+            model.membraneEnzymatic.append(len(membrane.enzymes) > 0)
+            model.membranePrograms.append([])
+
+            for prgNr, program in enumerate(membrane.programs):
+                model.membranePrograms[-1].append(len(model.programItems))
+                model.programMembranes.append(len(model.membraneNames) - 1)
+
+                items = []
+                variables = []
+                for item in program.prodFunction.items:
+                    if (type(item) == int or type(item) == float):
+                        items.append((FlatItemType.constant, item))
+                    elif (type(item) == Pobject):
+                        items.append((FlatItemType.variable, pobjectIndexes[id(item)]))
+                        if (items[-1][1] not in variables):
+                            variables.append(items[-1][1])
+                    elif (type(item) == Parameter):
+                        items.append((FlatItemType.constant, item.value))
+                    elif (type(item) == OperatorType):
+                        items.append((FlatItemType.operator, int(item)))
+                    # unresolved identifiers are ignored, as in ProductionFunction.evaluate()
+                model.programItems.append(items)
+                model.programVariables.append(variables)
+
+                if (type(program.enzyme) == Pobject):
+                    model.programEnzymes.append(pobjectIndexes[id(program.enzyme)])
+                elif (model.membraneEnzymatic[-1]):
+                    raise RuntimeError("Program %d of membrane %s does not reference a known enzyme" % (prgNr, membraneName))
+                else:
+                    model.programEnzymes.append(-1)
+
+                distribution = []
+                for distribRule in program.distribFunction:
+                    if (type(distribRule.variable) != Pobject):
+                        raise RuntimeError("Unknown variable '%s' in the distribution function of membrane %s" % (distribRule.variable, membraneName))
+                    distribution.append((pobjectIndexes[id(distribRule.variable)], distribRule.proportion, program.distribFunction.proportionTotal))
+                model.programDistribution.append(distribution)
+
+        return model
+    # end flatten()
+
+    def simulate(self, stepByStepConfirm = False, printEachSystemState = True, maxSteps = -1, maxTime = -1, engine = None, steadyStateTolerance = None,
+            checkpointEvery = 0, checkpointFileName = None, startStep = 0, reporter = None, stopConditions = None, stopEvery = 1):
         """Simulates the numericP system until one of the imposed limits is reached
+        If steady-state detection is enabled, the simulation stops at a fixed point; if it enters a cycle, the simulation jumps
+        to the last cycle that fits into maxSteps and only runs the remaining steps (or stops, if there is no step limit)
+        Cycles are not skipped if csv or trace output is written or if stop conditions are only checked every K > 1 steps
 
         :stepByStepConfirm: True / False - whether or not to wait for confirmation before starting the next simulation step
         :printEachSystemState: True / False - whether or not to print the P system state after the execution ofeach simulation step
+            (ignored if a reporter is given)
         :maxSteps: The maximmum number of simulation steps to run
-        :maxTime: The maximum time span that the entire simulation can last"""
+        :maxTime: The maximum time span that the entire simulation can last
+        :engine: object that runs the simulation steps instead of this P system (e.g. pep_numpy.VectorizedEngine)
+            it has to provide runSimulationStep(), getValues() and syncToSystem()
+        :steadyStateTolerance: None to disable steady-state detection, 0 to detect exact fixed points and cycles
+            or the maximum absolute difference between the values of consecutive steps that is considered a steady state
+        :checkpointEvery: write a checkpoint (see writeCheckpoint()) every K simulation steps (0 = never)
+        :checkpointFileName: path of the checkpoint file
+        :startStep: number of steps that were already run (the step of the checkpoint that the simulation is resumed from, see restoreCheckpoint())
+        :reporter: StateReporter that prints the state during the simulation (None = print every step if printEachSystemState is set)
+        :stopConditions: list of StopCondition objects; the simulation stops after a step in which at least one of them is met
+        :stopEvery: check the stop conditions only every K simulation steps
+        :returns: description of the detected fixed point / cycle / steady state / met stop conditions or None"""
+
+        if (engine == None):
+            engine = self
+
+        detector = None
+        detected = None
+        if (steadyStateTolerance != None):
+            if (self.isDeterministic()):
+                detector = SteadyStateDetector(steadyStateTolerance)
+                detector.check(startStep, engine.getValues())
+            else:
+                logging.warning("Steady-state detection is disabled because programs are chosen randomly in this P system")
 
-        currentStep = 1;
+        currentStep = startStep + 1;
          # time.time() == time in seconds since the Epoch
         startTime = currentTime = time.time();
         finalTime = currentTime + maxTime
 
-        # write initial system state into csv file
-        if (self.csvFile != None):
-            self.csvFile.write("%d, %s, ,%s\n" % (
-                currentStep,
-                ", ".join([str(var.value) for var in system.variables]),
-                ", ".join([str(enz.value) for enz in system.enzymes])))
+        # the initial state was already written by a resumed simulation
+        if (startStep == 0):
+            # write initial system state into the trace file (as step 0)
+            if (self.traceFile != None):
+                self.traceFile.writeStep(0, engine.getValues())
+
+            # write initial system state into csv file (regardless of decimation)
+            if (self.csvFile != None):
+                self.csvFile.writeStep(currentStep, engine.getValues())
+
+        if (reporter == None and printEachSystemState):
+            reporter = StateReporter()
+        if (reporter != None):
+            reporter.prepare(self, engine.getValues(), startTime)
+
+        # checked once, so that disabled logging costs nothing per step
+        logSteps = logging.getLogger().isEnabledFor(logging.INFO)
 
         while (True):
-            logging.info("Starting simulation step %d", currentStep)
+            if (logSteps):
+                logging.info("Starting simulation step %d", currentStep)
 
-            self.runSimulationStep()
+            engine.runSimulationStep()
             currentTime = time.time()
 
-            if (self.csvFile != None):
-                self.csvFile.write("%d, %s, ,%s\n" % (
-                        currentStep,
-                        ", ".join([str(var.value) for var in system.variables]),
-                        ", ".join([str(enz.value) for enz in system.enzymes])))
+            if (self.traceFile != None):
+                self.traceFile.writeStep(currentStep, engine.getValues())
+
+            # only every K-th step is passed to the csv writer (decimation)
+            if (self.csvFile != None and currentStep % self.csvFile.every == 0):
+                self.csvFile.writeStep(currentStep, engine.getValues())
 
-            if (printEachSystemState):
-                self.print()
+            # the state is read from the engine, so it is not synchronized into the P system for each report
+            if (reporter != None and reporter.isDue(currentStep, currentTime)):
+                reporter.report(currentStep, engine.getValues(), currentTime)
 
             if (stepByStepConfirm):
                 input("Press ENTER to continue")
 
+            if (detector != None):
+                repetition = detector.check(currentStep, engine.getValues())
+                if (repetition != None):
+                    firstStep, period = repetition
+                    if (period == 1 and steadyStateTolerance > 0):
+                        detected = "steady state (tolerance %g) reached at step %d" % (steadyStateTolerance, firstStep)
+                        break
+                    elif (period == 1):
+                        detected = "fixed point reached at step %d" % firstStep
+                        break
+                    elif (maxSteps <= 0):
+                        detected = "cycle of period %d detected at step %d (first state of the cycle at step %d)" % (period, currentStep, firstStep)
+                        break
+                    # the output files would have a gap and stop conditions checked every K steps could miss states of the cycle,
+                    # so the remaining steps are simulated
+                    elif (self.csvFile != None or self.traceFile != None or (stopConditions and stopEvery > 1)):
+                        detected = "cycle of period %d detected at step %d (first state of the cycle at step %d), not skipped" % (
+                                period, currentStep, firstStep)
+                        logging.info("Cycle of period %d detected at step %d; the remaining steps are simulated because of the csv / trace output or stop conditions" % (
+                                period, currentStep))
+                        detector = None
+                    else:
+                        # the states repeat with this period, so whole cycles can be skipped
+                        skippedSteps = (maxSteps - currentStep) // period * period
+                        detected = "cycle of period %d detected at step %d (first state of the cycle at step %d), skipped %d steps" % (
+                                period, currentStep, firstStep, skippedSteps)
+                        currentStep += skippedSteps
+                        detector = None
+
+            if (checkpointEvery > 0 and currentStep % checkpointEvery == 0):
+                writeCheckpoint(self.getCheckpoint(currentStep, engine), checkpointFileName)
+
+            if (stopConditions and currentStep % stopEvery == 0):
+                # the conditions read the Pobjects of the P system
+                if (engine != self):
+                    engine.syncToSystem()
+                metConditions = ["'%s'" % condition.expression for condition in stopConditions if condition.isMet()]
+                if (len(metConditions) > 0):
+                    detected = "stop condition %s met at step %d" % (" and ".join(metConditions), currentStep)
+                    logging.warning("Stop condition %s met at step %d; Simulation stopped" % (" and ".join(metConditions), currentStep))
+                    break
+
             # if there is a maximum time limit set and it was exceded
             if ((currentTime >= finalTime) and (maxTime > 0)):
                 logging.warning("Maximum time limit exceeded; Simulation stopped")
@@ -258,9 +659,15 @@ class NumericalPsystem():
             currentStep += 1
         #end while loop
 
-        logging.info("Simulation finished succesfully after %d steps and %f seconds; End state below:" % (currentStep, currentTime - startTime))
+        if (engine != self):
+            engine.syncToSystem()
+        if (detected != None):
+            logging.info("Simulation finished succesfully after %d steps and %f seconds (%s); End state below:" % (currentStep, currentTime - startTime, detected))
+        else:
+            logging.info("Simulation finished succesfully after %d steps and %f seconds; End state below:" % (currentStep, currentTime - startTime))
         self.print()
 
+        return detected
     # end simulate()
 
     def print(self, indentSpaces = 2, toString = False, withPrograms = False) :
@@ -271,13 +678,14 @@ class NumericalPsystem():
         :withPrograms: print out the programs from each membrane, along with the membrane variables
         :returns: string print of the membrane if toString = True otherwise returns None """
 
-        result = ""
-
-        result += "num_ps = {\n"
+        parts = ["num_ps = {\n"]
+        if (len(self.parameters) > 0):
+            parts.append(" " * indentSpaces + "par = {%s}\n" % ", ".join(["%s: %.2f" % (name, parameter.value) for name, parameter in self.parameters.items()]))
         for membraneName in self.H:
             membrane = self.membranes[membraneName]
-            result += " " * indentSpaces + "%s:\n%s" % (membraneName, membrane.print(indentSpaces * 2, toString=True, withPrograms=withPrograms))
-        result += "}\n"
+            parts.append(" " * indentSpaces + "%s:\n%s" % (membraneName, membrane.print(indentSpaces * 2, toString=True, withPrograms=withPrograms)))
+        parts.append("}\n")
+        result = "".join(parts)
 
         if (toString):
             return result
@@ -285,16 +693,111 @@ class NumericalPsystem():
             print(result)
     # end print()
 
-    def openCsvFile(self):
+    def openCsvFile(self, filename = None, every = 1, variableNames = None, compression = None, resumeOffset = None):
         """Opens a .csv (Comma Separated Value) file where the values of all variables and enzymes are printed at each simulation step
-        The output file is named using the pattern pep_DAY-MONTH-YEAR_HOUR-MINUTE-SECOND.csv"""
-        self.csvFile = open("pep_%s.csv" % time.strftime("%d-%m-%Y_%H-%M-%S"), mode="w")
-
-        self.csvFile.write("PeP csv output. Format = STEP_NR VARIABLE_COLUMNS EMPTY_COLUMN ENZYME_COLUMNS\n")
-        self.csvFile.write("step, %s, ,%s\n" % (
-                ", ".join([var.name for var in system.variables]),
-                ", ".join([enz.name for enz in system.enzymes])))
+        The rows are formatted and written by a background thread (see pep_trace.CsvTraceWriter)
+        The default output file is named using the pattern pep_DAY-MONTH-YEAR_HOUR-MINUTE-SECOND.csv (followed by .gz / .zst if compressed)
+
+        :filename: path of the csv file (None for the default name)
+        :every: only write every K-th simulation step (the initial state is always written)
+        :variableNames: list of variable / enzyme names that are written (None for all Pobjects)
+        :compression: None, 'gzip' or 'zstd' (requires the zstandard module)
+        :resumeOffset: None to create the file or the offset (stored in a checkpoint) at which an existing csv file is continued"""
+
+        import pep_trace # background csv writer
+
+        if (filename == None):
+            filename = "pep_%s.csv" % time.strftime("%d-%m-%Y_%H-%M-%S")
+            if (compression == "gzip"):
+                filename += ".gz"
+            elif (compression == "zstd"):
+                filename += ".zst"
+
+        self.csvFile = pep_trace.CsvTraceWriter(filename,
+                [var.name for var in self.variables],
+                [enz.name for enz in self.enzymes],
+                every = every, columns = variableNames, compression = compression, resumeOffset = resumeOffset)
     # end openCsvFile()
+
+    def openTraceFile(self, filename, resumeOffset = None, traceFormat = "binary", keyframeEvery = 1000):
+        """Opens a binary trace file where the values of all variables and enzymes are written at each simulation step
+        (see pep_trace.py; step 0 is the initial state)
+
+        :filename: path of the trace file
+        :resumeOffset: None to create the file or the offset (stored in a checkpoint) at which an existing trace file is continued
+        :traceFormat: binary (all values of each step) or delta (only the values that changed, and periodic keyframes)
+        :keyframeEvery: maximum number of steps between two keyframes of a delta trace"""
+
+        import pep_trace # binary trace output
+        if (traceFormat == "delta"):
+            self.traceFile = pep_trace.DeltaTraceWriter(filename,
+                    [var.name for var in self.variables],
+                    [enz.name for enz in self.enzymes], keyframeEvery = keyframeEvery, resumeOffset = resumeOffset)
+        else:
+            self.traceFile = pep_trace.BinaryTraceWriter(filename,
+                    [var.name for var in self.variables],
+                    [enz.name for enz in self.enzymes], resumeOffset = resumeOffset)
+    # end openTraceFile()
+
+    def getModelKey(self):
+        """Computes a key that identifies the Pobjects of this P system (used in order to check that a checkpoint belongs to it)
+
+        :returns: sha256 hex digest (str)"""
+
+        digest = hashlib.sha256(("%d:%d:" % (len(self.variables), len(self.enzymes))).encode("ascii"))
+        digest.update("\n".join([pobject.name for pobject in self.variables + self.enzymes]).encode("utf-8"))
+        return digest.hexdigest()
+    # end getModelKey()
+
+    def getCheckpoint(self, step, engine = None):
+        """Captures the simulation state after a simulation step (see Checkpoint)
+        The csv and trace output files are flushed, so that their current size can be stored
+
+        :step: number of simulation steps that were run
+        :engine: engine that runs the simulation (None for this P system)
+        :returns: Checkpoint object"""
+
+        checkpoint = Checkpoint()
+        checkpoint.step = step
+        checkpoint.modelKey = self.getModelKey()
+        if (engine == None or engine == self):
+            checkpoint.values = self.getValues()
+            checkpoint.consumed = bytes([pobject.wasConsumed for pobject in self.variables + self.enzymes])
+        else:
+            # engines only keep the values; Pobjects are never consumed between simulation steps
+            checkpoint.values = engine.getValues()
+            checkpoint.consumed = bytes(len(checkpoint.values))
+        checkpoint.rngState = self.rng.getstate()
+
+        if (self.csvFile != None):
+            checkpoint.csvFileName = self.csvFile.name
+            checkpoint.csvOffset = self.csvFile.tell()
+        if (self.traceFile != None):
+            checkpoint.traceFileName = self.traceFile.name
+            checkpoint.traceOffset = self.traceFile.tell()
+        # the events file of a pep_trace.TracedEngine
+        tracer = getattr(engine, "tracer", None)
+        if (tracer != None):
+            checkpoint.eventsFileName = tracer.name
+            checkpoint.eventsOffset = tracer.tell()
+
+        return checkpoint
+    # end getCheckpoint()
+
+    def restoreCheckpoint(self, checkpoint):
+        """Sets the values, consumed flags and random number generator state stored in a checkpoint
+        Engines have to be (re)built afterwards and output files reopened using the stored offsets (see openCsvFile() and openTraceFile())
+
+        :checkpoint: Checkpoint object (see readCheckpoint())"""
+
+        if (checkpoint.modelKey != self.getModelKey()):
+            raise RuntimeError("The checkpoint was written for a different P system")
+
+        self.setValues(checkpoint.values)
+        for pobject, consumed in zip(self.variables + self.enzymes, checkpoint.consumed):
+            pobject.wasConsumed = bool(consumed)
+        self.rng.setstate(checkpoint.rngState)
+    # end restoreCheckpoint()
 # end class NumericalPsystem
 
 class MembraneStructure(list):
@@ -316,13 +819,20 @@ class Membrane():
     :ivar list(Pobject) enzymes: array of enzyme P objects
     :ivar Membrane parent: parent membrane (Membrane object)
     :ivar dict children: map (dictioanry) between String membrane_name: Membrane object
+    :ivar bool activationDirty: a Pobject that determines the activation of the programs (when using enzymes) has changed since chosenProgramNr was computed
+    :ivar list activationChecks: (program nr, enzyme, activation Pobjects) tuple for each program (see NumericalPsystem.prepareActivation())
     """
 
+    # fixed attributes (no per-instance __dict__) in order to reduce the memory used by large P systems
+    __slots__ = ("variables", "programs", "chosenProgramNr", "activationDirty", "activationChecks", "newValue", "enzymes", "parent", "children")
+
     def __init__(self, parentMembrane = None):
         self.variables = []
         self.programs = []
 
         self.chosenProgramNr = 0
+        self.activationDirty = True
+        self.activationChecks = []
 
         self.newValue = 0
         self.enzymes = []
@@ -338,21 +848,18 @@ class Membrane():
         :withPrograms: print out the programs from each membrane, along with the membrane variables
         :returns: string print of the membrane if toString = True otherwise returns None """
 
-        result = " " * indentSpaces
-
-        result += "var = {"
-        for var in self.variables:
-            result += " %s: %.2f, " % (var.name, var.value)
-        result += "}\n"
-
-        result += " " * indentSpaces + "E = {"
-        for enz in self.enzymes:
-            result += " %s: %.2f, " % (enz.name, enz.value)
-        result += "}\n"
+        # the parts are joined once, instead of growing the result string for each Pobject
+        parts = [" " * indentSpaces, "var = {"]
+        parts.extend([" %s: %.2f, " % (var.name, var.value) for var in self.variables])
+        parts.extend(["}\n", " " * indentSpaces, "E = {"])
+        parts.extend([" %s: %.2f, " % (enz.name, enz.value) for enz in self.enzymes])
+        parts.append("}\n")
 
         if (withPrograms):
-            for i, program in enumerate(self.programs):
-                result += " " * indentSpaces + "pr_%d = { %s }\n" % (i, program.print(indentSpaces = 0, toString=True))
+            parts.extend([" " * indentSpaces + "pr_%d = { %s }\n" % (i, program.print(indentSpaces = 0, toString=True))
+                for i, program in enumerate(self.programs)])
+
+        result = "".join(parts)
 
         if (toString):
             return result
@@ -368,12 +875,16 @@ class Program():
     :ivar ProductionFunction prodFunction: ProductionFunction object
     :ivar DistributionFunction distribFunction: DistributionFunction object
     :ivar Pobject enzyme: Pobject if an enzyme is used for this program
+    :ivar tuple(Pobject) activationObjects: Pobjects of the production function, whose minimum is compared to the enzyme (see NumericalPsystem.prepareActivation())
     """
 
+    __slots__ = ("prodFunction", "distribFunction", "enzyme", "activationObjects")
+
     def __init__(self):
         self.prodFunction = None
         self.distribFunction = None
         self.enzyme = None
+        self.activationObjects = ()
 
     def print(self, indentSpaces = 2, toString = False) :
         """Print a program with a given indentation level
@@ -393,25 +904,16 @@ class Program():
 
     def isActivatedByEnzyme(self):
         """Checks whether the production function activation condition Enzyme > min(PROD_FUNCTION_VARIABLES) is true
+        Uses the Pobjects gathered by NumericalPsystem.prepareActivation()
         :returns: True / False"""
 
-        minVarValue = None
-        for prodItem in self.prodFunction.items:
-            # only P object variables are considered
-            if (type(prodItem) == Pobject):
-                if (minVarValue == None or minVarValue > prodItem.value):
-                    minVarValue = prodItem.value
-
         # no variables are present in the production function
         # so the production function is active
-        if (minVarValue == None):
+        if (len(self.activationObjects) == 0):
             return True
 
         # the activation condition holds
-        if (self.enzyme.value > minVarValue):
-            return True
-
-        return False
+        return self.enzyme.value > min([pobject.value for pobject in self.activationObjects])
     # end isActivatedByEnzyme()
 
 # end class Program
@@ -423,12 +925,96 @@ class ProductionFunction():
     :ivar str infixExpression: string representation of the original expression from the input file (written in infix form)
     :ivar list postfixStack: stack of operands and operators (auxiliary for postfix form)
     :ivar list items: list of operands and operators written in postfix (reverse polish) form
+    :ivar function compiledFunction: function without parameters that evaluates the production function (see compile())
     """
 
+    __slots__ = ("infixExpression", "postfixStack", "items", "compiledFunction")
+
     def __init__(self):
         self.infixExpression = ""
         self.postfixStack = []
         self.items = []
+        # the interpreted evaluation is used until compile() succeeds
+        self.compiledFunction = self.evaluate
+
+    def __getstate__(self):
+        """The compiled function is not stored when pickling (e.g. in a model cache); compile() has to be called after unpickling"""
+        return {"infixExpression": self.infixExpression, "postfixStack": self.postfixStack, "items": self.items}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+        self.compiledFunction = self.evaluate
+
+    def buildTree(self):
+        """Transforms the postfix form into an expression tree
+        Should be called after all string identifiers were replaced with Pobject references.
+
+        :returns: root ExpressionNode or None if the postfix form is malformed"""
+
+        stack = []
+        for item in self.items:
+            # numeric values are embedded as constants
+            if (type(item) == int or type(item) == float):
+                stack.append(ExpressionNode(OperandType.constant, item))
+
+            # Pobjects and parameters are read at evaluation time (parameters in order to allow re-binding)
+            elif (type(item) == Pobject or type(item) == Parameter):
+                stack.append(ExpressionNode(OperandType.reference, item))
+
+            elif (type(item) == OperatorType and item in dictOperatorFunctions):
+                nrOperands = dictOperatorFunctions[item][0]
+                if (len(stack) < nrOperands):
+                    logging.debug("production function '%s' has too few operands, using interpreted evaluation", self.infixExpression)
+                    return None
+
+                children = stack[-nrOperands:]
+                del stack[-nrOperands:]
+                stack.append(ExpressionNode(OperandType.operator, item, children))
+
+        if (len(stack) != 1):
+            logging.debug("production function '%s' has a wrong number of operands or operators, using interpreted evaluation", self.infixExpression)
+            return None
+
+        return stack[0]
+    # end buildTree()
+
+    def compile(self, tree = None, sharedSlots = None, sharedValues = None):
+        """Transforms the expression tree into a tree of specialized closures that is stored in compiledFunction.
+        The operator type of each item is dispatched only once, at compile time, so evaluation only calls the resulting closures.
+        Should be called after all string identifiers were replaced with Pobject references.
+        If the postfix form is malformed, compiledFunction remains the interpreted evaluate() in order to report the same errors.
+
+        :tree: expression tree to compile (e.g. an optimized one); built from the postfix form by default
+        :sharedSlots: dictionary between the keys of shared subexpressions and their slot in sharedValues
+        :sharedValues: dictionary where the values of shared subexpressions are stored (see NumericalPsystem.compile())
+        :returns: True if the production function was compiled, False otherwise"""
+
+        self.compiledFunction = self.evaluate
+
+        if (tree == None):
+            tree = self.buildTree()
+            if (tree == None):
+                return False
+
+        expression = makeOperandClosure(compileExpression(tree, sharedSlots if sharedSlots != None else {}, sharedValues))
+
+        # the consumed Pobjects are those of the original expression, even if the optimized one no longer reads some of them
+        consumedObjects = []
+        for item in self.items:
+            if (type(item) == Pobject and item not in consumedObjects):
+                consumedObjects.append(item)
+        consumedObjects = tuple(consumedObjects)
+
+        def evaluateCompiled():
+            # mark all Pobjects as consumed (the order of marking is irrelevant for the reset phase)
+            for pobject in consumedObjects:
+                pobject.wasConsumed = True
+            return expression()
+
+        self.compiledFunction = evaluateCompiled
+        return True
+    # end compile()
 
     def evaluate(self):
         """Evaluates the postfix form of a production function and returns the computed value.
@@ -447,6 +1033,10 @@ class ProductionFunction():
                 # mark this Pobject as consummed
                 item.wasConsumed = True
 
+            # the current value of parameters is added to the stack (parameters are never consumed)
+            elif (type(item) == Parameter):
+                self.postfixStack.append(item.value)
+
             # (unary) operators (single parameter functions) require that one value is popped and the result is added back to the stack
             elif (item == OperatorType.sin):
                 # evaluate the function
@@ -622,7 +1212,7 @@ class ProductionFunction():
                 # apply the operator
                 self.postfixStack.append(int(op1 >= op2))
 
-            logging.debug("postfixStack = %s" % self.postfixStack)
+            logging.debug("postfixStack = %s", self.postfixStack)
 
         if (len(self.postfixStack) > 1):
             raise RuntimeError('evaluation error / wrong number of operands or operators')
@@ -631,26 +1221,102 @@ class ProductionFunction():
 
 # end class ProductionFunction
 
+class ExpressionNode():
+
+    """Node of the expression tree of a production function (see ProductionFunction.buildTree())
+
+    :ivar OperandType kind: constant, reference or operator
+    :ivar value: numeric value (constant), Pobject / Parameter (reference) or OperatorType (operator)
+    :ivar list children: operand nodes of an operator
+    :ivar tuple key: structural key, equal for identical subexpressions
+    :ivar bool isInteger: the value is always an int
+    :ivar bool isBoolean: the value is always 0 or 1 (int)
+    :ivar bool canRaise: the evaluation may raise an exception
+    """
+
+    def __init__(self, kind, value, children = ()):
+        self.kind = kind
+        self.value = value
+        self.children = children
+
+        if (kind == OperandType.constant):
+            # repr() keeps 1 / 1.0 and 0.0 / -0.0 apart
+            self.key = (kind, repr(value))
+            self.isInteger = (type(value) == int)
+            self.isBoolean = (self.isInteger and value in (0, 1))
+            self.canRaise = False
+
+        elif (kind == OperandType.reference):
+            self.key = (kind, id(value))
+            self.isInteger = self.isBoolean = False
+            self.canRaise = False
+
+        else:
+            self.key = (kind, value) + tuple([child.key for child in children])
+            self.isBoolean = (value in comparisonOperators)
+            self.isInteger = (self.isBoolean or (value in integerOperators and all([child.isInteger for child in children])))
+            self.canRaise = (not self.isInteger or any([child.canRaise for child in children]))
+# end class ExpressionNode
+
 class DistributionFunction(list):
 
     """Distribution function class (list of distribution rules)
 
     :ivar int proportionTotal: the sum of all proportions
     :ivar str expression: string representation of the distribution function
+    :ivar tuple compiledRules: (Pobject, proportion / proportionTotal, watchers of the Pobject) tuple for each rule (see prepare())
+    :ivar bool hasWatchers: at least one of the Pobjects is watched by a membrane that uses enzymes
     """
 
+    __slots__ = ("proportionTotal", "expression", "compiledRules", "hasWatchers")
+
     def __init__(self):
         """Initialize the underling list used to store rules"""
         list.__init__(self)
         self.proportionTotal = 0
         self.expression = ""
+        self.compiledRules = None
+        self.hasWatchers = False
+
+    def __getstate__(self):
+        """The compiled rules are not stored when pickling (e.g. in a model cache); prepare() is called again after unpickling"""
+        return {"proportionTotal": self.proportionTotal, "expression": self.expression}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+        self.compiledRules = None
+        self.hasWatchers = False
+
+    def prepare(self):
+        """Computes the proportion of each rule and gathers the watchers of the distributed Pobjects
+        Should be called after the watchers were registered (see NumericalPsystem.prepareActivation())"""
+
+        self.compiledRules = tuple([(distribRule.variable, distribRule.proportion / self.proportionTotal, distribRule.variable.watchers)
+            for distribRule in self])
+        self.hasWatchers = any([len(watchers) > 0 for variable, proportion, watchers in self.compiledRules])
+    # end prepare()
 
     def distribute(self, newValue):
         """Update the variables referenced in the distribution rules according to the specified proportions
         :newValue: a value that has to be distributed to the variables based on the proportions specified in the distribution rules"""
 
-        for distribRule in self:
-            distribRule.variable.value += (distribRule.proportion / self.proportionTotal) * newValue
+        if (self.compiledRules == None):
+            self.prepare()
+
+        # most distribution functions only update Pobjects that no membrane watches
+        if (not self.hasWatchers):
+            for variable, proportion, watchers in self.compiledRules:
+                variable.value += proportion * newValue
+            return
+
+        for variable, proportion, watchers in self.compiledRules:
+            amount = proportion * newValue
+            variable.value += amount
+            # the activation of programs that depend on this variable has to be checked again
+            if (amount != 0):
+                for membrane in watchers:
+                    membrane.activationDirty = True
     # end distribute()
 # end class DistributionFunction
 
@@ -662,6 +1328,8 @@ class DistributionRule():
     :ivar Pobject variable:
     """
 
+    __slots__ = ("proportion", "variable")
+
     def __init__(self):
         self.proportion = 0
         self.variable = None
@@ -692,20 +1360,578 @@ class Pobject():
     :ivar str name:
     :ivar double value:
     :ivar boolean wasConsumed: was consumed in production function
+    :ivar list(Membrane) watchers: membranes that use enzymes and whose program activation depends on this Pobject (see NumericalPsystem.prepareActivation())
+        (an empty tuple, shared by all Pobjects that are not watched)
     """
 
+    __slots__ = ("name", "value", "wasConsumed", "watchers")
+
     def __init__(self, name = '', value = 0):
         self.name = name
         self.value = value
         self.wasConsumed = False
+        self.watchers = ()
 # end class Pobject
 
+class Parameter():
+
+    """Named numeric constant that can be used in production functions and as an initial value (var0 / E0)
+    Its value can be changed (re-bound) on an already parsed P system using NumericalPsystem.setParameters()
+
+    :ivar str name:
+    :ivar double value:
+    """
+
+    __slots__ = ("name", "value")
+
+    def __init__(self, name = '', value = 0):
+        self.name = name
+        self.value = value
+# end class Parameter
+
+class SymbolTable():
+
+    """Maps identifiers to the objects they refer to; it is filled while parsing (see process_tokens())
+    and used in order to replace the identifier tokens of programs with references in a single pass (see readInputFile())
+    Variables take precedence over enzymes, which take precedence over parameters; the first declaration of a name is used
+
+    :ivar dict variables: variable name -> Pobject
+    :ivar dict enzymes: enzyme name -> Pobject
+    :ivar dict parameters: parameter name -> Parameter
+    """
+
+    def __init__(self):
+        self.variables = {}
+        self.enzymes = {}
+        self.parameters = {}
+
+    def addVariable(self, pobject):
+        self.variables.setdefault(pobject.name, pobject)
+
+    def addEnzyme(self, pobject):
+        self.enzymes.setdefault(pobject.name, pobject)
+
+    def addParameter(self, parameter):
+        self.parameters.setdefault(parameter.name, parameter)
+
+    def lookup(self, token, tables, context):
+        """Finds the object that an identifier token refers to
+
+        :token: ID token
+        :tables: dictionaries that are searched, in order of precedence
+        :context: description of where the identifier is used (for error messages)
+        :returns: the object with the name of the token"""
+
+        for table in tables:
+            if (token.value in table):
+                return table[token.value]
+
+        raise RuntimeError("Unknown identifier '%s' %s on line %d, column %d" % (token.value, context, token.line, token.column + 1))
+    # end lookup()
+
+    def resolveOperand(self, token, context):
+        """:returns: the variable, enzyme or parameter that is used as an operand of a production function"""
+        return self.lookup(token, (self.variables, self.enzymes, self.parameters), context)
+
+    def resolvePobject(self, token, context):
+        """:returns: the variable or enzyme that is the target of a distribution rule"""
+        return self.lookup(token, (self.variables, self.enzymes), context)
+
+    def resolveEnzyme(self, token, context):
+        """:returns: the enzyme required by a program"""
+        return self.lookup(token, (self.enzymes,), context)
+# end class SymbolTable
+
+class ModelUnpickler(pickle.Unpickler):
+
+    """Unpickler for cached models that resolves the classes of this module
+    regardless of whether the model was cached by pep.py run as a script (__main__) or imported as the pep module
+    Only the classes that a model contains can be loaded, so that a cache file cannot call arbitrary functions"""
+
+    # classes of this module that are stored in cached models
+    allowedClasses = frozenset(["NumericalPsystem", "MembraneStructure", "Membrane", "Program", "ProductionFunction",
+        "DistributionFunction", "DistributionRule", "Pobject", "Parameter", "OperatorType", "Token"])
+    # other classes that are stored in cached models, as (module, name) tuples
+    allowedGlobals = frozenset([("collections", "OrderedDict")])
+
+    def find_class(self, module, name):
+        if (module in ("__main__", "pep") and name in self.allowedClasses):
+            return getattr(sys.modules[__name__], name)
+        if ((module, name) in self.allowedGlobals):
+            return pickle.Unpickler.find_class(self, module, name)
+        raise pickle.UnpicklingError("%s.%s is not allowed in a model cache file" % (module, name))
+# end class ModelUnpickler
+
+class SteadyStateDetector():
+
+    """Detects that a deterministic P system has reached a fixed point or a cycle, by keeping a digest of the state
+    (the values of all variables and enzymes) of each simulation step (see NumericalPsystem.simulate())
+    Optionally, consecutive states that differ by at most a tolerance are considered a steady state
+
+    :ivar double tolerance: maximum absolute difference between the values of consecutive steady states (0 = only exact repetitions)
+    :ivar int maxHistory: maximum number of stored digests; older ones are discarded, so longer cycles are not detected
+    :ivar dict history: map (dictionary) between state digest: step number
+    :ivar list previousValues: values of the previous step (used for the tolerance)
+    """
+
+    def __init__(self, tolerance = 0.0, maxHistory = 100000):
+        self.tolerance = tolerance
+        self.maxHistory = maxHistory
+        self.history = {}
+        self.previousValues = None
+
+    def reset(self):
+        """Forgets all previous states (e.g. after the simulation jumped over a number of steps)"""
+        self.history = {}
+        self.previousValues = None
+
+    def check(self, step, values):
+        """Stores the state of a simulation step and checks whether it was reached before
+
+        :step: the step number
+        :values: list of Pobject values (variables followed by enzymes)
+        :returns: None or (first step, period) tuple - the state of step is identical to the one of first step
+            (period = 1 for a fixed point or a steady state within the tolerance)"""
+
+        if (self.tolerance > 0 and self.previousValues != None
+                and all([abs(value - previous) <= self.tolerance for value, previous in zip(values, self.previousValues)])):
+            return (step - 1, 1)
+        self.previousValues = values
+
+        try:
+            data = array.array("d", values).tobytes()
+        # integers that do not fit into a float
+        except OverflowError:
+            data = repr(values).encode()
+        digest = hashlib.blake2b(data, digest_size = 16).digest()
+
+        firstStep = self.history.get(digest)
+        if (firstStep != None):
+            return (firstStep, step - firstStep)
+
+        if (len(self.history) >= self.maxHistory):
+            self.history = {}
+        self.history[digest] = step
+        return None
+    # end check()
+# end class SteadyStateDetector
+
+class StateReporter():
+
+    """Prints the state of the P system during a simulation (see NumericalPsystem.simulate()), either completely
+    (in the format of NumericalPsystem.print()) or only the variables / enzymes whose value changed since the previous report
+    The format of the complete state is built once (see prepare()), so each report is a single string formatting operation
+    Reports are written every K simulation steps and / or at most every T seconds
+
+    :ivar int every: write a report every K simulation steps (0 = not based on the number of steps)
+    :ivar double interval: write a report if at least T seconds passed since the previous report (0 = not based on time)
+    :ivar bool changesOnly: only report the Pobjects whose value changed since the previous report
+    :ivar file output: file object used for the reports (None = sys.stdout)
+    :ivar str template: format of the complete state, with one %.2f field for each printed Pobject
+    :ivar list indexes: index of the value (in the list of variables followed by enzymes) of each field of the template
+    :ivar list names: names of all Pobjects (variables followed by enzymes)
+    :ivar list previousValues: values of the previous report (used for changesOnly)
+    :ivar double lastTime: time of the previous report (or of the start of the simulation)
+    :ivar int nrReports: number of written reports
+    """
+
+    def __init__(self, every = 1, interval = 0, changesOnly = False, output = None):
+        self.every = every
+        self.interval = interval
+        self.changesOnly = changesOnly
+        self.output = output
+        self.template = ""
+        self.indexes = []
+        self.names = []
+        self.previousValues = None
+        self.lastTime = 0
+        self.nrReports = 0
+
+    def prepare(self, system, values, currentTime = None):
+        """Builds the format of the state of a P system (identical to the output of NumericalPsystem.print())
+
+        :system: the simulated NumericalPsystem
+        :values: values of all Pobjects (variables followed by enzymes) at the start of the simulation
+        :currentTime: time of the start of the simulation (time.time() by default)"""
+
+        pobjects = system.variables + system.enzymes
+        pobjectIndexes = dict([(id(pobject), index) for index, pobject in enumerate(pobjects)])
+        self.names = [pobject.name for pobject in pobjects]
+        self.indexes = []
+
+        def escape(text):
+            return text.replace("%", "%%")
+
+        parts = ["num_ps = {\n"]
+        # parameters do not change during a simulation
+        if (len(system.parameters) > 0):
+            parts.append(escape("  par = {%s}\n" % ", ".join(["%s: %.2f" % (name, parameter.value) for name, parameter in system.parameters.items()])))
+        for membraneName in system.H:
+            membrane = system.membranes[membraneName]
+            parts.append(escape("  %s:\n" % membraneName))
+            for label, membranePobjects in (("var", membrane.variables), ("E", membrane.enzymes)):
+                parts.append("    %s = {" % label)
+                for pobject in membranePobjects:
+                    parts.append(" %s: %%.2f, " % escape(pobject.name))
+                    self.indexes.append(pobjectIndexes[id(pobject)])
+                parts.append("}\n")
+        # print() adds a newline after the state
+        parts.append("}\n\n")
+        self.template = "".join(parts)
+
+        self.previousValues = list(values)
+        self.lastTime = time.time() if currentTime == None else currentTime
+        self.nrReports = 0
+    # end prepare()
+
+    def isDue(self, step, currentTime):
+        """Checks whether a report has to be written after a simulation step
+
+        :step: the step number
+        :currentTime: the current time (time.time())
+        :returns: True / False"""
+
+        if (self.every > 0 and step % self.every == 0):
+            return True
+        return (self.interval > 0 and currentTime - self.lastTime >= self.interval)
+    # end isDue()
+
+    def report(self, step, values, currentTime = None):
+        """Writes the report of a simulation step
+
+        :step: the step number
+        :values: values of all Pobjects (variables followed by enzymes)
+        :currentTime: the current time (time.time() by default)"""
+
+        self.lastTime = time.time() if currentTime == None else currentTime
+        if (self.changesOnly):
+            changed = [index for index, (value, previous) in enumerate(zip(values, self.previousValues)) if value != previous]
+            self.previousValues = list(values)
+            # nothing is written for steps without changes
+            if (len(changed) == 0):
+                return
+            text = "step %d: %s\n" % (step, ", ".join(["%s: %.2f" % (self.names[index], values[index]) for index in changed]))
+        else:
+            text = self.template % tuple([values[index] for index in self.indexes])
+
+        (sys.stdout if self.output == None else self.output).write(text)
+        self.nrReports += 1
+    # end report()
+# end class StateReporter
+
+class StopCondition():
+
+    """Condition that stops a simulation when its value is not 0 (see NumericalPsystem.simulate())
+    It is written in the syntax of production functions (e.g. base_led >= 1) and compiled in the same way,
+    but evaluating it does not mark the Pobjects that it reads as consumed
+
+    :ivar str expression: the condition, as written by the user
+    :ivar ProductionFunction function: postfix form of the condition (identifiers are replaced with Pobject / Parameter references)
+    :ivar function evaluate: function without parameters that returns the value of the condition
+    """
+
+    def __init__(self, system, expression):
+        """Parses and compiles a condition
+
+        :system: NumericalPsystem whose variables, enzymes and parameters are used by the condition
+        :expression: the condition (string)"""
+
+        self.expression = expression
+
+        tokens = list(tokenize(expression))
+        # the production function ends when the separator of the distribution function is reached
+        tokens.append(Token('PROD_DISTRIB_SEPARATOR', '->', 1, len(expression)))
+        try:
+            index, self.function = process_tokens(tokens, ProductionFunction(), 0)
+        # a right brace without a left brace
+        except IndexError:
+            raise RuntimeError("Unbalanced braces in stop condition '%s'" % expression)
+        # the production function also ends at a '->' or '[' written by the user, which would discard the rest of the condition
+        # (process_tokens() returns the index of the token before the one that ended the production function)
+        if (index + 1 != len(tokens) - 1):
+            token = tokens[index + 1]
+            raise RuntimeError("Unexpected token '%s' in stop condition '%s' at column %d" % (token.value, expression, token.column + 1))
+
+        symbols = SymbolTable()
+        for pobject in system.variables:
+            symbols.addVariable(pobject)
+        for pobject in system.enzymes:
+            symbols.addEnzyme(pobject)
+        for parameter in system.parameters.values():
+            symbols.addParameter(parameter)
+        items = self.function.items
+        for i, item in enumerate(items):
+            if (type(item) == Token):
+                items[i] = symbols.resolveOperand(item, "in stop condition '%s'" % expression)
+            elif (type(item) == OperatorType and item == OperatorType.left_brace):
+                raise RuntimeError("Unbalanced braces in stop condition '%s'" % expression)
+
+        tree = self.function.buildTree()
+        if (tree == None):
+            raise RuntimeError("Stop condition '%s' has a wrong number of operands or operators" % expression)
+        # the compiled expression is used directly, without the closure of ProductionFunction.compile() that marks Pobjects as consumed
+        self.evaluate = makeOperandClosure(compileExpression(tree, {}, None))
+    # end __init__()
+
+    def isMet(self):
+        """:returns: True if the value of the condition is not 0"""
+        return self.evaluate() != 0
+# end class StopCondition
+
+class Checkpoint():
+
+    """State of a simulation after a simulation step, from which the simulation can be resumed with the same trajectory
+    (see NumericalPsystem.getCheckpoint(), writeCheckpoint() and readCheckpoint())
+
+    :ivar int step: number of simulation steps that were run
+    :ivar str modelKey: key of the Pobjects of the P system (see NumericalPsystem.getModelKey())
+    :ivar list values: values of all Pobjects (variables followed by enzymes)
+    :ivar bytes consumed: wasConsumed flag of each Pobject
+    :ivar tuple rngState: state of the random number generator used for the choice of programs
+    :ivar str csvFileName: path of the csv output file (None if there is no csv output)
+    :ivar int csvOffset: size of the csv output file at this step
+    :ivar str traceFileName: path of the binary trace file (None if there is no trace output)
+    :ivar int traceOffset: size of the binary trace file at this step
+    :ivar str eventsFileName: path of the events file (None if events are not traced, see pep_trace.TracedEngine)
+    :ivar int eventsOffset: size of the events file at this step
+    """
+
+    def __init__(self):
+        self.step = 0
+        self.modelKey = ""
+        self.values = []
+        self.consumed = b""
+        self.rngState = None
+        self.csvFileName = None
+        self.csvOffset = 0
+        self.traceFileName = None
+        self.traceOffset = 0
+        self.eventsFileName = None
+        self.eventsOffset = 0
+# end class Checkpoint
+
+class Simulation():
+
+    """Simulation of a numerical P system for use as a library (e.g. inside a larger control loop)
+    Nothing is printed and each Simulation uses its own random number generator, so that several ones can run in one process.
+    Pobjects are accessed by index handles (see handle()), so reading and writing values does not require name lookups or formatting.
+
+    :ivar NumericalPsystem system: the simulated P system
+    :ivar engine: object that runs the simulation steps: the P system itself (python engine), a pep_numpy.VectorizedEngine
+        (or SparseEngine) or a pep_codegen.CodegenEngine
+    :ivar int stepNr: number of simulation steps that were run
+    :ivar list(str) names: names of all Pobjects (variables followed by enzymes), in the order of the values of state()
+    :ivar list(Pobject) pobjects: all Pobjects (variables followed by enzymes)
+    """
+
+    def __init__(self, system, engine = "python", seed = None):
+        """Prepares the simulation of an already parsed P system
+
+        :system: NumericalPsystem object (see readInputFile())
+        :engine: name of the simulation engine (see engineNames)
+        :seed: seed of the random choice of programs (None for a random seed)"""
+
+        self.system = system
+        self.system.rng = random.Random(seed)
+
+        self.engine = createEngine(system, engine)
+
+        self.stepNr = 0
+        self.pobjects = system.variables + system.enzymes
+        self.names = [pobject.name for pobject in self.pobjects]
+        # the first declaration of a name is used, as in the input file
+        self.indexes = {}
+        for index, name in enumerate(self.names):
+            self.indexes.setdefault(name, index)
+
+    @classmethod
+    def fromFile(cls, filename, engine = "python", seed = None, lowMemory = False):
+        """Parses an input file and prepares its simulation
+
+        :filename: path of the input file
+        :returns: Simulation object"""
+
+        return cls(readInputFile(filename, lowMemory = lowMemory), engine, seed)
+
+    @classmethod
+    def fromString(cls, description, engine = "python", seed = None, lowMemory = False):
+        """Parses a P system description (the contents of an input file) and prepares its simulation
+
+        :description: string that contains the P system description
+        :returns: Simulation object"""
+
+        return cls(readInputString(description, lowMemory = lowMemory), engine, seed)
+
+    def step(self):
+        """Runs 1 simulation step"""
+
+        self.engine.runSimulationStep()
+        self.stepNr += 1
+    # end step()
+
+    def run(self, nrSteps):
+        """Runs several simulation steps
+
+        :nrSteps: number of simulation steps"""
+
+        # other engines run the steps in their own loop and report how many of them were completed, also if one raises an error
+        if (self.engine is not self.system):
+            try:
+                self.engine.run(nrSteps)
+            finally:
+                self.stepNr += self.engine.completedSteps
+            return
+
+        runSimulationStep = self.engine.runSimulationStep
+        for stepNr in range(nrSteps):
+            runSimulationStep()
+            self.stepNr += 1
+    # end run()
+
+    def iterate(self, nrSteps = None):
+        """Generator that runs simulation steps and yields the state after each one
+
+        :nrSteps: number of simulation steps (None for an unlimited number)
+        :returns: (step number, state view) tuples, see state()"""
+
+        while (nrSteps == None or nrSteps > 0):
+            self.step()
+            yield self.stepNr, self.state()
+            if (nrSteps != None):
+                nrSteps -= 1
+    # end iterate()
+
+    def state(self):
+        """Returns the values of all Pobjects (in the order of names) as float64 values, without copying them into Python objects
+        For the numpy and sparse engines, the result is a read-only view of the engine array that changes with the next step (copy it in order to keep it)
+
+        :returns: read-only ndarray view (numpy and sparse engines) or memoryview of an array of doubles (python and codegen engines)"""
+
+        if (self.engine is self.system):
+            return memoryview(array.array("d", [pobject.value for pobject in self.pobjects])).toreadonly()
+        if (type(self.engine.values) == list):
+            return memoryview(array.array("d", self.engine.values)).toreadonly()
+
+        view = self.engine.values.view()
+        view.flags.writeable = False
+        return view
+    # end state()
+
+    def handle(self, name):
+        """Returns the handle (index) of a variable or enzyme, used by getValue() and setValue()
+
+        :name: name of the variable / enzyme
+        :returns: int"""
+
+        if (name not in self.indexes):
+            raise RuntimeError("Unknown variable '%s'" % name)
+        return self.indexes[name]
+    # end handle()
+
+    def getValue(self, handle):
+        """:returns: the current value of a Pobject, given its handle (see handle())"""
+
+        if (self.engine is self.system):
+            return self.pobjects[handle].value
+        if (type(self.engine.values) == list):
+            return self.engine.values[handle]
+        return float(self.engine.values[handle])
+    # end getValue()
+
+    def setValue(self, handle, value):
+        """Sets the value of a Pobject, given its handle (see handle()); it is used starting with the next simulation step
+
+        :handle: handle of the Pobject
+        :value: new value"""
+
+        if (self.engine is self.system):
+            pobject = self.pobjects[handle]
+            pobject.value = value
+            # the activation of programs that depend on this Pobject has to be checked again
+            for membrane in pobject.watchers:
+                membrane.activationDirty = True
+        else:
+            self.engine.values[handle] = value
+    # end setValue()
+
+    def getValues(self):
+        """:returns: list of the values of all Pobjects (in the order of names)"""
+
+        return self.engine.getValues()
+    # end getValues()
+
+    def setValues(self, values):
+        """Sets the values of all Pobjects
+
+        :values: sequence of values, in the order of names"""
+
+        if (self.engine is self.system):
+            self.system.setValues(values)
+        else:
+            self.engine.values[:] = values
+    # end setValues()
+
+    def syncToSystem(self):
+        """Copies the values of the engine into the Pobjects of the P system (e.g. before NumericalPsystem.print())"""
+
+        if (self.engine is not self.system):
+            self.engine.syncToSystem()
+    # end syncToSystem()
+# end class Simulation
+
+class FlatModel():
+
+    """Index based representation of a numerical P system that contains only plain data (numbers, strings, lists)
+    Pobjects are referred to by their index in the list of all Pobjects (variables followed by enzymes)
+    Programs are numbered in the order of execution (membranes in the order of NumericalPsystem.H, programs in the order of definition)
+
+    :ivar list(str) names: names of all Pobjects (variables followed by enzymes)
+    :ivar list(double) initialValues: values of all Pobjects at the time of flattening
+    :ivar int nrVariables: number of variables (the first nrVariables Pobjects), the rest are enzymes
+    :ivar list(str) membraneNames: membrane names, in the order of NumericalPsystem.H
+    :ivar list(int) membraneParents: index of the parent of each membrane (-1 for the root membrane)
+    :ivar list(bool) membraneEnzymatic: whether each membrane uses enzymes (allows the execution of several programs)
+    :ivar list(list(int)) membranePrograms: program numbers of each membrane
+    :ivar list(int) programMembranes: membrane index of each program
+    :ivar list(list(tuple)) programItems: postfix form of each production function as (FlatItemType, value) tuples
+    :ivar list(list(int)) programVariables: unique indexes of the Pobjects used by each production function (these are consumed)
+    :ivar list(int) programEnzymes: index of the enzyme of each program or -1 if the program does not use an enzyme
+    :ivar list(list(tuple)) programDistribution: distribution rules of each program as (Pobject index, proportion, proportionTotal) tuples
+    """
+
+    def __init__(self):
+        self.names = []
+        self.initialValues = []
+        self.nrVariables = 0
+        self.membraneNames = []
+        self.membraneParents = []
+        self.membraneEnzymatic = []
+        self.membranePrograms = []
+        self.programMembranes = []
+        self.programItems = []
+        self.programVariables = []
+        self.programEnzymes = []
+        self.programDistribution = []
+# end class FlatModel
+
 
 ##########################################################################
 # global variables
 
 logLevel = logging.INFO
 
+# model cache files: magic string, cache format version, key (sha256 hex digest) followed by the pickled P system
+CACHE_MAGIC = b"PEPCACHE"
+CACHE_FORMAT = 4
+CACHE_EXTENSION = ".pepc"
+
+# checkpoint files: magic string, checkpoint format version, followed by the pickled Checkpoint fields
+CHECKPOINT_MAGIC = b"PEPCHKPT"
+CHECKPOINT_FORMAT = 2
+
+# names of the simulation engines (see createEngine())
+engineNames = ("python", "numpy", "sparse", "codegen")
+
 ##########################################################################
 # auxiliary functions
 
@@ -835,6 +2061,239 @@ def tokenize(code):
             yield Token(kind, value, line_num, column)
 #end tokenize()
 
+def makeOperandClosure(operand):
+    """Constructs a closure that returns the value of a compiled operand
+
+    :operand: (OperandType, value) tuple
+    :returns: function without parameters"""
+
+    kind, value = operand
+    if (kind == OperandType.constant):
+        return lambda: value
+    elif (kind == OperandType.reference):
+        return lambda: value.value
+    return value
+# end makeOperandClosure()
+
+def makeUnaryClosure(function, operand):
+    """Constructs a closure that applies a single parameter function on a compiled operand.
+    Constant and reference operands are read directly in order to avoid an additional call
+
+    :function: function that receives one parameter
+    :operand: (OperandType, value) tuple
+    :returns: function without parameters"""
+
+    kind, op = operand
+    if (kind == OperandType.constant):
+        return lambda: function(op)
+    elif (kind == OperandType.reference):
+        return lambda: function(op.value)
+    return lambda: function(op())
+# end makeUnaryClosure()
+
+def makeBinaryClosure(function, operand1, operand2):
+    """Constructs a closure that applies a two parameter function on two compiled operands.
+    Constant and reference operands are read directly in order to avoid additional calls
+
+    :function: function that receives two parameters (op1, op2)
+    :operand1: (OperandType, value) tuple of the first operand
+    :operand2: (OperandType, value) tuple of the second operand
+    :returns: function without parameters"""
+
+    kind1, op1 = operand1
+    kind2, op2 = operand2
+
+    if (kind1 == OperandType.reference):
+        if (kind2 == OperandType.reference):
+            return lambda: function(op1.value, op2.value)
+        elif (kind2 == OperandType.constant):
+            return lambda: function(op1.value, op2)
+        return lambda: function(op1.value, op2())
+
+    elif (kind1 == OperandType.constant):
+        if (kind2 == OperandType.reference):
+            return lambda: function(op1, op2.value)
+        elif (kind2 == OperandType.constant):
+            return lambda: function(op1, op2)
+        return lambda: function(op1, op2())
+
+    if (kind2 == OperandType.reference):
+        return lambda: function(op1(), op2.value)
+    elif (kind2 == OperandType.constant):
+        return lambda: function(op1(), op2)
+    return lambda: function(op1(), op2())
+# end makeBinaryClosure()
+
+def makeSharedClosure(expression, sharedValues, slot):
+    """Constructs a closure that computes a shared subexpression only once until sharedValues is cleared
+
+    :expression: function without parameters that computes the subexpression
+    :sharedValues: dictionary of computed subexpressions
+    :slot: key of this subexpression in sharedValues
+    :returns: function without parameters"""
+
+    def shared():
+        try:
+            return sharedValues[slot]
+        except KeyError:
+            value = sharedValues[slot] = expression()
+            return value
+    return shared
+# end makeSharedClosure()
+
+def compileExpression(node, sharedSlots, sharedValues):
+    """Transforms an expression tree into a compiled operand
+
+    :node: ExpressionNode
+    :sharedSlots: dictionary between the keys of shared subexpressions and their slot in sharedValues
+    :sharedValues: dictionary where the values of shared subexpressions are stored
+    :returns: (OperandType, value) tuple"""
+
+    if (node.kind != OperandType.operator):
+        return (node.kind, node.value)
+
+    nrOperands, function = dictOperatorFunctions[node.value]
+    operands = [compileExpression(child, sharedSlots, sharedValues) for child in node.children]
+    if (nrOperands == 1):
+        closure = makeUnaryClosure(function, operands[0])
+    else:
+        closure = makeBinaryClosure(function, operands[0], operands[1])
+
+    if (node.key in sharedSlots):
+        closure = makeSharedClosure(closure, sharedValues, sharedSlots[node.key])
+    return (OperandType.closure, closure)
+# end compileExpression()
+
+def isIntegerConstant(node, value):
+    """:returns: True if the node is an int constant equal to value"""
+    return (node.kind == OperandType.constant and type(node.value) == int and node.value == value)
+
+def optimizeExpression(node):
+    """Optimizes an expression tree by folding constant subexpressions and applying algebraic identities.
+    Only transformations that give the same result (value and type) for any operand values are applied:
+        * operators with constant operands are evaluated, unless this raises an exception (which is then raised at each evaluation, as before)
+        * x * 1, 1 * x, x - 0, x ^ 1, ~~x -> x
+        * x + 0, 0 + x -> x and x * 0, 0 * x -> 0 only if x is an int that is computed without exceptions (e.g. comparison results)
+        * b == 1, b != 0, b > 0, b >= 1 (and mirrored) -> b if b is a comparison (always 0 or 1)
+
+    :node: ExpressionNode
+    :returns: optimized ExpressionNode"""
+
+    if (node.kind != OperandType.operator):
+        return node
+
+    children = [optimizeExpression(child) for child in node.children]
+    operator = node.value
+
+    # constant folding
+    if (all([child.kind == OperandType.constant for child in children])):
+        try:
+            return ExpressionNode(OperandType.constant, dictOperatorFunctions[operator][1](*[child.value for child in children]))
+        except (ArithmeticError, ValueError, TypeError):
+            pass
+
+    if (len(children) == 1):
+        if (operator == OperatorType.negate and children[0].kind == OperandType.operator and children[0].value == OperatorType.negate):
+            return children[0].children[0]
+
+    else:
+        left, right = children
+        if (operator == OperatorType.multiply):
+            if (isIntegerConstant(right, 1)):
+                return left
+            if (isIntegerConstant(left, 1)):
+                return right
+            if (isIntegerConstant(right, 0) and left.isInteger and not left.canRaise):
+                return right
+            if (isIntegerConstant(left, 0) and right.isInteger and not right.canRaise):
+                return left
+
+        elif (operator == OperatorType.add):
+            if (isIntegerConstant(right, 0) and left.isInteger):
+                return left
+            if (isIntegerConstant(left, 0) and right.isInteger):
+                return right
+
+        elif (operator == OperatorType.subtract):
+            if (isIntegerConstant(right, 0)):
+                return left
+
+        elif (operator == OperatorType.power):
+            if (isIntegerConstant(right, 1)):
+                return left
+
+        elif (left.isBoolean and left.kind == OperandType.operator):
+            if ((operator == OperatorType.eq and isIntegerConstant(right, 1)) or (operator == OperatorType.ne and isIntegerConstant(right, 0))
+                    or (operator == OperatorType.gt and isIntegerConstant(right, 0)) or (operator == OperatorType.ge and isIntegerConstant(right, 1))):
+                return left
+
+        elif (right.isBoolean and right.kind == OperandType.operator):
+            if ((operator == OperatorType.eq and isIntegerConstant(left, 1)) or (operator == OperatorType.ne and isIntegerConstant(left, 0))
+                    or (operator == OperatorType.lt and isIntegerConstant(left, 0)) or (operator == OperatorType.le and isIntegerConstant(left, 1))):
+                return right
+
+    return ExpressionNode(OperandType.operator, operator, children)
+# end optimizeExpression()
+
+def countSubexpressions(node, counts):
+    """Counts the occurrences of each operator subexpression of an expression tree
+    The subexpressions of an already counted subexpression are not counted again, as they will be computed only once
+
+    :node: ExpressionNode
+    :counts: dictionary between subexpression keys and their number of occurrences (updated)"""
+
+    if (node.kind != OperandType.operator):
+        return
+
+    counts[node.key] = counts.get(node.key, 0) + 1
+    if (counts[node.key] == 1):
+        for child in node.children:
+            countSubexpressions(child, counts)
+# end countSubexpressions()
+
+def createEngine(system, engineName):
+    """Creates the object that runs the simulation steps of a P system
+
+    :system: NumericalPsystem object
+    :engineName: name of the simulation engine (see engineNames)
+    :returns: the engine (the P system itself for the python engine)
+    :raises ImportError: if the engine requires NumPy and it is not installed"""
+
+    if (engineName == "python"):
+        return system
+    elif (engineName == "numpy"):
+        import pep_numpy # array-backed simulation engine
+        return pep_numpy.VectorizedEngine(system)
+    elif (engineName == "sparse"):
+        import pep_numpy # array-backed simulation engine
+        return pep_numpy.SparseEngine(system)
+    elif (engineName == "codegen"):
+        import pep_codegen # generated simulation function
+        return pep_codegen.CodegenEngine(system)
+
+    raise RuntimeError("Unknown simulation engine '%s'; expected %s or %s" % (engineName, ", ".join(engineNames[:-1]), engineNames[-1]))
+# end createEngine()
+
+def getOptionValue(arguments, option, convert = str, default = None):
+    """Returns the value that follows an option in a list of command line arguments
+
+    :arguments: list of command line arguments (e.g. sys.argv)
+    :option: the option that precedes the value (e.g. '--replicas')
+    :convert: function used to convert the value from string (e.g. int)
+    :default: value that is returned if the option is not present
+    :returns: the converted value or default
+    :raises ValueError: if the value is missing or cannot be converted"""
+
+    if (option not in arguments):
+        return default
+
+    try:
+        return convert(arguments[arguments.index(option) + 1])
+    except (ValueError, IndexError):
+        raise ValueError("Expected a%s value after the '%s' parameter" % (
+            "n integer" if convert == int else " number" if convert == float else "", option))
+# end getOptionValue()
+
 def print_token_by_line(v):
     """Prints tokens separated by spaces on their original line (with line numbering)"""
     line_num = 0;
@@ -846,16 +2305,18 @@ def print_token_by_line(v):
         print(token.value, end=" ");
 # end print_token_by_line()
 
-def process_tokens(tokens, parent, index):
+def process_tokens(tokens, parent, index, symbols = None):
     """Process tokens recurently and return a P system structure (or a subcomponent of the same type as parent)
+    Identifiers used in programs are kept as tokens (so that their position is known) until they are resolved using the symbol table
 
     :tokens: the list of tokens to be processed
     :parent: an object that represents the type of the result
     :index: the start index in the list of tokens
+    :symbols: SymbolTable where declared variables, enzymes and parameters are registered
     :returns: index - the current index in the token list (after finishing this component)
     :returns: result - an object that is the result of processing the input parent and tokens """
 
-    logging.debug("process_tokens (parent_type = %s, index = %d)" % (type(parent), index))
+    logging.debug("process_tokens (parent_type = %s, index = %d)", type(parent), index)
     result = parent # construct the result of specified type
     prev_token = tokens[index]
     # for processing distribution rules
@@ -863,7 +2324,7 @@ def process_tokens(tokens, parent, index):
 
     while (index < len(tokens)):
         token = tokens[index]
-        logging.debug("token = '%s'" % token.value)
+        logging.debug("token = '%s'", token.value)
 
         if (type(parent) == NumericalPsystem):
             logging.debug("processing as NumericalPsystem")
@@ -871,16 +2332,30 @@ def process_tokens(tokens, parent, index):
             if (token.type == 'ASSIGN'):
                 if (prev_token.value == 'H'):
                     logging.info("building membrane list");
-                    index, result.H = process_tokens(tokens, list(), index + 1);
+                    index, result.H = process_tokens(tokens, list(), index + 1, symbols);
 
                 # if the prev_token is the name of a membrane
                 elif (prev_token.value in result.H):
                     logging.info("building Membrane");
-                    index, result.membranes[prev_token.value] = process_tokens(tokens, Membrane(), index + 1);
+                    index, result.membranes[prev_token.value] = process_tokens(tokens, Membrane(), index + 1, symbols);
 
                 elif (prev_token.value == 'structure'):
                     logging.info("building membrane structure");
-                    index, result.structure = process_tokens(tokens, MembraneStructure(), index + 1);
+                    index, result.structure = process_tokens(tokens, MembraneStructure(), index + 1, symbols);
+
+                elif (prev_token.value == 'par'):
+                    logging.info("building parameter list");
+                    index, parameters = process_tokens(tokens, list(), index + 1, symbols);
+                    for par in parameters:
+                        result.parameters[par] = Parameter(name = par)
+                        if (symbols != None):
+                            symbols.addParameter(result.parameters[par])
+
+                elif (prev_token.value == 'par0'):
+                    logging.info("building par0 list");
+                    index, values = process_tokens(tokens, list(), index + 1, symbols);
+                    for par, value in zip(result.parameters.values(), values):
+                        par.value = value
 
                 else:
                     raise RuntimeError("Unexpected token '%s' on line %d" % (prev_token.value, prev_token.line))
@@ -892,7 +2367,7 @@ def process_tokens(tokens, parent, index):
                 parent.append(token)
 
             elif (token.type == 'END'):
-                logging.debug("finished the MembraneStructure with result = %s" % result)
+                logging.debug("finished the MembraneStructure with result = %s", result)
                 return index, result;
 
             else:
@@ -905,30 +2380,34 @@ def process_tokens(tokens, parent, index):
             if (token.type == 'ASSIGN'):
                 if (prev_token.value == 'var'):
                     logging.info("building variable list");
-                    index, variables = process_tokens(tokens, list(), index + 1);
+                    index, variables = process_tokens(tokens, list(), index + 1, symbols);
                     for var in variables:
                         result.variables.append(Pobject(name = var))
+                        if (symbols != None):
+                            symbols.addVariable(result.variables[-1])
 
                 elif (prev_token.value == 'E'):
                     logging.info("building enzyme list");
-                    index, enzymes = process_tokens(tokens, list(), index + 1);
+                    index, enzymes = process_tokens(tokens, list(), index + 1, symbols);
                     for enz in enzymes:
                         result.enzymes.append(Pobject(name = enz))
+                        if (symbols != None):
+                            symbols.addEnzyme(result.enzymes[-1])
 
                 elif (prev_token.value == 'pr'):
                     logging.info("building Program");
-                    index, program = process_tokens(tokens, Program(), index + 1);
+                    index, program = process_tokens(tokens, Program(), index + 1, symbols);
                     result.programs.append(program)
 
                 elif (prev_token.value == 'var0'):
                     logging.info("building var0 list");
-                    index, variables = process_tokens(tokens, list(), index + 1);
+                    index, variables = process_tokens(tokens, list(), index + 1, symbols);
                     for i, var in enumerate(variables):
                         result.variables[i].value = var
 
                 elif (prev_token.value == 'E0'):
                     logging.info("building E0 list");
-                    index, enzymes = process_tokens(tokens, list(), index + 1);
+                    index, enzymes = process_tokens(tokens, list(), index + 1, symbols);
                     for i, enz in enumerate(enzymes):
                         result.enzymes[i].value = enz
 
@@ -941,13 +2420,13 @@ def process_tokens(tokens, parent, index):
 
             if (token.type == 'L_CURLY_BRACE'):
                 logging.info("building production function");
-                index, result.prodFunction = process_tokens(tokens, ProductionFunction(), index + 1);
+                index, result.prodFunction = process_tokens(tokens, ProductionFunction(), index + 1, symbols);
 
             elif (token.type == 'L_BRACKET'):
                 logging.info("storing enzyme required by program");
                 if (tokens[index + 1].type == 'ID'):
-                    # storing enzyme as string for now, will be referenced later to a Pobject
-                    result.enzyme = tokens[index + 1].value
+                    # storing enzyme as token for now, will be referenced later to a Pobject
+                    result.enzyme = tokens[index + 1]
                     index += 2
                 else:
                     raise RuntimeError("Unexpected token '%s' on line %d" % (token.value, token.line))
@@ -955,16 +2434,16 @@ def process_tokens(tokens, parent, index):
 
             # build a distribution rule if the PROD_DISTRIB_SEPARATOR '|' is reached for a non-enzymatic program or R_BRACKET ']' is reached for an enzymatic program
             elif ((token.type == 'PROD_DISTRIB_SEPARATOR' and result.enzyme == None)
-                    or (token.type == 'R_BRACKET' and type(result.enzyme) == str)):
+                    or (token.type == 'R_BRACKET' and type(result.enzyme) == Token)):
                 logging.info("building distribution rule");
-                index, result.distribFunction = process_tokens(tokens, DistributionFunction(), index + 1);
+                index, result.distribFunction = process_tokens(tokens, DistributionFunction(), index + 1, symbols);
 
             elif (token.type == 'R_CURLY_BRACE'):
-                logging.debug("finished this Program with result = %s" % result)
+                logging.debug("finished this Program with result = %s", result)
                 return index, result;
 
             elif (token.type == 'END'):
-                logging.debug("finished this block with result = %s" % result)
+                logging.debug("finished this block with result = %s", result)
                 return index, result;
 
             else:
@@ -987,15 +2466,15 @@ def process_tokens(tokens, parent, index):
 
             elif (token.type == 'ID'):
                 logging.debug("processing variable")
-                result.items.append(token.value) # store as string for now, reference to real P object later
+                result.items.append(token) # store as token for now, reference to real P object later
 
             elif (token.type == 'L_BRACE'):
-                logging.debug("processing operator %s" % token.value)
+                logging.debug("processing operator %s", token.value)
                 # add the current operator to the postfix transformation
                 result.postfixStack.append(OperatorType.left_brace)
 
             elif (token.type == 'R_BRACE'):
-                logging.debug("processing operator %s" % token.value)
+                logging.debug("processing operator %s", token.value)
                 # pop all elements in the stack up until the left brace and add them to the postfix form
                 while (result.postfixStack[-1] != OperatorType.left_brace):
                     op = result.postfixStack.pop()
@@ -1005,7 +2484,7 @@ def process_tokens(tokens, parent, index):
                 result.postfixStack.pop()
 
             elif (token.type in dictOperatorTypes.keys()):
-                logging.debug("processing operator %s" % token.value)
+                logging.debug("processing operator %s", token.value)
                 # current operator as OperatorType enum value
                 currentOperator = dictOperatorTypes[token.type]
 
@@ -1017,7 +2496,7 @@ def process_tokens(tokens, parent, index):
                 # pop all elements in the stack
                 while (len(result.postfixStack) > 0):
                     result.items.append(result.postfixStack.pop())
-                logging.debug("finished the production function with result = %s" % result.items)
+                logging.debug("finished the production function with result = %s", result.items)
                 result.infixExpression = result.infixExpression[1:] # strip the first character (leading space)
                 # the Program should also see PROD_DISTRIB_SEPARATOR or L_BRACKET in order to trigger the build of a distribution function or to store an enzyme for this program
                 return index-1, result;
@@ -1045,7 +2524,7 @@ def process_tokens(tokens, parent, index):
 
             elif (token.type == 'ID' and prev_token.type == "DISTRIBUTION_SIGN"):
                 # finalize the distribution rule
-                distribRule.variable = token.value # store as string for now, reference later
+                distribRule.variable = token # store as token for now, reference later
                 result.proportionTotal += distribRule.proportion
                 result.append(distribRule) # store the new distribution rule
                 result.expression += token.value
@@ -1069,7 +2548,7 @@ def process_tokens(tokens, parent, index):
                 continue
 
             elif (token.type == 'R_CURLY_BRACE'):
-                logging.debug("finished this DistributionFunction with result = %s" % result)
+                logging.debug("finished this DistributionFunction with result = %s", result)
                 result.expression = result.expression[1:] # strip the first character (leading space)
                 return index, result;
 
@@ -1081,7 +2560,7 @@ def process_tokens(tokens, parent, index):
             logging.debug("processing as DistributionRule")
 
             if (token.type == 'R_CURLY_BRACE'):
-                logging.debug("finished this DistributionRule with result = %s" % result)
+                logging.debug("finished this DistributionRule with result = %s", result)
                 return index, result;
         # end if parent == DistributionRule
 
@@ -1117,26 +2596,37 @@ def process_tokens(tokens, parent, index):
             # process the token generally
             if (token.type == 'ASSIGN'):
                 logging.info("building NumericalPsystem")
-                index, result = process_tokens(tokens, NumericalPsystem(), index + 1);
+                index, result = process_tokens(tokens, NumericalPsystem(), index + 1, symbols);
 
         if (token.type == 'END'):
-            logging.debug("finished this block with result = %s" % result)
+            logging.debug("finished this block with result = %s", result)
             return index, result;
 
         prev_token = token;
         index += 1
     return index, result
 #end process_tokens
-def readInputFile(filename, printTokens = False):
+def readInputFile(filename, printTokens = False, lowMemory = False):
     """parses the given input file and produces a P system object
 
     :filename: string path to the file that will be parsed
+    :lowMemory: True / False - whether or not to discard the data that is only needed while parsing (see NumericalPsystem.discardParseData())
     :returns: P system object"""
 
     logging.info("reading input file")
 
     with open(filename) as file_in:
-        lines = "".join(file_in.readlines());
+        lines = file_in.read()
+
+    return readInputString(lines, printTokens, lowMemory)
+# end readInputFile()
+
+def readInputString(lines, printTokens = False, lowMemory = False):
+    """parses the given P system description (the contents of an input file) and produces a P system object
+
+    :lines: string that contains the P system description
+    :lowMemory: True / False - whether or not to discard the data that is only needed while parsing (see NumericalPsystem.discardParseData())
+    :returns: P system object"""
 
     # construct array of tokens for later use
     tokens = [token for token in tokenize(lines)];
@@ -1145,62 +2635,73 @@ def readInputFile(filename, printTokens = False):
         print_token_by_line(tokens);
         print("\n\n");
 
-    index, system = process_tokens(tokens, None, 0)
+    if (len(tokens) == 0):
+        raise RuntimeError("The input does not contain a P system definition")
+
+    symbols = SymbolTable()
+    index, system = process_tokens(tokens, None, 0, symbols)
+
+    # report where the definition went wrong instead of failing later on an incomplete P system
+    if (type(system) != NumericalPsystem):
+        raise RuntimeError("Expected a P system definition (num_ps = {...}) on line %d, column %d, found '%s'" % (
+            tokens[0].line, tokens[0].column + 1, tokens[0].value))
+    # the end of the input is reported if the definition is incomplete
+    lastToken = tokens[-1]
+    # the tokens that are still needed are referenced by the P system
+    del tokens
 
-    logging.debug("constructing a global list of variables used in the entire P system")
+    logging.debug("constructing a global list of variables and enzymes used in the entire P system")
+    # each Pobject is listed once, even if it would be referenced by several membranes
+    listedObjects = set()
     for membrane in system.membranes.values():
         for var in membrane.variables:
-            if var not in system.variables:
+            if (id(var) not in listedObjects):
+                listedObjects.add(id(var))
                 system.variables.append(var)
-
-
-    logging.debug("constructing a global list of enzymes used in the entire P system")
     for membrane in system.membranes.values():
         for enz in membrane.enzymes:
-            if enz not in system.enzymes:
+            if (id(enz) not in listedObjects):
+                listedObjects.add(id(enz))
                 system.enzymes.append(enz)
 
-    logging.debug("cross-referencing string identifiers of VARIABLES to the corresponding Pobject instance")
-    # cross-reference string identifiers with references to Pobject instances
-    for var in system.variables:
-        for (membrane_name, membrane) in system.membranes.items():
-            logging.debug("processing membrane %s" % membrane_name)
-            for pr in membrane.programs:
-                # replacing in production function
-                for i, item in enumerate(pr.prodFunction.items[:]):
-                    if (var.name == item):
-                        logging.debug("replacing '%s' in production function" % item)
-                        # string value is replaced with a Pobject reference
-                        pr.prodFunction.items[i] = var
-                # replacing in distribution function
-                for i, distribRule in enumerate(pr.distribFunction):
-                    if (var.name == distribRule.variable):
-                        logging.debug("replacing '%s' in distribution function" % distribRule.variable)
-                        # string value is replaced with a Pobject reference
-                        distribRule.variable = var
-
-    logging.debug("cross-referencing string identifiers of ENZYMES to the corresponding Pobject instance")
-    # cross-reference string identifiers with references to Pobject instances
-    for enz in system.enzymes:
-        for (membrane_name, membrane) in system.membranes.items():
-            logging.debug("processing membrane %s" % membrane_name)
-            for prg_nr, pr in enumerate(membrane.programs):
-                # replace the program enzyme name with reference
-                if (enz.name == pr.enzyme):
-                    logging.debug("replacing '%s' as program %d enzyme" % (enz.name, prg_nr))
-                    pr.enzyme = enz
-                # replacing in production function
-                for i, item in enumerate(pr.prodFunction.items[:]):
-                    if (enz.name == item):
-                        logging.debug("replacing '%s' in production function" % item)
-                        # string value is replaced with a Pobject reference
-                        pr.prodFunction.items[i] = enz
-                # replacing in distribution function
-                for i, distribRule in enumerate(pr.distribFunction):
-                    if (enz.name == distribRule.variable):
-                        logging.debug("replacing '%s' in distribution function" % distribRule.variable)
-                        # string value is replaced with a Pobject reference
-                        distribRule.variable = enz
+    logging.debug("cross-referencing identifiers to the corresponding Pobject / Parameter instance")
+    # each identifier token is replaced with a reference, using the symbol table
+    for (membrane_name, membrane) in system.membranes.items():
+        # initial values (var0 / E0) that are parameter names
+        for pobject in membrane.variables + membrane.enzymes:
+            if (type(pobject.value) == str):
+                if (pobject.value not in system.parameters):
+                    raise RuntimeError("Unknown parameter '%s' used as the initial value of '%s' in membrane %s" % (pobject.value, pobject.name, membrane_name))
+                logging.debug("binding the initial value of '%s' to parameter '%s'", pobject.name, pobject.value)
+                parameter = system.parameters[pobject.value]
+                system.parameterBindings.append((pobject, parameter))
+                pobject.value = parameter.value
+
+        for prg_nr, pr in enumerate(membrane.programs):
+            # replace the program enzyme name with reference
+            if (type(pr.enzyme) == Token):
+                pr.enzyme = symbols.resolveEnzyme(pr.enzyme, "used as the enzyme of program %d of membrane %s" % (prg_nr, membrane_name))
+            # replacing in production function
+            items = pr.prodFunction.items
+            for i, item in enumerate(items):
+                if (type(item) == Token):
+                    items[i] = symbols.resolveOperand(item, "in the production function of membrane %s" % membrane_name)
+            # replacing in distribution function
+            for distribRule in pr.distribFunction:
+                if (type(distribRule.variable) == Token):
+                    distribRule.variable = symbols.resolvePobject(distribRule.variable, "in the distribution function of membrane %s" % membrane_name)
+
+    if (system.structure == None or len(system.structure) == 0):
+        raise RuntimeError("The P system definition does not contain a membrane structure (the input ends on line %d, column %d)" % (
+            lastToken.line, lastToken.column + 1))
+    for token in system.structure:
+        if (token.type in ('ID', 'NUMBER') and token.value not in system.membranes):
+            raise RuntimeError("Membrane '%s' used in the membrane structure on line %d, column %d is not defined" % (
+                token.value, token.line, token.column + 1))
+    for membraneName in system.H:
+        if (membraneName not in system.membranes):
+            raise RuntimeError("Membrane '%s' is listed in H but is not defined (the input ends on line %d, column %d)" % (
+                membraneName, lastToken.line, lastToken.column + 1))
 
     logging.debug("Constructing the internal membrane structure of the P system")
     # construct a tree representation of the P system for use for e.g. in membrane dissolution rules
@@ -1228,14 +2729,163 @@ def readInputFile(filename, printTokens = False):
         # store previous token
         prev_token = token
 
+    logging.debug("Compiling production functions")
+    system.compile()
+
+    if (lowMemory):
+        system.discardParseData()
+
+    return system
+# end readInputString()
+
+def getModelCacheKey(data):
+    """Computes the key of a cached model, which changes if either the input file or the simulator change
+
+    :data: contents of the input file (bytes)
+    :returns: sha256 hex digest (str)"""
+
+    digest = hashlib.sha256(("%s:%d:" % (__version__, CACHE_FORMAT)).encode("ascii"))
+    digest.update(data)
+    return digest.hexdigest()
+# end getModelCacheKey()
+
+def readModelCache(cacheFileName, key):
+    """Loads a P system from a model cache file (memory-mapped)
+
+    :cacheFileName: path of the cache file
+    :key: expected key (see getModelCacheKey())
+    :returns: P system object or None if the file does not exist or was created for a different key"""
+
+    if (not os.path.isfile(cacheFileName)):
+        return None
+
+    try:
+        with open(cacheFileName, "rb") as cacheFile:
+            with mmap.mmap(cacheFile.fileno(), 0, access = mmap.ACCESS_READ) as data:
+                header = CACHE_MAGIC + b"%d:" % CACHE_FORMAT + key.encode("ascii") + b"\n"
+                if (data[:len(header)] != header):
+                    return None
+                data.seek(len(header))
+                system = ModelUnpickler(data).load()
+    except (OSError, ValueError, EOFError, pickle.UnpicklingError, AttributeError) as e:
+        logging.warning("Ignoring unreadable model cache file %s (%s)" % (cacheFileName, e))
+        return None
+
+    system.compile()
+    return system
+# end readModelCache()
+
+def writeModelCache(system, cacheFileName, key):
+    """Stores a P system into a model cache file
+    The file is written under a temporary name and then renamed, so concurrent readers never see a partial file
+
+    :system: P system object (as returned by readInputFile())
+    :cacheFileName: path of the cache file
+    :key: key of the input file (see getModelCacheKey())"""
+
+    temporaryFileName = "%s.%d.tmp" % (cacheFileName, os.getpid())
+    with open(temporaryFileName, "wb") as cacheFile:
+        cacheFile.write(CACHE_MAGIC + b"%d:" % CACHE_FORMAT + key.encode("ascii") + b"\n")
+        pickle.dump(system, cacheFile, protocol = pickle.HIGHEST_PROTOCOL)
+    os.replace(temporaryFileName, cacheFileName)
+# end writeModelCache()
+
+def readInputFileCached(filename, cacheDirectory = None, printTokens = False, lowMemory = False):
+    """parses the given input file and produces a P system object, using a compiled model cache
+    The cache file is named after the input file (e.g. input.pep -> input.pepc) or, if cacheDirectory is given,
+    after the key of the input file. The P system is only parsed if there is no valid cache file, which is then (re)written.
+
+    :filename: string path to the file that will be parsed
+    :cacheDirectory: directory of the cache files (None to store the cache file next to the input file)
+    :lowMemory: True / False - whether or not to discard the data that is only needed while parsing (the cache file always contains it)
+    :returns: P system object"""
+
+    with open(filename, "rb") as file_in:
+        data = file_in.read()
+    key = getModelCacheKey(data)
+
+    if (cacheDirectory == None):
+        cacheFileName = os.path.splitext(filename)[0] + CACHE_EXTENSION
+    else:
+        cacheFileName = os.path.join(cacheDirectory, key + CACHE_EXTENSION)
+
+    system = readModelCache(cacheFileName, key)
+    if (system != None):
+        logging.info("loaded cached model %s" % cacheFileName)
+        if (lowMemory):
+            system.discardParseData()
+        return system
+
+    logging.info("reading input file")
+    # universal newlines, as for files opened in text mode
+    system = readInputString(data.decode().replace("\r\n", "\n").replace("\r", "\n"), printTokens)
+
+    try:
+        if (cacheDirectory != None):
+            os.makedirs(cacheDirectory, exist_ok = True)
+        writeModelCache(system, cacheFileName, key)
+        logging.info("wrote cached model %s" % cacheFileName)
+    except (OSError, pickle.PicklingError, RecursionError) as e:
+        logging.warning("Could not write the model cache file %s (%s)" % (cacheFileName, e))
+
+    if (lowMemory):
+        system.discardParseData()
+
     return system
-# end readinputfile()
+# end readInputFileCached()
+
+def writeCheckpoint(checkpoint, filename):
+    """Stores a checkpoint into a file
+    The file is written under a temporary name, synced and then renamed, so an interrupted simulation always leaves a complete checkpoint
+
+    :checkpoint: Checkpoint object (see NumericalPsystem.getCheckpoint())
+    :filename: path of the checkpoint file"""
+
+    values = checkpoint.values
+    # float values are packed (8 bytes each); other values (e.g. integers) are kept as they are, so that the trajectory stays identical
+    if (all([type(value) == float for value in values])):
+        values = array.array("d", values)
+    state = (checkpoint.step, checkpoint.modelKey, values, checkpoint.consumed, checkpoint.rngState,
+            checkpoint.csvFileName, checkpoint.csvOffset, checkpoint.traceFileName, checkpoint.traceOffset,
+            checkpoint.eventsFileName, checkpoint.eventsOffset)
+
+    temporaryFileName = "%s.%d.tmp" % (filename, os.getpid())
+    with open(temporaryFileName, "wb") as checkpointFile:
+        checkpointFile.write(CHECKPOINT_MAGIC + b"%d\n" % CHECKPOINT_FORMAT)
+        pickle.dump(state, checkpointFile, protocol = pickle.HIGHEST_PROTOCOL)
+        checkpointFile.flush()
+        os.fsync(checkpointFile.fileno())
+    os.replace(temporaryFileName, filename)
+    logging.debug("wrote checkpoint of step %d to %s", checkpoint.step, filename)
+# end writeCheckpoint()
+
+def readCheckpoint(filename):
+    """Loads a checkpoint from a file
+
+    :filename: path of the checkpoint file
+    :returns: Checkpoint object"""
+
+    with open(filename, "rb") as checkpointFile:
+        header = CHECKPOINT_MAGIC + b"%d\n" % CHECKPOINT_FORMAT
+        if (checkpointFile.read(len(header)) != header):
+            raise RuntimeError("%s is not a checkpoint file (or was written by a different version)" % filename)
+        try:
+            state = pickle.load(checkpointFile)
+        except (ValueError, EOFError, pickle.UnpicklingError) as e:
+            raise RuntimeError("Unreadable checkpoint file %s (%s)" % (filename, e))
+
+    checkpoint = Checkpoint()
+    (checkpoint.step, checkpoint.modelKey, values, checkpoint.consumed, checkpoint.rngState,
+            checkpoint.csvFileName, checkpoint.csvOffset, checkpoint.traceFileName, checkpoint.traceOffset,
+            checkpoint.eventsFileName, checkpoint.eventsOffset) = state
+    checkpoint.values = list(values)
+    return checkpoint
+# end readCheckpoint()
 
 ##########################################################################
 #   MAIN
 
 if (__name__ == "__main__"):
-    import sys # for argv
 
     if ('--debug' in sys.argv or '-v' in sys.argv):
         logLevel = logging.DEBUG
@@ -1275,6 +2925,33 @@ if (__name__ == "__main__"):
         print("        * -n NR: stop the simulation after NR execution steps")
         print("        * --step:          step-by-step execution")
         print("        * --csv:           write a Comma Separated Values (CSV) file that contains the values of all Pobjects at each simulation step")
+        print("        * --csv-every K:   write only every K-th simulation step into the CSV file (implies --csv)")
+        print("        * --csv-vars A,B:  write only these variables / enzymes into the CSV file (implies --csv)")
+        print("        * --csv-compress C: compress the CSV file using gzip or zstd (requires the zstandard module; implies --csv)")
+        print("        * --cache [DIR]:   load the compiled model from a cache file (DIR/KEY.pepc or next to the input file) instead of parsing the input file")
+        print("        * --trace FILE:    write a binary trace file (float64 values of all Pobjects at each simulation step, see pep_trace.py)")
+        print("        * --trace-format F: format of the trace file: binary (all values of each step, default) or delta (only the changed values and periodic keyframes)")
+        print("        * --trace-keyframe-every K: write a keyframe (all values) into a delta trace file at least every K steps (default: 1000)")
+        print("        * --events FILE:   write the activation, production, reset and distribution events of each simulation step into FILE, as JSON lines")
+        print("        * --until EXPR:    stop the simulation when EXPR (written as a production function, e.g. 'x_1_1 < 0.01') is not 0; can be repeated")
+        print("        * --until-every K: check the --until conditions only every K simulation steps")
+        print("        * --report-every K: print the state of the P system only every K simulation steps")
+        print("        * --report-interval T: print the state of the P system at most every T seconds")
+        print("        * --report-changes: print only the variables / enzymes whose value changed since the previous report")
+        print("        * --no-report:     do not print the state of the P system during the simulation (only the final state)")
+        print("        * --low-memory:    discard the data that is only needed while parsing (programs are not printed)")
+        print("        * --steady-state [TOL]: stop at a fixed point (or when consecutive states differ by at most TOL) and skip repeated cycles (deterministic P systems)")
+        print("        * --checkpoint-every K FILE: write the simulation state into the checkpoint FILE every K simulation steps")
+        print("        * --resume FILE:   resume the simulation from the checkpoint FILE (the csv and trace files are continued)")
+        print("        * --optimize:      fold constants, simplify production functions and compute shared subexpressions once per step (python engine)")
+        print("        * --engine NAME:   simulation engine: python (default), numpy (array-backed, requires NumPy), sparse (sparse matrices, for very large P systems; requires NumPy)")
+        print("                           or codegen (generated step function)")
+        print("        * --codegen-source FILE: write the source generated by the codegen engine into FILE")
+        print("        * --seed S:        seed of the random choice of programs")
+        print("        * --replicas N:    run N independent replicas (requires -n), each seeded with a seed derived from S")
+        print("        * --workers K:     number of worker processes used for replicas and sweeps (default: number of CPUs)")
+        print("        * --sweep NAME=VALUES: sweep parameter NAME over VALUES (V1,V2,... or START:STOP:STEP); can be repeated for a grid sweep (requires -n)")
+        print("        * --sweep-vars A,B: report only the final values of these variables / enzymes for each sweep point")
         print("        * -v | --debug:    increase verbosity")
         print("        * -v0 | --error:   decrease verbosity")
         exit(1)
@@ -1296,21 +2973,245 @@ if (__name__ == "__main__"):
             if (nrSteps == -2):
                 exit(1)
 
-    system = readInputFile(sys.argv[1])
+    try:
+        # simulation engine
+        engineName = getOptionValue(sys.argv, '--engine', str, "python")
+        codegenSourceFileName = getOptionValue(sys.argv, '--codegen-source')
+        # binary trace output
+        traceFileName = getOptionValue(sys.argv, '--trace')
+        traceFormat = getOptionValue(sys.argv, '--trace-format', str, "binary")
+        keyframeEvery = getOptionValue(sys.argv, '--trace-keyframe-every', int, 1000)
+        # event tracing
+        eventsFileName = getOptionValue(sys.argv, '--events')
+        # csv output
+        csvEvery = getOptionValue(sys.argv, '--csv-every', int, 1)
+        csvVariables = getOptionValue(sys.argv, '--csv-vars', lambda value: value.split(','))
+        csvCompression = getOptionValue(sys.argv, '--csv-compress')
+        writeCsv = ("--csv" in sys.argv or "--csv-every" in sys.argv or "--csv-vars" in sys.argv or "--csv-compress" in sys.argv)
+        # seed and parallel replicas
+        seed = getOptionValue(sys.argv, '--seed', int)
+        nrReplicas = getOptionValue(sys.argv, '--replicas', int, 0)
+        nrWorkers = getOptionValue(sys.argv, '--workers', int, multiprocessing.cpu_count())
+        # parameter sweep
+        sweepValues = collections.OrderedDict()
+        for i, argument in enumerate(sys.argv):
+            if (argument == '--sweep'):
+                name, separator, values = getOptionValue(sys.argv[i:], '--sweep').partition('=')
+                if (separator != '='):
+                    raise ValueError("Expected NAME=VALUES after the '--sweep' parameter")
+                import pep_replicas # replicas and parameter sweeps
+                sweepValues[name] = pep_replicas.parseSweepValues(values)
+        sweepVariables = getOptionValue(sys.argv, '--sweep-vars', lambda value: value.split(','))
+        # checkpoints
+        checkpointEvery = getOptionValue(sys.argv, '--checkpoint-every', int, 0)
+        checkpointFileName = None
+        if ('--checkpoint-every' in sys.argv):
+            # the file name follows the number of steps
+            checkpointIndex = sys.argv.index('--checkpoint-every')
+            if (checkpointEvery < 1 or checkpointIndex + 2 >= len(sys.argv)):
+                raise ValueError("Expected a positive number and a file name after the '--checkpoint-every' parameter")
+            checkpointFileName = sys.argv[checkpointIndex + 2]
+        resumeFileName = getOptionValue(sys.argv, '--resume')
+        # stop conditions
+        stopExpressions = [getOptionValue(sys.argv[i:], '--until') for i, argument in enumerate(sys.argv) if argument == '--until']
+        stopEvery = getOptionValue(sys.argv, '--until-every', int, 1)
+        # state reports
+        reportInterval = getOptionValue(sys.argv, '--report-interval', float, 0)
+        # reports based on time only, unless a number of steps is also given
+        reportEvery = getOptionValue(sys.argv, '--report-every', int, 0 if reportInterval > 0 else 1)
+    except ValueError as e:
+        logging.error(str(e))
+        exit(1)
+
+    if (csvEvery < 1):
+        logging.error("Expected a positive number after the '--csv-every' parameter")
+        exit(1)
+
+    if (stopEvery < 1):
+        logging.error("Expected a positive number after the '--until-every' parameter")
+        exit(1)
+
+    if (reportEvery < 0 or reportInterval < 0 or (reportEvery == 0 and reportInterval == 0)):
+        logging.error("Expected a positive number after the '--report-every' / '--report-interval' parameters")
+        exit(1)
+
+    if (traceFormat not in ('binary', 'delta')):
+        logging.error("Unknown trace format '%s'; expected binary or delta" % traceFormat)
+        exit(1)
+
+    if (keyframeEvery < 1):
+        logging.error("Expected a positive number after the '--trace-keyframe-every' parameter")
+        exit(1)
+
+    if (csvCompression not in (None, 'gzip', 'zstd')):
+        logging.error("Unknown csv compression '%s'; expected gzip or zstd" % csvCompression)
+        exit(1)
+
+    if (engineName not in engineNames):
+        logging.error("Unknown simulation engine '%s'; expected %s or %s" % (engineName, ", ".join(engineNames[:-1]), engineNames[-1]))
+        exit(1)
+
+    if (eventsFileName != None and engineName != "python"):
+        logging.error("Event tracing ('--events' parameter) is only available for the python engine")
+        exit(1)
+
+    if (checkpointEvery > 0 and csvCompression != None):
+        logging.error("Compressed csv files cannot be resumed, so they cannot be used together with checkpoints ('--checkpoint-every' parameter)")
+        exit(1)
+
+    if ((nrReplicas > 0 or len(sweepValues) > 0) and nrSteps <= 0):
+        logging.error("Running replicas or parameter sweeps requires a number of simulation steps ('-n' parameter)")
+        exit(1)
+
+    lowMemory = ('--low-memory' in sys.argv)
 
-    if ("--csv" in sys.argv):
-        system.openCsvFile()
+    steadyStateTolerance = None
+    if ('--steady-state' in sys.argv):
+        # the tolerance is optional
+        steadyStateTolerance = 0.0
+        toleranceIndex = sys.argv.index('--steady-state')
+        if (toleranceIndex + 1 < len(sys.argv) and not sys.argv[toleranceIndex + 1].startswith('-')):
+            try:
+                steadyStateTolerance = float(sys.argv[toleranceIndex + 1])
+            except ValueError:
+                steadyStateTolerance = -1
+        if (steadyStateTolerance < 0):
+            logging.error("Expected a non-negative tolerance after the '--steady-state' parameter")
+            exit(1)
+
+    if ('--cache' in sys.argv):
+        # the cache directory is optional
+        cacheDirectory = None
+        cacheIndex = sys.argv.index('--cache')
+        if (cacheIndex + 1 < len(sys.argv) and not sys.argv[cacheIndex + 1].startswith('-')):
+            cacheDirectory = sys.argv[cacheIndex + 1]
+        system = readInputFileCached(sys.argv[1], cacheDirectory, lowMemory = lowMemory)
+    else:
+        system = readInputFile(sys.argv[1], lowMemory = lowMemory)
+
+    if ('--optimize' in sys.argv):
+        system.compile(optimize = True)
+
+    # the state is restored before the engine is built from it
+    checkpoint = None
+    if (resumeFileName != None):
+        try:
+            checkpoint = readCheckpoint(resumeFileName)
+            system.restoreCheckpoint(checkpoint)
+        except (OSError, RuntimeError) as e:
+            logging.error(str(e))
+            exit(1)
+        if (nrSteps > 0 and checkpoint.step >= nrSteps):
+            logging.error("The checkpoint is already at step %d" % checkpoint.step)
+            exit(1)
+        if (checkpoint.eventsFileName != None and engineName != "python"):
+            logging.error("The checkpoint continues an events file, which is only available for the python engine")
+            exit(1)
+        logging.info("Resuming the simulation from step %d (%s)" % (checkpoint.step, resumeFileName))
+
+    engine = None
+    if (engineName != "python"):
+        try:
+            engine = createEngine(system, engineName)
+        except ImportError:
+            logging.error("The %s engine requires the NumPy module" % engineName)
+            exit(1)
+        except RuntimeError as e:
+            logging.error(str(e))
+            exit(1)
+    if (codegenSourceFileName != None and engineName == "codegen"):
+        engine.writeSource(codegenSourceFileName)
+        logging.info("Wrote the generated source into %s" % codegenSourceFileName)
+
+    if (nrReplicas > 0 or len(sweepValues) > 0):
+        import pep_replicas # replicas and parameter sweeps
+
+    if (nrReplicas > 0):
+        if (seed == None):
+            seed = random.randrange(2**32)
+        logging.info("Running %d replicas of %d steps using %d worker processes and base seed %d" % (nrReplicas, nrSteps, nrWorkers, seed))
+        results = pep_replicas.runReplicas(system, nrReplicas, nrSteps, nrWorkers, seed, recordTrace = writeCsv, engine = engine)
+        logging.info("Wrote replica output file %s" % pep_replicas.writeReplicaResults(system, results))
+        exit(0)
+
+    if (len(sweepValues) > 0):
+        points = pep_replicas.parameterGrid(sweepValues)
+        if (seed == None):
+            seed = random.randrange(2**32)
+        if (sweepVariables == None):
+            sweepVariables = [pobject.name for pobject in system.variables + system.enzymes]
+        logging.info("Running a sweep of %d points of %d steps using %d worker processes and base seed %d" % (len(points), nrSteps, nrWorkers, seed))
+        try:
+            results = pep_replicas.sweepParameters(system, points, nrSteps, sweepVariables, nrWorkers, seed, engine = engine)
+        except RuntimeError as e:
+            logging.error(str(e))
+            exit(1)
+        logging.info("Wrote sweep output file %s" % pep_replicas.writeSweepResults(results, sweepVariables))
+        exit(0)
+
+    if (seed != None and checkpoint != None):
+        logging.warning("The random number generator state is restored from the checkpoint; the '--seed' parameter is ignored")
+    elif (seed != None):
+        system.rng = random.Random(seed)
+
+    try:
+        # the output files of the interrupted simulation are continued
+        if (checkpoint != None and checkpoint.csvFileName != None):
+            system.openCsvFile(checkpoint.csvFileName, every = csvEvery, variableNames = csvVariables, resumeOffset = checkpoint.csvOffset)
+        elif (writeCsv):
+            system.openCsvFile(every = csvEvery, variableNames = csvVariables, compression = csvCompression)
+
+        if (checkpoint != None and checkpoint.traceFileName != None):
+            system.openTraceFile(checkpoint.traceFileName, resumeOffset = checkpoint.traceOffset, traceFormat = traceFormat, keyframeEvery = keyframeEvery)
+        elif (traceFileName != None):
+            system.openTraceFile(traceFileName, traceFormat = traceFormat, keyframeEvery = keyframeEvery)
+    except (OSError, RuntimeError) as e:
+        logging.error(str(e))
+        exit(1)
 
+    eventTracer = None
+    if (eventsFileName != None or (checkpoint != None and checkpoint.eventsFileName != None)):
+        import pep_trace # event tracing
+        try:
+            # the events file of the interrupted simulation is continued
+            if (checkpoint != None and checkpoint.eventsFileName != None):
+                eventTracer = pep_trace.EventTracer(checkpoint.eventsFileName, resumeOffset = checkpoint.eventsOffset)
+            else:
+                eventTracer = pep_trace.EventTracer(eventsFileName)
+        except (OSError, RuntimeError) as e:
+            logging.error(str(e))
+            exit(1)
+        engine = pep_trace.TracedEngine(system, eventTracer, startStep = checkpoint.step if checkpoint != None else 0)
 
     if (logLevel <= logging.WARNING):
         # print the structure of the P system
-        system.print(indentSpaces=4, withPrograms = True)
+        system.print(indentSpaces=4, withPrograms = not lowMemory)
 
 
-    system.simulate(stepByStepConfirm = step, maxSteps = nrSteps)
+    try:
+        stopConditions = [StopCondition(system, expression) for expression in stopExpressions]
+    except RuntimeError as e:
+        logging.error(str(e))
+        exit(1)
+
+    reporter = None
+    if ('--no-report' not in sys.argv):
+        reporter = StateReporter(every = reportEvery, interval = reportInterval, changesOnly = ('--report-changes' in sys.argv))
+
+    system.simulate(stepByStepConfirm = step, printEachSystemState = False, maxSteps = nrSteps, engine = engine,
+            steadyStateTolerance = steadyStateTolerance, checkpointEvery = checkpointEvery, checkpointFileName = checkpointFileName,
+            startStep = checkpoint.step if checkpoint != None else 0, reporter = reporter, stopConditions = stopConditions, stopEvery = stopEvery)
 
     if (system.csvFile != None):
         logging.info("Wrote csv output file %s" % system.csvFile.name)
         system.csvFile.close()
 
+    if (system.traceFile != None):
+        system.traceFile.close()
+        logging.info("Wrote trace file %s" % system.traceFile.name)
+
+    if (eventTracer != None):
+        eventTracer.close()
+        logging.info("Wrote events file %s" % eventTracer.name)
+
     print("\n\n");
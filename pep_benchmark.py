@@ -0,0 +1,307 @@
+#!/usr/bin/python3
+
+"""Benchmark of the parse and simulation throughput of numerical P systems (see pep.py)
+
+For each P system (an input file or one produced by pep_generator.py) the benchmark measures:
+
+    * the time needed by readInputFile()
+    * the number of simulation steps per second (runSimulationStep() or the step of another engine)
+    * the overhead of csv output and of binary trace output, relative to the simulation without output
+    * the peak memory (traced Python allocations) while parsing and while simulating
+
+The results are printed (or written) as JSON, so that they can be stored and compared against a later run (--compare)."""
+
+import contextlib # for silencing the output of simulate()
+import json # for machine readable results
+import logging # for progress messages
+import os # for temporary output files
+import platform # for describing the machine
+import random # for seeding the simulation
+import sys # for argv
+import tempfile # for temporary output files
+import time # for perf_counter()
+import tracemalloc # for peak memory
+
+import pep # the simulator
+import pep_generator # synthetic P systems
+
+##########################################################################
+# global variables
+
+# progress messages use their own logger, so that they can be shown without the (verbose) messages of the simulator
+logger = logging.getLogger("pep_benchmark")
+
+##########################################################################
+# auxiliary functions
+
+def measureParse(filename, repeat):
+    """Measures the time needed to parse an input file
+
+    :filename: path of the input file
+    :repeat: number of measurements (the fastest one is reported)
+    :returns: (seconds, P system object) tuple"""
+
+    best = None
+    for repetition in range(repeat):
+        startTime = time.perf_counter()
+        system = pep.readInputFile(filename)
+        duration = time.perf_counter() - startTime
+        best = duration if best == None else min(best, duration)
+
+    return best, system
+# end measureParse()
+
+def measureSteps(system, engineName, nrSteps, repeat):
+    """Measures the simulation throughput, starting each measurement from the initial state
+
+    :system: P system object (in its initial state)
+    :engineName: name of the simulation engine (see pep.engineNames)
+    :nrSteps: number of simulation steps of each measurement
+    :repeat: number of measurements (the fastest one is reported)
+    :returns: number of steps per second"""
+
+    initialValues = system.getValues()
+    best = None
+    for repetition in range(repeat):
+        system.setValues(initialValues)
+        engine = pep.createEngine(system, engineName)
+        random.seed(repetition)
+
+        startTime = time.perf_counter()
+        for stepNr in range(nrSteps):
+            engine.runSimulationStep()
+        duration = time.perf_counter() - startTime
+        best = duration if best == None else min(best, duration)
+
+    system.setValues(initialValues)
+    return nrSteps / best
+# end measureSteps()
+
+def measureSimulate(system, engineName, nrSteps, repeat, output = None):
+    """Measures the duration of NumericalPsystem.simulate(), optionally with csv or trace output
+
+    :system: P system object (in its initial state)
+    :engineName: name of the simulation engine (see pep.engineNames)
+    :nrSteps: number of simulation steps
+    :repeat: number of measurements (the fastest one is reported)
+    :output: None, 'csv' or 'trace'
+    :returns: seconds"""
+
+    initialValues = system.getValues()
+    best = None
+    with tempfile.TemporaryDirectory(prefix="pep_benchmark_") as directory:
+        for repetition in range(repeat):
+            system.setValues(initialValues)
+            engine = pep.createEngine(system, engineName)
+            random.seed(repetition)
+
+            startTime = time.perf_counter()
+            if (output == "csv"):
+                system.openCsvFile(os.path.join(directory, "output.csv"))
+            elif (output == "trace"):
+                system.openTraceFile(os.path.join(directory, "output.trace"))
+
+            # the final state and the warning about the step limit are not part of the benchmark
+            logging.disable(logging.WARNING)
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                system.simulate(printEachSystemState = False, maxSteps = nrSteps, engine = engine)
+            logging.disable(logging.NOTSET)
+
+            # closing waits for all the buffered output to be written
+            if (system.csvFile != None):
+                system.csvFile.close()
+                system.csvFile = None
+            if (system.traceFile != None):
+                system.traceFile.close()
+                system.traceFile = None
+            duration = time.perf_counter() - startTime
+            best = duration if best == None else min(best, duration)
+
+    system.setValues(initialValues)
+    return best
+# end measureSimulate()
+
+def measureMemory(filename, engineName, nrSteps):
+    """Measures the peak memory allocated by Python while parsing an input file and while simulating it
+    (measured separately from the timings, because tracemalloc slows down allocations)
+
+    :filename: path of the input file
+    :engineName: name of the simulation engine (see pep.engineNames)
+    :nrSteps: number of simulation steps
+    :returns: (parse peak bytes, simulation peak bytes) tuple"""
+
+    tracemalloc.start()
+    system = pep.readInputFile(filename)
+    parsePeak = tracemalloc.get_traced_memory()[1]
+
+    tracemalloc.reset_peak()
+    engine = pep.createEngine(system, engineName)
+    for stepNr in range(nrSteps):
+        engine.runSimulationStep()
+    stepPeak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return parsePeak, stepPeak
+# end measureMemory()
+
+def benchmarkFile(filename, nrSteps = 100, repeat = 3, engineName = "python", name = None):
+    """Runs all measurements on an input file
+
+    :filename: path of the input file
+    :nrSteps: number of simulation steps of each measurement
+    :repeat: number of repetitions of each timing (the fastest one is reported)
+    :engineName: name of the simulation engine (see pep.engineNames)
+    :name: name of the benchmark (the file name by default)
+    :returns: dictionary of results"""
+
+    logger.info("benchmarking %s", filename)
+    parseSeconds, system = measureParse(filename, repeat)
+    stepsPerSecond = measureSteps(system, engineName, nrSteps, repeat)
+
+    plainSeconds = measureSimulate(system, engineName, nrSteps, repeat)
+    csvSeconds = measureSimulate(system, engineName, nrSteps, repeat, "csv")
+    traceSeconds = measureSimulate(system, engineName, nrSteps, repeat, "trace")
+    parsePeak, stepPeak = measureMemory(filename, engineName, nrSteps)
+
+    return {
+        "name": name if name != None else os.path.basename(filename),
+        "engine": engineName,
+        "membranes": len(system.membranes),
+        "variables": len(system.variables),
+        "enzymes": len(system.enzymes),
+        "programs": sum([len(membrane.programs) for membrane in system.membranes.values()]),
+        "steps": nrSteps,
+        "parseSeconds": parseSeconds,
+        "stepsPerSecond": stepsPerSecond,
+        "csvOverhead": csvSeconds / plainSeconds - 1,
+        "traceOverhead": traceSeconds / plainSeconds - 1,
+        "parsePeakBytes": parsePeak,
+        "stepPeakBytes": stepPeak,
+        }
+# end benchmarkFile()
+
+def benchmarkGenerated(configurations, nrSteps = 100, repeat = 3, engineName = "python"):
+    """Runs all measurements on generated P systems
+
+    :configurations: list of (name, dictionary of pep_generator.generateModel() arguments) tuples
+    :returns: list of result dictionaries"""
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="pep_benchmark_") as directory:
+        for name, arguments in configurations:
+            filename = os.path.join(directory, "%s.pep" % name)
+            with open(filename, "w") as modelFile:
+                modelFile.write(pep_generator.generateModel(**arguments))
+            result = benchmarkFile(filename, nrSteps, repeat, engineName, name)
+            result["generator"] = arguments
+            results.append(result)
+
+    return results
+# end benchmarkGenerated()
+
+def defaultConfigurations(nrMembranes):
+    """Generator configurations of the standard benchmark suite
+
+    :nrMembranes: number of membranes of each P system
+    :returns: list of (name, dictionary of pep_generator.generateModel() arguments) tuples"""
+
+    return [
+        ("arith_%d" % nrMembranes, dict(nrMembranes = nrMembranes, depth = 2, expressionSize = 3, functions = ['arith'])),
+        ("mixed_%d" % nrMembranes, dict(nrMembranes = nrMembranes, depth = 4, nrPrograms = 2, expressionSize = 4,
+            functions = ['arith', 'trig', 'minmax', 'compare'])),
+        ("enzymatic_%d" % nrMembranes, dict(nrMembranes = nrMembranes, depth = 2, nrPrograms = 3, expressionSize = 3,
+            functions = ['arith', 'compare'], enzymeRatio = 1.0, fanOut = 3)),
+        ]
+# end defaultConfigurations()
+
+def compareResults(results, baseline, tolerance):
+    """Compares the throughput of a benchmark run against a previous run
+
+    :results: list of result dictionaries
+    :baseline: list of result dictionaries of the previous run
+    :tolerance: accepted relative slowdown (e.g. 0.1 for 10%)
+    :returns: list of (name, metric, baseline value, value) tuples for each regression"""
+
+    regressions = []
+    baselineByName = dict([((result["name"], result["engine"]), result) for result in baseline])
+    for result in results:
+        previous = baselineByName.get((result["name"], result["engine"]))
+        if (previous == None):
+            continue
+        # higher is better for stepsPerSecond, lower is better for parseSeconds
+        if (result["stepsPerSecond"] < previous["stepsPerSecond"] * (1 - tolerance)):
+            regressions.append((result["name"], "stepsPerSecond", previous["stepsPerSecond"], result["stepsPerSecond"]))
+        if (result["parseSeconds"] > previous["parseSeconds"] * (1 + tolerance)):
+            regressions.append((result["name"], "parseSeconds", previous["parseSeconds"], result["parseSeconds"]))
+
+    return regressions
+# end compareResults()
+
+##########################################################################
+#   MAIN
+
+if (__name__ == "__main__"):
+    logging.basicConfig(format='%(levelname)s:%(message)s', level = logging.WARNING)
+    if ('-v' in sys.argv):
+        logger.setLevel(logging.INFO)
+
+    if ('-h' in sys.argv or '--help' in sys.argv):
+        print("Usage: pep_benchmark.py [PEP_INPUT_FILE ...] [options]")
+        print("    without input files, the standard suite of generated P systems is benchmarked")
+        print("    [options] can be:")
+        print("        * -n NR:           simulation steps of each measurement (default 100)")
+        print("        * --repeat R:      repetitions of each timing; the fastest one is reported (default 3)")
+        print("        * --membranes N:   number of membranes of the generated P systems (default 1000)")
+        print("        * --engine NAME:   simulation engine: python (default), numpy, sparse or codegen")
+        print("        * -o FILE:         write the JSON results into FILE instead of stdout")
+        print("        * --compare FILE:  compare against the JSON results of a previous run; exits with 2 if slower")
+        print("        * --tolerance T:   accepted relative slowdown for --compare (default 0.1)")
+        print("        * -v:              print progress messages")
+        exit(1)
+
+    try:
+        nrSteps = pep.getOptionValue(sys.argv, '-n', int, 100)
+        repeat = pep.getOptionValue(sys.argv, '--repeat', int, 3)
+        nrMembranes = pep.getOptionValue(sys.argv, '--membranes', int, 1000)
+        engineName = pep.getOptionValue(sys.argv, '--engine', str, "python")
+        outputFileName = pep.getOptionValue(sys.argv, '-o')
+        baselineFileName = pep.getOptionValue(sys.argv, '--compare')
+        tolerance = pep.getOptionValue(sys.argv, '--tolerance', float, 0.1)
+    except ValueError as e:
+        logging.error(str(e))
+        exit(1)
+    if (engineName not in pep.engineNames):
+        logging.error("Unknown simulation engine '%s'; expected %s or %s" % (engineName, ", ".join(pep.engineNames[:-1]), pep.engineNames[-1]))
+        exit(1)
+
+    # positional arguments are input files
+    optionsWithValues = ('-n', '--repeat', '--membranes', '--engine', '-o', '--compare', '--tolerance')
+    inputFiles = [argument for i, argument in enumerate(sys.argv[1:], 1)
+            if (not argument.startswith('-') and sys.argv[i - 1] not in optionsWithValues)]
+
+    if (len(inputFiles) > 0):
+        results = [benchmarkFile(filename, nrSteps, repeat, engineName) for filename in inputFiles]
+    else:
+        results = benchmarkGenerated(defaultConfigurations(nrMembranes), nrSteps, repeat, engineName)
+
+    report = {
+        "version": pep.__version__,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+        }
+
+    if (outputFileName == None):
+        print(json.dumps(report, indent = 2))
+    else:
+        with open(outputFileName, "w") as outputFile:
+            json.dump(report, outputFile, indent = 2)
+
+    if (baselineFileName != None):
+        with open(baselineFileName) as baselineFile:
+            regressions = compareResults(results, json.load(baselineFile)["results"], tolerance)
+        for name, metric, previous, current in regressions:
+            logger.error("%s: %s regressed from %g to %g", name, metric, previous, current)
+        if (len(regressions) > 0):
+            exit(2)
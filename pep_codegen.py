@@ -0,0 +1,331 @@
+#!/usr/bin/python3
+
+"""Simulation engine that generates one specialized Python function for a numerical P system
+
+The structure of a simulation step (which membranes have programs, how the programs are chosen, which Pobjects are
+consumed and where the produced values are distributed) is fixed for a given P system, so instead of interpreting it at
+each step, the engine writes the source of a run(values, nrSteps, randint, progress) function that contains the whole simulation loop:
+    * the values of the Pobjects are held in local variables (v0, v1, ...) for the duration of the loop and are written back
+      even if a step raises an error; progress[0] receives the number of completed steps
+    * production, reset and distribution are unrolled for each membrane, in the order of NumericalPsystem.H
+    * production functions are written as Python expressions and distribution coefficients as constants
+The source is compiled once (and cached for P systems with the same source) and can be inspected (CodegenEngine.source).
+It is built from the index based representation returned by NumericalPsystem.flatten()"""
+
+import hashlib # for the keys of the compiled function cache
+import linecache # for showing the generated source in tracebacks
+import logging # for logging functions
+import math # for non-finite constants
+
+from pep import FlatItemType, OperatorType, dictOperatorFunctions
+
+##########################################################################
+# auxiliary definitions
+
+# binary operators written as Python operators; their results are identical to those of dictOperatorFunctions
+inlineBinaryOperators = {
+        OperatorType.add: "+",
+        OperatorType.subtract: "-",
+        OperatorType.multiply: "*",
+        OperatorType.divide: "/",
+        OperatorType.power: "**",
+        }
+
+# comparisons return 0 or 1 (as int), as in dictOperatorFunctions
+inlineComparisons = {
+        OperatorType.eq: "==",
+        OperatorType.ne: "!=",
+        OperatorType.lt: "<",
+        OperatorType.le: "<=",
+        OperatorType.gt: ">",
+        OperatorType.ge: ">=",
+        }
+
+# the remaining operators are called by name; abs is named fabs because the builtin abs() does not always return a float
+operatorNames = dict([(operatorType, "fabs" if operatorType == OperatorType.abs else operatorType.name)
+        for operatorType in dictOperatorFunctions
+        if (operatorType not in inlineBinaryOperators and operatorType not in inlineComparisons
+            and operatorType not in (OperatorType.negate, OperatorType.min, OperatorType.max))])
+
+# expressions nested deeper than this are split using temporary variables (the Python parser limits the nesting depth)
+maxExpressionDepth = 50
+
+# map between the sha256 digest of a generated source and the compiled run() function
+compiledFunctions = {}
+
+##########################################################################
+# class definitions
+
+class CodegenEngine():
+
+    """Simulation engine that runs a generated Python function (see generateSource())
+    It produces the same results as NumericalPsystem.runSimulationStep(), including the types (int / float) of the values:
+        * the random choice of programs uses NumericalPsystem.rng in the same order as NumericalPsystem.runSimulationStep()
+        * the activation condition of enzymatic programs is checked at each step, using the same comparison
+
+    :ivar NumericalPsystem system: the simulated P system
+    :ivar FlatModel model: index based representation of the P system
+    :ivar list values: values of all Pobjects (variables followed by enzymes)
+    :ivar str source: the generated Python source
+    :ivar function runFunction: the compiled run(values, nrSteps, randint, progress) function
+    :ivar int completedSteps: number of simulation steps completed by the last call of run()
+    """
+
+    def __init__(self, system, model = None):
+        """Generates and compiles the simulation function
+
+        :system: NumericalPsystem object whose values are used as the initial state
+        :model: FlatModel of the system, if it was already constructed"""
+
+        self.system = system
+        self.model = system.flatten() if model == None else model
+        self.values = list(self.model.initialValues)
+        self.completedSteps = 0
+        # the generated function stores the number of completed steps in progress[0]
+        self.progress = [0]
+
+        self.source = generateSource(self.model)
+        self.runFunction = compileSource(self.source)
+
+        logging.info("Codegen engine built for %d Pobjects, %d programs (%d lines of generated code)",
+                len(self.values), len(self.model.programItems), self.source.count("\n"))
+
+    def runSimulationStep(self):
+        """Runs 1 simulation step, equivalent to NumericalPsystem.runSimulationStep()"""
+
+        self.runFunction(self.values, 1, self.system.rng.randint, self.progress)
+    # end runSimulationStep()
+
+    def run(self, nrSteps):
+        """Runs several simulation steps in the generated loop
+        The number of completed steps is stored in self.completedSteps, also if a step raises an error
+
+        :nrSteps: number of simulation steps"""
+
+        try:
+            self.runFunction(self.values, nrSteps, self.system.rng.randint, self.progress)
+        finally:
+            self.completedSteps = self.progress[0]
+    # end run()
+
+    def getValues(self):
+        """Returns the values of all Pobjects (variables followed by enzymes)
+
+        :returns: list of values"""
+
+        return list(self.values)
+    # end getValues()
+
+    def loadFromSystem(self):
+        """Copies the current values of the Pobjects of the P system into the engine"""
+
+        self.values[:] = self.system.getValues()
+    # end loadFromSystem()
+
+    def syncToSystem(self):
+        """Copies the values from the engine into the Pobjects of the P system"""
+
+        self.system.setValues(self.values)
+    # end syncToSystem()
+
+    def writeSource(self, filename):
+        """Writes the generated source into a file (for debugging)
+
+        :filename: path of the output file"""
+
+        with open(filename, "w") as sourceFile:
+            sourceFile.write(self.source)
+    # end writeSource()
+# end class CodegenEngine
+
+##########################################################################
+# auxiliary functions
+
+def constantSource(value):
+    """Returns the Python source of a numeric constant
+
+    :value: int or float
+    :returns: string"""
+
+    if (type(value) == float and not math.isfinite(value)):
+        return "float('%r')" % value
+    if (value < 0 or (type(value) == float and math.copysign(1, value) < 0)):
+        return "(%r)" % value
+    return repr(value)
+# end constantSource()
+
+def expressionSource(items, lines, indent, temporaries):
+    """Translates the postfix form of a production function into a Python expression
+
+    :items: postfix form as (FlatItemType, value) tuples (see FlatModel.programItems)
+    :lines: list of source lines, where the assignments of temporary variables are appended
+    :indent: indentation of the temporary assignments
+    :temporaries: list whose length is the number of temporary variables used so far (shared by the whole function)
+    :returns: string, or None if the postfix form is malformed"""
+
+    # stack of (source, nesting depth) tuples
+    stack = []
+    for itemType, value in items:
+        if (itemType == FlatItemType.constant):
+            stack.append((constantSource(value), 0))
+            continue
+        if (itemType == FlatItemType.variable):
+            stack.append(("v%d" % value, 0))
+            continue
+
+        operatorType = OperatorType(value)
+        nrOperands = dictOperatorFunctions[operatorType][0]
+        if (len(stack) < nrOperands):
+            return None
+        operands = stack[-nrOperands:]
+        del stack[-nrOperands:]
+        depth = max([operand[1] for operand in operands]) + 1
+        operands = [operand[0] for operand in operands]
+
+        if (operatorType in inlineBinaryOperators):
+            source = "(%s %s %s)" % (operands[0], inlineBinaryOperators[operatorType], operands[1])
+        elif (operatorType in inlineComparisons):
+            source = "(1 if %s %s %s else 0)" % (operands[0], inlineComparisons[operatorType], operands[1])
+        elif (operatorType == OperatorType.negate):
+            source = "(-%s)" % operands[0]
+        elif (operatorType in (OperatorType.min, OperatorType.max)):
+            # same operand order as dictOperatorFunctions, so that ties select the same operand
+            source = "%s(%s, %s)" % (operatorType.name, operands[1], operands[0])
+        else:
+            source = "%s(%s)" % (operatorNames[operatorType], ", ".join(operands))
+
+        if (depth > maxExpressionDepth):
+            lines.append("%st%d = %s" % (indent, len(temporaries), source))
+            source = "t%d" % len(temporaries)
+            temporaries.append(source)
+            depth = 0
+        stack.append((source, depth))
+
+    if (len(stack) != 1):
+        return None
+    return stack[0][0]
+# end expressionSource()
+
+def generateSource(model):
+    """Generates the source of a run(values, nrSteps, randint, progress) function that runs nrSteps simulation steps of a P system,
+    in the same way as NumericalPsystem.runSimulationStep()
+
+    :model: FlatModel of the P system
+    :returns: string"""
+
+    header = []
+    production = []
+    reset = []
+    distribution = []
+    temporaries = []
+    usedIndexes = set()
+    writtenIndexes = set()
+
+    def addProgram(prgNr, indent):
+        """Adds the production, reset and distribution code of one program, under the given indentation"""
+
+        expression = expressionSource(model.programItems[prgNr], production, indent, temporaries)
+        if (expression == None):
+            membraneNr = model.programMembranes[prgNr]
+            raise RuntimeError("The production function of program %d of membrane %s cannot be compiled" %
+                    (model.membranePrograms[membraneNr].index(prgNr), model.membraneNames[membraneNr]))
+        production.append("%sp%d = %s" % (indent, prgNr, expression))
+
+        for index in model.programVariables[prgNr]:
+            reset.append("%sv%d = 0" % (indent, index))
+        usedIndexes.update(model.programVariables[prgNr])
+        writtenIndexes.update(model.programVariables[prgNr])
+
+        for index, proportion, proportionTotal in model.programDistribution[prgNr]:
+            distribution.append("%sv%d += %r * p%d" % (indent, index, proportion / proportionTotal, prgNr))
+            usedIndexes.add(index)
+            writtenIndexes.add(index)
+    # end addProgram()
+
+    indent = " " * 12
+    for membraneNr, programs in enumerate(model.membranePrograms):
+        if (len(programs) < 1):
+            continue
+        comment = "%s# membrane %s" % (indent, model.membraneNames[membraneNr])
+        for block in (production, reset, distribution):
+            block.append(comment)
+
+        # enzymatic membranes execute all programs whose enzyme is greater than min(production function variables)
+        if (model.membraneEnzymatic[membraneNr]):
+            for prgNr in programs:
+                variables = model.programVariables[prgNr]
+                if (len(variables) == 0):
+                    addProgram(prgNr, indent)
+                    continue
+                enzyme = model.programEnzymes[prgNr]
+                usedIndexes.add(enzyme)
+                if (len(variables) == 1):
+                    production.append("%sa%d = v%d > v%d" % (indent, prgNr, enzyme, variables[0]))
+                else:
+                    production.append("%sa%d = v%d > min(%s)" % (indent, prgNr, enzyme, ", ".join(["v%d" % index for index in variables])))
+                for block in (production, reset, distribution):
+                    block.append("%sif (a%d):" % (indent, prgNr))
+                addProgram(prgNr, indent + " " * 4)
+                # an if statement needs at least one statement
+                for block in (reset, distribution):
+                    if (block[-1].endswith(":")):
+                        block.append("%s    pass" % indent)
+
+        # the other membranes execute one program, chosen randomly if there are several
+        elif (len(programs) == 1):
+            addProgram(programs[0], indent)
+        else:
+            production.append("%sc%d = randint(0, %d)" % (indent, membraneNr, len(programs) - 1))
+            for programNr, prgNr in enumerate(programs):
+                keyword = "if" if programNr == 0 else "elif"
+                for block in (production, reset, distribution):
+                    block.append("%s%s (c%d == %d):" % (indent, keyword, membraneNr, programNr))
+                addProgram(prgNr, indent + " " * 4)
+                for block in (reset, distribution):
+                    if (block[-1].endswith(":")):
+                        block.append("%s    pass" % indent)
+
+    header.append("def run(values, nrSteps, randint, progress):")
+    header.append("    # generated for %d Pobjects and %d programs" % (len(model.names), len(model.programItems)))
+    for index in sorted(usedIndexes):
+        header.append("    v%d = values[%d] # %s" % (index, index, model.names[index]))
+    # the values are written back even if a step raises an error, so that they hold the state of the last completed step
+    header.append("    stepNr = 0")
+    header.append("    try:")
+    header.append("        for stepNr in range(nrSteps):")
+    header.append("            # production phase")
+    lines = header + production
+    lines.append("            # reset phase")
+    lines.extend(reset)
+    lines.append("            # distribution phase")
+    lines.extend(distribution)
+    # the loop needs at least one statement
+    lines.append("            pass")
+    lines.append("        stepNr = nrSteps")
+    lines.append("    finally:")
+    # stepNr is the step that raised the error, which is also the number of completed steps
+    lines.append("        progress[0] = stepNr")
+    for index in sorted(writtenIndexes):
+        lines.append("        values[%d] = v%d" % (index, index))
+    lines.append("# end run()")
+
+    return "\n".join(lines) + "\n"
+# end generateSource()
+
+def compileSource(source):
+    """Compiles a generated source (once for each distinct source) and returns its run() function
+    The source is registered with linecache, so that tracebacks show the generated lines
+
+    :source: string returned by generateSource()
+    :returns: function"""
+
+    key = hashlib.sha256(source.encode("utf-8")).hexdigest()
+    if (key not in compiledFunctions):
+        filename = "<pep_codegen %s>" % key[:16]
+        namespace = dict([(name, dictOperatorFunctions[operatorType][1]) for operatorType, name in operatorNames.items()])
+        exec(compile(source, filename, "exec"), namespace)
+        linecache.cache[filename] = (len(source), None, source.splitlines(True), filename)
+        compiledFunctions[key] = namespace["run"]
+
+    return compiledFunctions[key]
+# end compileSource()
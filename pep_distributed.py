@@ -0,0 +1,755 @@
+#!/usr/bin/python3
+
+"""Partitioned (bulk-synchronous) simulation of numerical P systems (see pep.py) in several worker processes
+
+The membranes are split into partitions (see partitionMembranes()), so that few distribution rules and production functions
+connect membranes of different partitions. Each worker process simulates one partition and owns the variables and enzymes
+declared in its membranes. A simulation step consists of:
+
+    * production: each worker runs the programs of its membranes, reading its own Pobjects and local copies (ghosts) of remote ones
+    * exchange: the distribution contributions to remote Pobjects and the remote Pobjects consumed by local programs
+      are sent to their owners (through the coordinator, which also acts as the barrier of the step)
+    * reset and distribution: each worker resets its consumed Pobjects and adds all contributions, in the same order
+      as NumericalPsystem.runSimulationStep(), so that deterministic P systems produce identical results
+    * ghost update: the new values of the Pobjects read by programs of other partitions are sent to these partitions
+      (skipped if no production function reads a remote Pobject)
+
+Each partition chooses its stochastic programs using its own random number generator (seeded with a seed derived from the base seed),
+so stochastic P systems do not follow the same trajectory as the python engine for the same seed.
+
+Workers are started as local processes or, on other machines, using pep_distributed.py --worker ADDRESS --authkey KEY.
+Messages are exchanged using multiprocessing.connection (pickled data, authenticated with the key)."""
+
+import heapq # for merging the ordered distribution contributions
+import logging # for reporting
+import multiprocessing # for local worker processes
+import multiprocessing.connection # for the coordinator - worker connections
+import os # for the authentication key and temporary socket files
+import pickle # for messages
+import random # for seeding the simulations
+import shutil # for removing the temporary socket directory
+import sys # for argv
+import tempfile # for the temporary socket directory
+import time # for durations
+
+import pep # the simulator
+import pep_replicas # for deriving the seeds of the partitions
+
+##########################################################################
+# class definitions
+
+class Partitioning():
+
+    """Assignment of membranes to partitions
+
+    :ivar int nrPartitions: number of partitions
+    :ivar list(int) membranePartitions: partition of each membrane, in the order of NumericalPsystem.H
+    :ivar list(int) loads: sum of the membrane weights of each partition (see buildCommunicationGraph())
+    :ivar int cutEdges: weight of the communication edges between membranes of different partitions
+    :ivar int totalEdges: weight of all communication edges between different membranes
+    """
+
+    def __init__(self, nrPartitions, membranePartitions, loads, cutEdges, totalEdges):
+        self.nrPartitions = nrPartitions
+        self.membranePartitions = membranePartitions
+        self.loads = loads
+        self.cutEdges = cutEdges
+        self.totalEdges = totalEdges
+# end class Partitioning
+
+class PartitionWorker():
+
+    """Simulates the membranes of one partition (runs in a worker process)
+
+    :ivar NumericalPsystem system: the complete P system (only the membranes of this partition are simulated)
+    :ivar int partitionNr: number of this partition
+    :ivar list(Pobject) pobjects: all Pobjects (variables followed by enzymes)
+    :ivar list(Membrane) membranes: membranes of this partition that have programs, in the order of NumericalPsystem.H
+    :ivar list(int) ownedIndexes: indexes of the Pobjects declared in the membranes of this partition
+    :ivar list(Pobject) ownedPobjects: Pobjects declared in the membranes of this partition
+    :ivar dict programRules: map between (membrane index, program number): list of (rank, Pobject index, coefficient, owner partition)
+    :ivar dict remoteConsumable: map between owner partition: list of (Pobject index, Pobject) of remote Pobjects used by local programs
+    :ivar dict ghostReads: map between owner partition: list of indexes of the remote Pobjects read by local programs
+    :ivar dict ghostReaders: map between reader partition: list of indexes of the local Pobjects read by its programs
+    :ivar Random rng: random number generator of this partition
+    """
+
+    def __init__(self, system, partitionNr, membranePartitions, seed):
+        """Prepares the simulation of one partition
+
+        :system: NumericalPsystem object
+        :partitionNr: number of this partition
+        :membranePartitions: partition of each membrane, in the order of NumericalPsystem.H
+        :seed: seed of the random number generator of this partition"""
+
+        self.system = system
+        self.partitionNr = partitionNr
+        self.rng = random.Random(seed)
+        self.pobjects = system.variables + system.enzymes
+        pobjectIndexes = dict([(id(pobject), index) for index, pobject in enumerate(self.pobjects)])
+        owners = [membranePartitions[membraneNr] for membraneNr in pobjectOwners(system)]
+
+        self.membranes = []
+        self.programRules = {}
+        self.remoteConsumable = {}
+        rank = 0
+        for membraneNr, membraneName in enumerate(system.H):
+            membrane = system.membranes[membraneName]
+            local = (membranePartitions[membraneNr] == partitionNr)
+            if (local and len(membrane.programs) > 0):
+                self.membranes.append((membraneNr, membrane))
+            for prgNr, program in enumerate(membrane.programs):
+                rules = []
+                for distribRule in program.distribFunction:
+                    index = pobjectIndexes[id(distribRule.variable)]
+                    rules.append((rank, index, distribRule.proportion / program.distribFunction.proportionTotal, owners[index]))
+                    rank += 1
+                if (not local):
+                    continue
+                self.programRules[(membraneNr, prgNr)] = rules
+                for pobject in program.activationObjects:
+                    index = pobjectIndexes[id(pobject)]
+                    if (owners[index] != partitionNr and (index, pobject) not in self.remoteConsumable.setdefault(owners[index], [])):
+                        self.remoteConsumable[owners[index]].append((index, pobject))
+
+        self.ownedIndexes = [index for index in range(len(self.pobjects)) if owners[index] == partitionNr]
+        self.ownedPobjects = [self.pobjects[index] for index in self.ownedIndexes]
+
+        reads = remoteReads(system, membranePartitions)
+        self.ghostReads = dict([(owner, indexes) for (reader, owner), indexes in reads.items() if reader == partitionNr])
+        self.ghostReaders = dict([(reader, indexes) for (reader, owner), indexes in reads.items() if owner == partitionNr])
+
+    def runProductionPhase(self):
+        """Runs the production phase of the membranes of this partition (as in NumericalPsystem.runSimulationStep())"""
+
+        randint = self.rng.randint
+        for membraneNr, membrane in self.membranes:
+            if (len(membrane.enzymes) == 0):
+                membrane.chosenProgramNr = 0 if len(membrane.programs) == 1 else randint(0, len(membrane.programs) - 1)
+                membrane.newValue = membrane.programs[membrane.chosenProgramNr].prodFunction.compiledFunction()
+            else:
+                if (membrane.activationDirty):
+                    membrane.chosenProgramNr = [prgNr for prgNr, enzyme, pobjects in membrane.activationChecks
+                            if (len(pobjects) == 0 or enzyme.value > min([pobject.value for pobject in pobjects]))]
+                    membrane.activationDirty = False
+                membrane.newValue = [membrane.programs[prgNr].prodFunction.compiledFunction() for prgNr in membrane.chosenProgramNr]
+    # end runProductionPhase()
+
+    def collectMessages(self):
+        """Collects the consumed remote Pobjects and the distribution contributions of the executed programs
+
+        :returns: map between partition: (list of consumed Pobject indexes, list of (rank, Pobject index, amount) contributions)
+            (the contributions to local Pobjects are stored under the number of this partition)"""
+
+        messages = {self.partitionNr: ([], [])}
+        for owner, pobjects in self.remoteConsumable.items():
+            consumed = messages.setdefault(owner, ([], []))[0]
+            for index, pobject in pobjects:
+                if (pobject.wasConsumed):
+                    consumed.append(index)
+                    pobject.wasConsumed = False
+
+        for membraneNr, membrane in self.membranes:
+            if (type(membrane.chosenProgramNr) == int):
+                executed = ((membrane.chosenProgramNr, membrane.newValue),)
+            else:
+                executed = zip(membrane.chosenProgramNr, membrane.newValue)
+            for prgNr, newValue in executed:
+                for rank, index, coefficient, owner in self.programRules[(membraneNr, prgNr)]:
+                    messages.setdefault(owner, ([], []))[1].append((rank, index, coefficient * newValue))
+
+        return messages
+    # end collectMessages()
+
+    def applyMessages(self, localContributions, received):
+        """Runs the reset and distribution phases for the Pobjects of this partition
+
+        :localContributions: contributions of the local programs to local Pobjects (see collectMessages())
+        :received: list of (consumed Pobject indexes, contributions) received from the other partitions"""
+
+        pobjects = self.pobjects
+        consumed = [pobject for pobject in self.ownedPobjects if pobject.wasConsumed]
+        for indexes, contributions in received:
+            consumed.extend([pobjects[index] for index in indexes])
+
+        for pobject in consumed:
+            if (pobject.value != 0):
+                for watcher in pobject.watchers:
+                    watcher.activationDirty = True
+            pobject.value = 0
+            pobject.wasConsumed = False
+
+        # contributions are added in the order of their rank, which is the order of NumericalPsystem.runSimulationStep()
+        for rank, index, amount in heapq.merge(localContributions, *[contributions for indexes, contributions in received]):
+            pobject = pobjects[index]
+            pobject.value += amount
+            if (amount != 0):
+                for watcher in pobject.watchers:
+                    watcher.activationDirty = True
+    # end applyMessages()
+
+    def collectGhostValues(self):
+        """:returns: map between reader partition: list of the values of the local Pobjects read by its programs"""
+
+        return dict([(reader, [self.pobjects[index].value for index in indexes]) for reader, indexes in self.ghostReaders.items()])
+    # end collectGhostValues()
+
+    def applyGhostValues(self, received):
+        """Updates the local copies of remote Pobjects
+
+        :received: map between owner partition: list of values (in the order of ghostReads[owner])"""
+
+        for owner, values in received.items():
+            for index, value in zip(self.ghostReads[owner], values):
+                pobject = self.pobjects[index]
+                if (pobject.value != value):
+                    for watcher in pobject.watchers:
+                        watcher.activationDirty = True
+                pobject.value = value
+    # end applyGhostValues()
+
+    def getOwnedValues(self):
+        """:returns: list of (Pobject index, value) tuples of the Pobjects of this partition"""
+
+        return [(index, self.pobjects[index].value) for index in self.ownedIndexes]
+    # end getOwnedValues()
+# end class PartitionWorker
+
+class DistributedSimulation():
+
+    """Coordinator of a partitioned simulation: starts or accepts the workers, routes their messages and acts as the step barrier
+
+    :ivar NumericalPsystem system: the P system (parsed by the coordinator, for partitioning and for the final state)
+    :ivar Partitioning partitioning: assignment of membranes to partitions
+    :ivar list(Connection) connections: connection to the worker of each partition
+    :ivar list(Process) processes: local worker processes
+    :ivar bool ghostExchange: True if some production functions read Pobjects of other partitions
+    :ivar int stepNr: number of simulation steps that were run
+    :ivar list(dict) statistics: communication statistics of each step (see run())
+    """
+
+    def __init__(self, description, nrPartitions = 2, seed = None, listenAddress = None, nrRemoteWorkers = 0, authkey = None):
+        """Parses and partitions the P system and starts the workers
+
+        :description: contents of a .pep file
+        :nrPartitions: number of partitions (and workers)
+        :seed: base seed of the random number generators of the partitions (None for a random seed)
+        :listenAddress: unix:PATH or tcp:HOST:PORT address where the workers connect (a temporary Unix socket by default)
+        :nrRemoteWorkers: number of workers started separately (see runWorker()); the others are started as local processes
+        :authkey: authentication key of the connections (bytes; required for remote workers)"""
+
+        if (nrRemoteWorkers > 0 and authkey == None):
+            raise RuntimeError("Remote workers require an authentication key")
+        if (nrRemoteWorkers > nrPartitions):
+            raise RuntimeError("There are more remote workers than partitions")
+
+        self.system = pep.readInputString(description)
+        self.partitioning = partitionMembranes(self.system, nrPartitions)
+        nrPartitions = self.partitioning.nrPartitions
+        self.ghostExchange = len(remoteReads(self.system, self.partitioning.membranePartitions)) > 0
+        self.seed = seed if seed != None else random.randrange(2**32)
+        self.stepNr = 0
+        self.statistics = []
+        self.connections = []
+        self.processes = []
+
+        authkey = authkey if authkey != None else os.urandom(32)
+        self.temporaryDirectory = None
+        if (listenAddress == None):
+            self.temporaryDirectory = tempfile.mkdtemp(prefix="pep_distributed_")
+            listenAddress = "unix:" + os.path.join(self.temporaryDirectory, "coordinator.sock")
+        address, family = parseAddress(listenAddress)
+
+        try:
+            with multiprocessing.connection.Listener(address, family, authkey = authkey) as listener:
+                try:
+                    context = multiprocessing.get_context("fork")
+                except ValueError:
+                    context = multiprocessing.get_context("spawn")
+                for workerNr in range(nrPartitions - nrRemoteWorkers):
+                    # forked workers inherit the parsed P system, the others parse the description
+                    process = context.Process(target = runWorker, daemon = True,
+                            args = (listenAddress, authkey, self.system if context.get_start_method() == "fork" else None))
+                    process.start()
+                    self.processes.append(process)
+
+                logging.info("Waiting for %d workers on %s", nrPartitions, listenAddress)
+                for partitionNr in range(nrPartitions):
+                    connection = listener.accept()
+                    self.connections.append(connection)
+                    hasSystem = self.receive(connection)[0][1]
+                    sendMessage(connection, ("setup", None if hasSystem else description, partitionNr, self.partitioning.membranePartitions,
+                        pep_replicas.deriveReplicaSeed(self.seed, partitionNr), self.ghostExchange))
+
+            for connection in self.connections:
+                self.receive(connection)
+        except BaseException:
+            self.close()
+            raise
+
+    def receive(self, connection):
+        """Receives a message from a worker
+
+        :connection: Connection of the worker
+        :returns: (message, size in bytes) tuple"""
+
+        data = connection.recv_bytes()
+        message = pickle.loads(data)
+        if (message[0] == "error"):
+            raise RuntimeError("Worker error: %s" % message[1])
+        return message, len(data)
+    # end receive()
+
+    def receiveAll(self):
+        """Receives one message from each worker (the barrier of a phase)
+
+        :returns: (list of messages in the order of partitions, total size in bytes, seconds between the first and the last message) tuple"""
+
+        messages = [None] * len(self.connections)
+        pending = dict([(connection, partitionNr) for partitionNr, connection in enumerate(self.connections)])
+        totalSize = 0
+        firstTime = None
+        while (len(pending) > 0):
+            for connection in multiprocessing.connection.wait(list(pending)):
+                messages[pending.pop(connection)], size = self.receive(connection)
+                totalSize += size
+                if (firstTime == None):
+                    firstTime = time.perf_counter()
+
+        return messages, totalSize, time.perf_counter() - firstTime
+    # end receiveAll()
+
+    def run(self, nrSteps):
+        """Runs several simulation steps
+        The statistics of each step are appended to self.statistics, as dictionaries with the keys:
+        seconds, bytes (received from the workers), contributions (sent to remote Pobjects), consumed (remote Pobjects),
+        ghostValues and waitSeconds (between the first and the last worker reaching the barrier)
+
+        :nrSteps: number of simulation steps"""
+
+        for connection in self.connections:
+            sendMessage(connection, ("run", nrSteps))
+
+        nrPartitions = len(self.connections)
+        for stepNr in range(nrSteps):
+            startTime = time.perf_counter()
+
+            messages, totalSize, waitSeconds = self.receiveAll()
+            outgoing = [[] for partitionNr in range(nrPartitions)]
+            contributions = consumed = 0
+            for source, message in enumerate(messages):
+                for destination, (indexes, values) in message[1].items():
+                    outgoing[destination].append((indexes, values))
+                    contributions += len(values)
+                    consumed += len(indexes)
+            for connection, received in zip(self.connections, outgoing):
+                totalSize += sendMessage(connection, ("exchange", received))
+
+            ghostValues = 0
+            if (self.ghostExchange):
+                messages, size, seconds = self.receiveAll()
+                totalSize += size
+                waitSeconds += seconds
+                outgoing = [{} for partitionNr in range(nrPartitions)]
+                for source, message in enumerate(messages):
+                    for reader, values in message[1].items():
+                        outgoing[reader][source] = values
+                        ghostValues += len(values)
+                for connection, received in zip(self.connections, outgoing):
+                    totalSize += sendMessage(connection, ("ghosts", received))
+
+            self.stepNr += 1
+            self.statistics.append({"seconds": time.perf_counter() - startTime, "bytes": totalSize, "contributions": contributions,
+                "consumed": consumed, "ghostValues": ghostValues, "waitSeconds": waitSeconds})
+
+        # the workers confirm the end of the last step
+        self.receiveAll()
+    # end run()
+
+    def getValues(self):
+        """Returns the values of all Pobjects (variables followed by enzymes), gathered from the workers
+
+        :returns: list of values"""
+
+        for connection in self.connections:
+            sendMessage(connection, ("values",))
+        values = self.system.getValues()
+        for message in self.receiveAll()[0]:
+            for index, value in message[1]:
+                values[index] = value
+
+        return values
+    # end getValues()
+
+    def syncToSystem(self):
+        """Copies the values gathered from the workers into the Pobjects of the P system (e.g. before NumericalPsystem.print())"""
+
+        self.system.setValues(self.getValues())
+    # end syncToSystem()
+
+    def summary(self):
+        """Summarizes the partitioning and the per-step communication statistics
+
+        :returns: dictionary"""
+
+        nrSteps = max(1, len(self.statistics))
+        result = {
+            "partitions": self.partitioning.nrPartitions,
+            "loads": self.partitioning.loads,
+            "cutEdges": self.partitioning.cutEdges,
+            "totalEdges": self.partitioning.totalEdges,
+            "steps": len(self.statistics),
+            "ghostExchange": self.ghostExchange,
+            }
+        for key in ("seconds", "bytes", "contributions", "consumed", "ghostValues", "waitSeconds"):
+            result[key + "PerStep"] = sum([statistics[key] for statistics in self.statistics]) / nrSteps
+
+        return result
+    # end summary()
+
+    def close(self):
+        """Stops the workers"""
+
+        for connection in self.connections:
+            try:
+                sendMessage(connection, ("stop",))
+            except OSError:
+                pass
+            connection.close()
+        self.connections = []
+        for process in self.processes:
+            process.join(5)
+            if (process.is_alive()):
+                process.terminate()
+        self.processes = []
+        if (self.temporaryDirectory != None):
+            shutil.rmtree(self.temporaryDirectory, ignore_errors = True)
+            self.temporaryDirectory = None
+    # end close()
+# end class DistributedSimulation
+
+##########################################################################
+# auxiliary functions
+
+def parseAddress(text):
+    """Converts a unix:PATH or tcp:HOST:PORT address into a multiprocessing.connection address
+
+    :text: address
+    :returns: (address, family) tuple"""
+
+    kind, separator, rest = text.partition(':')
+    if (kind == "unix"):
+        return rest, "AF_UNIX"
+    if (kind == "tcp"):
+        host, separator, port = rest.rpartition(':')
+        try:
+            return (host if host != "" else "127.0.0.1", int(port)), "AF_INET"
+        except ValueError:
+            pass
+    raise RuntimeError("Invalid address '%s'; expected unix:PATH or tcp:HOST:PORT" % text)
+# end parseAddress()
+
+def sendMessage(connection, message):
+    """Sends a pickled message
+
+    :connection: multiprocessing.connection.Connection
+    :message: picklable object
+    :returns: size of the message in bytes"""
+
+    data = pickle.dumps(message, pickle.HIGHEST_PROTOCOL)
+    connection.send_bytes(data)
+    return len(data)
+# end sendMessage()
+
+def pobjectOwners(system):
+    """Determines the membrane that owns (declares) each Pobject
+
+    :system: NumericalPsystem object
+    :returns: list of membrane indexes (in the order of NumericalPsystem.H), one for each Pobject (variables followed by enzymes)"""
+
+    pobjects = system.variables + system.enzymes
+    pobjectIndexes = dict([(id(pobject), index) for index, pobject in enumerate(pobjects)])
+    # Pobjects that are not declared in a membrane belong to the first one
+    owners = [0] * len(pobjects)
+    for membraneNr, membraneName in enumerate(system.H):
+        membrane = system.membranes[membraneName]
+        for pobject in membrane.variables + membrane.enzymes:
+            if (id(pobject) in pobjectIndexes):
+                owners[pobjectIndexes[id(pobject)]] = membraneNr
+
+    return owners
+# end pobjectOwners()
+
+def remoteReads(system, membranePartitions):
+    """Determines the Pobjects that are read (by production functions or enzymes) by programs of other partitions than their owner
+
+    :system: NumericalPsystem object
+    :membranePartitions: partition of each membrane, in the order of NumericalPsystem.H
+    :returns: map between (reader partition, owner partition): sorted list of Pobject indexes"""
+
+    pobjects = system.variables + system.enzymes
+    pobjectIndexes = dict([(id(pobject), index) for index, pobject in enumerate(pobjects)])
+    owners = [membranePartitions[membraneNr] for membraneNr in pobjectOwners(system)]
+
+    reads = {}
+    for membraneNr, membraneName in enumerate(system.H):
+        reader = membranePartitions[membraneNr]
+        for program in system.membranes[membraneName].programs:
+            for pobject in program.activationObjects + ((program.enzyme,) if type(program.enzyme) == pep.Pobject else ()):
+                index = pobjectIndexes[id(pobject)]
+                if (owners[index] != reader):
+                    reads.setdefault((reader, owners[index]), set()).add(index)
+
+    return dict([(key, sorted(indexes)) for key, indexes in reads.items()])
+# end remoteReads()
+
+def buildCommunicationGraph(system):
+    """Builds the communication graph between membranes: an edge connects the membrane of a program with the owner of each Pobject
+    that the program reads, consumes or distributes to (see pobjectOwners()); its weight is the number of such references
+
+    :system: NumericalPsystem object
+    :returns: (list of membrane weights, list of maps between neighbour membrane: edge weight) tuple, indexed in the order of NumericalPsystem.H"""
+
+    pobjects = system.variables + system.enzymes
+    pobjectIndexes = dict([(id(pobject), index) for index, pobject in enumerate(pobjects)])
+    owners = pobjectOwners(system)
+
+    weights = []
+    neighbours = [{} for membraneName in system.H]
+    for membraneNr, membraneName in enumerate(system.H):
+        membrane = system.membranes[membraneName]
+        # the work of a membrane grows with its programs and distribution rules
+        weights.append(1 + sum([1 + len(program.distribFunction) for program in membrane.programs]))
+        for program in membrane.programs:
+            referenced = [pobjectIndexes[id(pobject)] for pobject in program.activationObjects]
+            if (type(program.enzyme) == pep.Pobject):
+                referenced.append(pobjectIndexes[id(program.enzyme)])
+            referenced.extend([pobjectIndexes[id(distribRule.variable)] for distribRule in program.distribFunction])
+            for index in referenced:
+                other = owners[index]
+                if (other != membraneNr):
+                    neighbours[membraneNr][other] = neighbours[membraneNr].get(other, 0) + 1
+                    neighbours[other][membraneNr] = neighbours[other].get(membraneNr, 0) + 1
+
+    return weights, neighbours
+# end buildCommunicationGraph()
+
+def partitionMembranes(system, nrPartitions, imbalance = 0.1, nrPasses = 8):
+    """Splits the membranes into partitions of similar weight, minimizing the weight of the cut communication edges
+    (see buildCommunicationGraph()):
+        * the membranes are ordered by a depth-first traversal of the membrane tree (so subtrees are contiguous)
+          and the order is cut into nrPartitions ranges of similar weight
+        * membranes are then moved, one at a time, to the partition they communicate most with, as long as this reduces the cut
+          and keeps the weight of every partition under (1 + imbalance) * the average weight
+
+    :system: NumericalPsystem object
+    :nrPartitions: number of partitions (limited to the number of membranes)
+    :imbalance: accepted relative excess weight of a partition
+    :nrPasses: maximum number of refinement passes
+    :returns: Partitioning object"""
+
+    weights, neighbours = buildCommunicationGraph(system)
+    nrMembranes = len(system.H)
+    nrPartitions = max(1, min(nrPartitions, nrMembranes))
+    membraneIndexes = dict([(id(system.membranes[membraneName]), membraneNr) for membraneNr, membraneName in enumerate(system.H)])
+
+    # depth-first order of the membrane tree (membranes that are not reachable from a root are appended in the order of H)
+    order = []
+    visited = set()
+    for membraneNr, membraneName in enumerate(system.H):
+        if (system.membranes[membraneName].parent != None):
+            continue
+        stack = [membraneNr]
+        while (len(stack) > 0):
+            current = stack.pop()
+            if (current in visited):
+                continue
+            visited.add(current)
+            order.append(current)
+            children = system.membranes[system.H[current]].children
+            stack.extend(reversed([membraneIndexes[id(child)] for child in children if id(child) in membraneIndexes]))
+    order.extend([membraneNr for membraneNr in range(nrMembranes) if membraneNr not in visited])
+
+    totalWeight = sum(weights)
+    membranePartitions = [0] * nrMembranes
+    loads = [0] * nrPartitions
+    partitionNr = 0
+    assignedWeight = 0
+    for position, membraneNr in enumerate(order):
+        # move to the next partition once the middle of this membrane is past the end of the range of the current partition,
+        # keeping at least one membrane for each remaining partition
+        if (partitionNr < nrPartitions - 1 and loads[partitionNr] > 0 and
+                (assignedWeight + weights[membraneNr] / 2 > totalWeight * (partitionNr + 1) / nrPartitions
+                    or nrMembranes - position <= nrPartitions - 1 - partitionNr)):
+            partitionNr += 1
+        membranePartitions[membraneNr] = partitionNr
+        loads[partitionNr] += weights[membraneNr]
+        assignedWeight += weights[membraneNr]
+
+    maxLoad = (1 + imbalance) * totalWeight / nrPartitions
+    sizes = [membranePartitions.count(partitionNr) for partitionNr in range(nrPartitions)]
+    for passNr in range(nrPasses):
+        moved = 0
+        for membraneNr in order:
+            current = membranePartitions[membraneNr]
+            if (sizes[current] <= 1):
+                continue
+            connections = {}
+            for other, weight in neighbours[membraneNr].items():
+                connections[membranePartitions[other]] = connections.get(membranePartitions[other], 0) + weight
+            best = current
+            for partitionNr, weight in connections.items():
+                if (weight > connections.get(best, 0) and loads[partitionNr] + weights[membraneNr] <= maxLoad):
+                    best = partitionNr
+            if (best != current):
+                membranePartitions[membraneNr] = best
+                loads[current] -= weights[membraneNr]
+                loads[best] += weights[membraneNr]
+                sizes[current] -= 1
+                sizes[best] += 1
+                moved += 1
+        if (moved == 0):
+            break
+
+    cutEdges = totalEdges = 0
+    for membraneNr in range(nrMembranes):
+        for other, weight in neighbours[membraneNr].items():
+            if (other > membraneNr):
+                totalEdges += weight
+                if (membranePartitions[other] != membranePartitions[membraneNr]):
+                    cutEdges += weight
+
+    return Partitioning(nrPartitions, membranePartitions, loads, cutEdges, totalEdges)
+# end partitionMembranes()
+
+def runWorker(address, authkey, system = None, connectTimeout = 60):
+    """Connects to a coordinator (see DistributedSimulation) and simulates the partition that it assigns, until it is stopped
+
+    :address: unix:PATH or tcp:HOST:PORT address of the coordinator
+    :authkey: authentication key (bytes)
+    :system: the already parsed P system (inherited by forked workers) or None to parse the description sent by the coordinator
+    :connectTimeout: number of seconds during which the connection is retried (the coordinator may still be parsing its input file)"""
+
+    deadline = time.time() + connectTimeout
+    while (True):
+        try:
+            connection = multiprocessing.connection.Client(*parseAddress(address), authkey = authkey)
+            break
+        except (ConnectionRefusedError, FileNotFoundError):
+            if (time.time() > deadline):
+                raise
+            time.sleep(0.5)
+    worker = None
+    ghostExchange = False
+    try:
+        sendMessage(connection, ("hello", system != None))
+        while (True):
+            message = pickle.loads(connection.recv_bytes())
+            if (message[0] == "stop"):
+                break
+
+            if (message[0] == "setup"):
+                description, partitionNr, membranePartitions, seed, ghostExchange = message[1:]
+                if (system == None):
+                    system = pep.readInputString(description)
+                worker = PartitionWorker(system, partitionNr, membranePartitions, seed)
+                sendMessage(connection, ("ready",))
+
+            elif (message[0] == "values"):
+                sendMessage(connection, ("values", worker.getOwnedValues()))
+
+            elif (message[0] == "run"):
+                for stepNr in range(message[1]):
+                    worker.runProductionPhase()
+                    messages = worker.collectMessages()
+                    consumed, localContributions = messages.pop(worker.partitionNr)
+                    sendMessage(connection, ("exchange", messages))
+
+                    received = pickle.loads(connection.recv_bytes())
+                    worker.applyMessages(localContributions, received[1])
+
+                    if (ghostExchange):
+                        sendMessage(connection, ("ghosts", worker.collectGhostValues()))
+                        worker.applyGhostValues(pickle.loads(connection.recv_bytes())[1])
+                sendMessage(connection, ("done",))
+    except Exception as e:
+        logging.error("Worker error: %s", e)
+        try:
+            sendMessage(connection, ("error", "%s: %s" % (type(e).__name__, e)))
+        except OSError:
+            pass
+    finally:
+        connection.close()
+# end runWorker()
+
+##########################################################################
+#   MAIN
+
+if (__name__ == "__main__"):
+    logging.basicConfig(format='%(levelname)s:%(message)s', level = logging.INFO if '-v' in sys.argv else logging.WARNING)
+
+    if (len(sys.argv) < 2 or '-h' in sys.argv or '--help' in sys.argv):
+        print("Usage: pep_distributed.py PEP_INPUT_FILE -n NR [options]")
+        print("       pep_distributed.py --worker ADDRESS --authkey KEY")
+        print("    addresses are unix:PATH or tcp:HOST:PORT")
+        print("    [options] can be:")
+        print("        * -n NR:           number of simulation steps")
+        print("        * --partitions K:  number of partitions (worker processes) (default: number of CPUs)")
+        print("        * --listen ADDR:   address where the workers connect (default: a temporary Unix socket)")
+        print("        * --remote R:      number of workers started separately with --worker (the others are started locally)")
+        print("        * --authkey KEY:   authentication key of the connections (required with --remote)")
+        print("        * --seed S:        base seed of the random choice of programs of the partitions")
+        print("        * --stats FILE:    write the communication statistics of each step into the csv FILE")
+        print("        * -v:              print progress messages")
+        exit(1)
+
+    try:
+        authkey = pep.getOptionValue(sys.argv, '--authkey', lambda value: value.encode("utf-8"))
+        if ('--worker' in sys.argv):
+            if (authkey == None):
+                raise RuntimeError("Workers require an authentication key ('--authkey' parameter)")
+            runWorker(pep.getOptionValue(sys.argv, '--worker'), authkey)
+            exit(0)
+
+        nrSteps = pep.getOptionValue(sys.argv, '-n', int)
+        if (nrSteps == None or nrSteps < 0):
+            raise RuntimeError("The number of simulation steps ('-n' parameter) is required")
+        statsFileName = pep.getOptionValue(sys.argv, '--stats')
+        with open(sys.argv[1]) as inputFile:
+            description = inputFile.read()
+        simulation = DistributedSimulation(description,
+                nrPartitions = pep.getOptionValue(sys.argv, '--partitions', int, os.cpu_count()),
+                seed = pep.getOptionValue(sys.argv, '--seed', int),
+                listenAddress = pep.getOptionValue(sys.argv, '--listen'),
+                nrRemoteWorkers = pep.getOptionValue(sys.argv, '--remote', int, 0),
+                authkey = authkey)
+    except (ValueError, RuntimeError, OSError) as e:
+        logging.error(str(e))
+        exit(1)
+
+    try:
+        startTime = time.perf_counter()
+        simulation.run(nrSteps)
+        duration = time.perf_counter() - startTime
+        simulation.syncToSystem()
+    except RuntimeError as e:
+        logging.error(str(e))
+        exit(1)
+    finally:
+        simulation.close()
+
+    simulation.system.print()
+
+    if (statsFileName != None):
+        keys = ("seconds", "bytes", "contributions", "consumed", "ghostValues", "waitSeconds")
+        with open(statsFileName, "w") as statsFile:
+            statsFile.write("step,%s\n" % ",".join(keys))
+            for stepNr, statistics in enumerate(simulation.statistics, 1):
+                statsFile.write("%d,%s\n" % (stepNr, ",".join([str(statistics[key]) for key in keys])))
+
+    summary = simulation.summary()
+    print("%d steps in %.3f seconds using %d partitions (loads %s); %d of %d communication edges cut; per step: %.0f bytes, "
+            "%.1f remote contributions, %.1f remote consumptions, %.1f ghost values, %.3f ms waiting at the barrier" % (
+            nrSteps, duration, summary["partitions"], summary["loads"], summary["cutEdges"], summary["totalEdges"],
+            summary["bytesPerStep"], summary["contributionsPerStep"], summary["consumedPerStep"], summary["ghostValuesPerStep"],
+            summary["waitSecondsPerStep"] * 1e3))
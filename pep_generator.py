@@ -0,0 +1,197 @@
+#!/usr/bin/python3
+
+"""Generator of synthetic numerical P systems (.pep input files) used for benchmarking (see pep_benchmark.py)
+
+The generated P systems can be scaled in number of membranes, nesting depth, programs per membrane,
+production function size, mix of functions, use of enzymes and distribution fan-out.
+Production functions average their terms, so that the values remain bounded during long simulations."""
+
+import random # for the random structure and expressions
+
+##########################################################################
+# auxiliary definitions
+
+# functions (groups of term templates) that can be used in production functions; {0} and {1} are variable names
+dictFunctionTerms = {
+        'arith':   ["{0}", "0.5 * {0}", "({0} + {1}) / 2", "{0} * 0.25 + 1"],
+        'trig':    ["sin({0})", "cos({0}) * {1} / 2", "atan({0})"],
+        'minmax':  ["min(({0}) ({1}))", "max(({0}) ({1})) / 2"],
+        'compare': ["({0} > {1}) * {0}", "({0} <= 1) + ({1} == 0)", "({0} != {1}) * 0.5"],
+        }
+
+##########################################################################
+# auxiliary functions
+
+def generateStructure(nrMembranes, depth, rng):
+    """Generates a random membrane tree with the given maximum nesting depth
+
+    :nrMembranes: number of membranes
+    :depth: maximum nesting depth (0 = only the skin membrane contains other membranes)
+    :rng: random.Random instance
+    :returns: list of parent membrane numbers (-1 for the skin membrane)"""
+
+    parents = [-1]
+    levels = [[0]]
+    for membraneNr in range(1, nrMembranes):
+        # the levels are filled in round-robin order, so that each level has a possible parent
+        level = 1 + (membraneNr - 1) % (depth + 1)
+        if (level >= len(levels)):
+            levels.append([])
+        parents.append(rng.choice(levels[level - 1]))
+        levels[level].append(membraneNr)
+
+    return parents
+# end generateStructure()
+
+def formatStructure(parents, names):
+    """Formats a membrane tree using the structure syntax (e.g. [m0 [m1 ]m1 ]m0)
+
+    :parents: list of parent membrane numbers (-1 for the skin membrane)
+    :names: list of membrane names
+    :returns: string"""
+
+    children = [[] for name in names]
+    for membraneNr, parent in enumerate(parents):
+        if (parent >= 0):
+            children[parent].append(membraneNr)
+
+    result = []
+    # iterative depth-first traversal: positive numbers open a membrane, negative ones close it
+    stack = [0]
+    while (len(stack) > 0):
+        membraneNr = stack.pop()
+        if (membraneNr < 0):
+            result.append("]%s" % names[-membraneNr - 1])
+            continue
+        result.append("[%s" % names[membraneNr])
+        stack.append(-membraneNr - 1)
+        stack.extend(reversed(children[membraneNr]))
+
+    return " ".join(result)
+# end formatStructure()
+
+def generateExpression(variables, expressionSize, functions, rng):
+    """Generates a production function that averages expressionSize terms
+
+    :variables: names of the variables that can be used
+    :expressionSize: number of terms
+    :functions: list of keys of dictFunctionTerms
+    :rng: random.Random instance
+    :returns: string"""
+
+    terms = []
+    for termNr in range(expressionSize):
+        template = rng.choice(dictFunctionTerms[rng.choice(functions)])
+        terms.append(template.format(rng.choice(variables), rng.choice(variables)))
+
+    if (expressionSize == 1):
+        return terms[0]
+    return "(%s) / %d" % (" + ".join(terms), expressionSize)
+# end generateExpression()
+
+def generateModel(nrMembranes = 10, depth = 1, nrPrograms = 1, expressionSize = 3, functions = ('arith',), enzymeRatio = 0.0,
+        fanOut = 2, nrVariables = 3, seed = 0):
+    """Generates the description of a numerical P system (the contents of a .pep file)
+
+    :nrMembranes: number of membranes
+    :depth: maximum nesting depth of the membrane structure
+    :nrPrograms: number of programs of each membrane (non-enzymatic membranes with several programs choose one randomly)
+    :expressionSize: number of terms of each production function
+    :functions: kinds of terms used in production functions (keys of dictFunctionTerms)
+    :enzymeRatio: fraction of membranes that use an enzyme
+    :fanOut: number of distribution rules of each program
+    :nrVariables: number of variables of each membrane
+    :seed: seed of the random generator
+    :returns: string"""
+
+    for function in functions:
+        if (function not in dictFunctionTerms):
+            raise RuntimeError("Unknown function kind '%s'; expected one of %s" % (function, ", ".join(sorted(dictFunctionTerms))))
+
+    rng = random.Random(seed)
+    names = ["m%d" % membraneNr for membraneNr in range(nrMembranes)]
+    parents = generateStructure(nrMembranes, depth, rng)
+
+    # neighbours (parent and children) receive part of the produced values
+    neighbours = [[] for name in names]
+    for membraneNr, parent in enumerate(parents):
+        if (parent >= 0):
+            neighbours[membraneNr].append(parent)
+            neighbours[parent].append(membraneNr)
+
+    lines = ["num_ps = {"]
+    lines.append("    H = {%s};" % ", ".join(names))
+    lines.append("    structure = %s;" % formatStructure(parents, names))
+
+    for membraneNr, name in enumerate(names):
+        variables = ["x_%d_%d" % (membraneNr, varNr) for varNr in range(nrVariables)]
+        targets = variables + ["x_%d_%d" % (neighbour, varNr) for neighbour in neighbours[membraneNr] for varNr in range(nrVariables)]
+        enzyme = "e_%d" % membraneNr if rng.random() < enzymeRatio else None
+
+        lines.append("    %s = {" % name)
+        lines.append("        var = {%s};" % ", ".join(variables))
+        if (enzyme != None):
+            lines.append("        E = {%s};" % enzyme)
+            # the enzyme also receives part of the produced values, so that programs are activated and deactivated over time
+            targets.append(enzyme)
+
+        for programNr in range(nrPrograms):
+            expression = generateExpression(variables, expressionSize, functions, rng)
+            distribution = " + ".join(["%d|%s" % (rng.randint(1, 3), rng.choice(targets)) for ruleNr in range(fanOut)])
+            if (enzyme != None):
+                lines.append("        pr = {%s [%s -> ] %s};" % (expression, enzyme, distribution))
+            else:
+                lines.append("        pr = {%s -> %s};" % (expression, distribution))
+
+        lines.append("        var0 = (%s);" % ", ".join([str(rng.randint(0, 9)) for variable in variables]))
+        if (enzyme != None):
+            lines.append("        E0 = (%d);" % rng.randint(0, 9))
+        lines.append("    };")
+
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+# end generateModel()
+
+##########################################################################
+#   MAIN
+
+if (__name__ == "__main__"):
+    import sys # for argv
+    import pep # for getOptionValue()
+
+    if ('-h' in sys.argv or '--help' in sys.argv):
+        print("Usage: pep_generator.py [options] > FILE.pep")
+        print("    [options] can be:")
+        print("        * --membranes N:   number of membranes (default 10)")
+        print("        * --depth D:       maximum nesting depth of the membrane structure (default 1)")
+        print("        * --programs P:    programs per membrane (default 1)")
+        print("        * --size S:        number of terms of each production function (default 3)")
+        print("        * --functions F:   comma separated kinds of terms: %s (default arith)" % ",".join(sorted(dictFunctionTerms)))
+        print("        * --enzymes R:     fraction of membranes that use an enzyme (default 0)")
+        print("        * --fan-out F:     distribution rules per program (default 2)")
+        print("        * --variables V:   variables per membrane (default 3)")
+        print("        * --seed S:        seed of the random generator (default 0)")
+        print("        * -o FILE:         write the P system into FILE instead of stdout")
+        exit(1)
+
+    try:
+        model = generateModel(
+                nrMembranes = pep.getOptionValue(sys.argv, '--membranes', int, 10),
+                depth = pep.getOptionValue(sys.argv, '--depth', int, 1),
+                nrPrograms = pep.getOptionValue(sys.argv, '--programs', int, 1),
+                expressionSize = pep.getOptionValue(sys.argv, '--size', int, 3),
+                functions = pep.getOptionValue(sys.argv, '--functions', lambda value: value.split(','), ['arith']),
+                enzymeRatio = pep.getOptionValue(sys.argv, '--enzymes', float, 0.0),
+                fanOut = pep.getOptionValue(sys.argv, '--fan-out', int, 2),
+                nrVariables = pep.getOptionValue(sys.argv, '--variables', int, 3),
+                seed = pep.getOptionValue(sys.argv, '--seed', int, 0))
+        outputFileName = pep.getOptionValue(sys.argv, '-o')
+    except (ValueError, RuntimeError) as e:
+        print(str(e))
+        exit(1)
+
+    if (outputFileName == None):
+        sys.stdout.write(model)
+    else:
+        with open(outputFileName, "w") as outputFile:
+            outputFile.write(model)
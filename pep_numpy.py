@@ -0,0 +1,612 @@
+#!/usr/bin/python3
+
+"""NumPy array-backed simulation engines for numerical P systems
+
+The engines in this module keep the values of all variables and enzymes in one contiguous float64 array
+and run each simulation phase (production, reset, distribution) as a small number of array operations
+(SparseEngine stores the reset and distribution phases as sparse matrices, for very large P systems).
+They are built from the index based representation returned by NumericalPsystem.flatten()"""
+
+import collections  # for OrderedDict
+import logging # for logging functions
+import numpy as np # for array operations
+
+from pep import FlatItemType
+
+##########################################################################
+# auxiliary definitions
+
+def power(op1, op2):
+    """np.power that raises OverflowError when the result is out of range, like the ** operator of Python floats
+    (the other operators of Python floats return inf, as NumPy does)"""
+
+    with np.errstate(over='raise'):
+        try:
+            return np.power(op1, op2)
+        except FloatingPointError:
+            raise OverflowError("Numerical result out of range") from None
+# end power()
+
+# map between OperatorType value and (number of operands, vectorized function)
+# binary functions receive their operands in the order in which they appear in the expression (op1, op2)
+# boolean results are converted to float64 so that they can be used in further arithmetic
+dictOperatorUfuncs = {
+        2:  (2, lambda op1, op2: np.equal(op1, op2).astype(np.float64)),          # eq
+        3:  (2, lambda op1, op2: np.not_equal(op1, op2).astype(np.float64)),      # ne
+        4:  (2, lambda op1, op2: np.less(op1, op2).astype(np.float64)),           # lt
+        5:  (2, lambda op1, op2: np.less_equal(op1, op2).astype(np.float64)),     # le
+        6:  (2, lambda op1, op2: np.greater(op1, op2).astype(np.float64)),        # gt
+        7:  (2, lambda op1, op2: np.greater_equal(op1, op2).astype(np.float64)),  # ge
+        8:  (2, np.add),
+        9:  (2, np.subtract),
+        10: (2, np.multiply),
+        11: (2, np.true_divide),
+        12: (2, power),
+        13: (1, np.negative),
+
+        14: (1, np.sin),
+        15: (1, lambda op: np.sin(np.radians(op))),                               # sind
+        16: (1, np.arcsin),
+        17: (1, lambda op: np.degrees(np.arcsin(op))),                            # asind
+        18: (1, np.cos),
+        19: (1, lambda op: np.cos(np.radians(op))),                               # cosd
+        20: (1, np.arccos),
+        21: (1, lambda op: np.degrees(np.arccos(op))),                            # acosd
+        22: (1, np.tan),
+        23: (1, lambda op: np.tan(np.radians(op))),                               # tand
+        24: (1, np.arctan),
+        25: (1, lambda op: np.degrees(np.arctan(op))),                            # atand
+        26: (2, np.arctan2),
+        27: (2, lambda op1, op2: np.degrees(np.arctan2(op1, op2))),               # atan2d
+        28: (1, lambda op: 1 / np.tan(op)),                                       # cot
+        29: (1, lambda op: 1 / np.tan(np.radians(op))),                           # cotd
+        30: (1, lambda op: np.arctan(1 / op)),                                    # acot
+        31: (1, lambda op: np.degrees(np.arctan(1 / op))),                        # acotd
+
+        32: (1, np.sqrt),
+        33: (1, np.fabs),
+        34: (1, np.log),
+        35: (1, np.log10),
+        36: (1, np.log2),
+        # the interpreted form pops op2 first, so min / max receive (op2, op1)
+        37: (2, lambda op1, op2: np.minimum(op2, op1)),
+        38: (2, lambda op1, op2: np.maximum(op2, op1)),
+        }
+
+# operators of ReplicaBatchEngine, where errors do not stop the batch (the affected values become inf / nan)
+dictBatchOperatorUfuncs = dict(dictOperatorUfuncs)
+dictBatchOperatorUfuncs[12] = (2, np.power)
+
+##########################################################################
+# class definitions
+
+class ProgramGroup():
+
+    """Group of programs whose production functions have the same postfix shape
+    (the same sequence of operators and operand types), that are evaluated together
+
+    :ivar ndarray programs: program numbers of the group (int array)
+    :ivar list code: postfix form as (FlatItemType, payload) tuples, where payload is an array of constants,
+        an array of Pobject indexes (one element for each program of the group) or a vectorized function
+    :ivar bool alwaysActive: True if all programs of the group are executed at each simulation step
+    """
+
+    def __init__(self, shape, programs, programItems, alwaysActive, operatorUfuncs = dictOperatorUfuncs):
+        """Constructs the group code from the flattened production functions
+
+        :shape: tuple that describes the common postfix shape (see groupPrograms())
+        :programs: list of program numbers
+        :programItems: FlatModel.programItems
+        :alwaysActive: True if all programs of the group are executed at each simulation step
+        :operatorUfuncs: map between OperatorType value and (number of operands, vectorized function)"""
+
+        self.programs = np.array(programs, dtype=np.intp)
+        self.alwaysActive = alwaysActive
+        self.code = []
+
+        stackSize = 0
+        for position, element in enumerate(shape):
+            if (element == -FlatItemType.constant):
+                self.code.append((FlatItemType.constant,
+                    np.array([programItems[prgNr][position][1] for prgNr in programs], dtype=np.float64)))
+                stackSize += 1
+            elif (element == -FlatItemType.variable):
+                self.code.append((FlatItemType.variable,
+                    np.array([programItems[prgNr][position][1] for prgNr in programs], dtype=np.intp)))
+                stackSize += 1
+            else:
+                nrOperands, function = operatorUfuncs[element]
+                if (stackSize < nrOperands):
+                    raise RuntimeError("evaluation error / wrong number of operands or operators in program %d" % programs[0])
+                stackSize -= nrOperands - 1
+                self.code.append((FlatItemType.operator, (nrOperands, function)))
+
+        if (stackSize != 1):
+            raise RuntimeError("evaluation error / wrong number of operands or operators in program %d" % programs[0])
+
+    def evaluate(self, values, rows = None):
+        """Evaluates the production functions of the group
+
+        :values: array of Pobject values (the last axis indexes Pobjects, so several states can be evaluated at once)
+        :rows: array of positions (in self.programs) of the programs that have to be evaluated or None for all programs
+        :returns: array of produced values (the last axis indexes the evaluated programs)"""
+
+        stack = []
+        for kind, payload in self.code:
+            if (kind == FlatItemType.constant):
+                stack.append(payload if rows is None else payload[rows])
+
+            elif (kind == FlatItemType.variable):
+                stack.append(values[..., payload if rows is None else payload[rows]])
+
+            else:
+                nrOperands, function = payload
+                if (nrOperands == 1):
+                    stack.append(function(stack.pop()))
+                else:
+                    op2 = stack.pop()
+                    op1 = stack.pop()
+                    stack.append(function(op1, op2))
+
+        return stack[0]
+    # end evaluate()
+# end class ProgramGroup
+
+class CsrMatrix():
+
+    """Sparse matrix in compressed sparse row (CSR) format, whose rows are programs and whose columns are Pobjects
+    The entries of row i are indices[indptr[i]:indptr[i + 1]] (column numbers) and data[indptr[i]:indptr[i + 1]] (values);
+    a matrix without data only stores the positions of its entries
+
+    :ivar ndarray indptr: start of the entries of each row, followed by the number of entries (int array of nrRows + 1 elements)
+    :ivar ndarray indices: column of each entry (int array)
+    :ivar ndarray data: value of each entry (float64 array) or None
+    :ivar ndarray rowCounts: number of entries of each row (int array)
+    :ivar int nrColumns: number of columns
+    """
+
+    def __init__(self, rows, nrColumns, withData = True):
+        """Constructs the matrix from the entries of each row
+
+        :rows: list of rows, each one a list of column numbers or, if withData = True, of (column, value) tuples
+        :nrColumns: number of columns
+        :withData: True / False - whether or not the entries have values"""
+
+        self.nrColumns = nrColumns
+        self.rowCounts = np.fromiter((len(row) for row in rows), dtype=np.intp, count=len(rows))
+        self.indptr = np.zeros(len(rows) + 1, dtype=np.intp)
+        np.cumsum(self.rowCounts, out=self.indptr[1:])
+        nrEntries = int(self.indptr[-1])
+
+        # the entries are converted directly into arrays, without intermediate lists
+        if (withData):
+            self.indices = np.fromiter((column for row in rows for column, value in row), dtype=np.intp, count=nrEntries)
+            self.data = np.fromiter((value for row in rows for column, value in row), dtype=np.float64, count=nrEntries)
+        else:
+            self.indices = np.fromiter((column for row in rows for column in row), dtype=np.intp, count=nrEntries)
+            self.data = None
+
+    def selectColumns(self, rowMask):
+        """Returns the columns of the entries of the selected rows
+
+        :rowMask: bool array (one element for each row)
+        :returns: int array"""
+
+        return self.indices[np.repeat(rowMask, self.rowCounts)]
+    # end selectColumns()
+
+    def transposeDot(self, vector):
+        """Computes the product between the transposed matrix and a vector (the sum of vector[row] * value over the entries of each column)
+
+        :vector: float64 array (one element for each row)
+        :returns: float64 array (one element for each column)"""
+
+        return np.bincount(self.indices, weights=np.repeat(vector, self.rowCounts) * self.data, minlength=self.nrColumns)
+    # end transposeDot()
+# end class CsrMatrix
+
+class VectorizedEngine():
+
+    """Simulation engine that keeps the values of all Pobjects in a float64 array
+    It produces the same results as NumericalPsystem.runSimulationStep(), with all values represented as float64
+    (trigonometric and logarithmic functions use the NumPy implementations, that can differ in the last bit):
+        * programs with the same postfix shape are evaluated together
+        * the random choice of programs uses NumericalPsystem.rng in the same order as NumericalPsystem.runSimulationStep()
+        * all distribution rules are applied using a single scatter-add, in the order of the original distribution
+
+    :ivar NumericalPsystem system: the simulated P system
+    :ivar FlatModel model: index based representation of the P system
+    :ivar ndarray values: values of all Pobjects (variables followed by enzymes)
+    :ivar list(ProgramGroup) groups: groups of programs that are evaluated together
+    :ivar int completedSteps: number of simulation steps completed by the last call of run()
+    """
+
+    # vectorized functions of the operators (see ProgramGroup)
+    operatorUfuncs = dictOperatorUfuncs
+
+    def __init__(self, system, model = None):
+        """Builds the engine arrays
+
+        :system: NumericalPsystem object whose values are used as the initial state
+        :model: FlatModel of the system, if it was already constructed"""
+
+        self.system = system
+        self.model = system.flatten() if model == None else model
+        model = self.model
+        nrPrograms = len(model.programItems)
+
+        self.values = np.array(model.initialValues, dtype=np.float64)
+        self.completedSteps = 0
+        self.newValues = np.zeros(nrPrograms, dtype=np.float64)
+
+        # classify programs according to how they are chosen for execution
+        self.alwaysActive = np.zeros(nrPrograms, dtype=bool)
+        stochasticFirstProgram = []
+        stochasticSizes = []
+        enzymaticPrograms = []
+        for membraneNr, programs in enumerate(model.membranePrograms):
+            if (len(programs) < 1):
+                continue
+            if (model.membraneEnzymatic[membraneNr]):
+                enzymaticPrograms.extend(programs)
+            elif (len(programs) == 1):
+                self.alwaysActive[programs[0]] = True
+            else:
+                stochasticFirstProgram.append(programs[0])
+                stochasticSizes.append(len(programs))
+
+        self.stochasticFirstProgram = np.array(stochasticFirstProgram, dtype=np.intp)
+        self.stochasticSizes = stochasticSizes
+        self.allActive = bool(self.alwaysActive.all())
+        self.activeMask = self.alwaysActive.copy()
+
+        # enzymatic activation: enzyme > min(production function variables)
+        self.enzymaticPrograms = np.array(enzymaticPrograms, dtype=np.intp)
+        self.enzymaticEnzymes = np.array([model.programEnzymes[prgNr] for prgNr in enzymaticPrograms], dtype=np.intp)
+        self.enzymaticWithVariables = np.array([len(model.programVariables[prgNr]) > 0 for prgNr in enzymaticPrograms], dtype=bool)
+        activationIndexes = []
+        activationStarts = []
+        for prgNr in enzymaticPrograms:
+            if (len(model.programVariables[prgNr]) > 0):
+                activationStarts.append(len(activationIndexes))
+                activationIndexes.extend(model.programVariables[prgNr])
+        self.activationIndexes = np.array(activationIndexes, dtype=np.intp)
+        self.activationStarts = np.array(activationStarts, dtype=np.intp)
+
+        self.buildRules(model)
+
+        self.groups = [ProgramGroup(shape, programs, model.programItems, bool(self.alwaysActive[programs].all()), self.operatorUfuncs)
+                for shape, programs in groupPrograms(model.programItems).items()]
+
+        logging.info("Vectorized engine built for %d Pobjects, %d programs in %d groups",
+                len(self.values), nrPrograms, len(self.groups))
+
+    def buildRules(self, model):
+        """Builds the arrays of consumed Pobjects and distribution rules (one entry for each rule, with its program number)
+
+        :model: FlatModel of the system"""
+
+        # consumed Pobjects (the variables of each production function)
+        self.consumedIndexes = np.array([index for variables in model.programVariables for index in variables], dtype=np.intp)
+        self.consumedPrograms = np.array([prgNr for prgNr, variables in enumerate(model.programVariables) for index in variables], dtype=np.intp)
+        self.alwaysConsumedIndexes = np.unique(self.consumedIndexes[self.alwaysActive[self.consumedPrograms]])
+
+        # distribution rules, in the order in which NumericalPsystem.runSimulationStep() applies them
+        distribution = [(index, proportion / proportionTotal, prgNr)
+                for prgNr, rules in enumerate(model.programDistribution)
+                for (index, proportion, proportionTotal) in rules]
+        self.distributionIndexes = np.array([rule[0] for rule in distribution], dtype=np.intp)
+        self.distributionCoefficients = np.array([rule[1] for rule in distribution], dtype=np.float64)
+        self.distributionPrograms = np.array([rule[2] for rule in distribution], dtype=np.intp)
+    # end buildRules()
+
+    def chooseActivePrograms(self):
+        """Determines the programs that will be executed in the current step and stores them in self.activeMask"""
+
+        if (self.allActive):
+            return
+
+        activeMask = self.activeMask
+        activeMask[:] = self.alwaysActive
+
+        # one program is chosen randomly for each membrane that does not use enzymes
+        if (len(self.stochasticSizes) > 0):
+            randint = self.system.rng.randint
+            choices = [randint(0, size - 1) for size in self.stochasticSizes]
+            activeMask[self.stochasticFirstProgram + np.array(choices, dtype=np.intp)] = True
+
+        # all programs whose enzyme is greater than min(production function variables) are executed
+        if (len(self.enzymaticPrograms) > 0):
+            activated = np.ones(len(self.enzymaticPrograms), dtype=bool)
+            if (len(self.activationStarts) > 0):
+                minValues = np.minimum.reduceat(self.values[self.activationIndexes], self.activationStarts)
+                activated[self.enzymaticWithVariables] = self.values[self.enzymaticEnzymes[self.enzymaticWithVariables]] > minValues
+            activeMask[self.enzymaticPrograms] = activated
+    # end chooseActivePrograms()
+
+    def runSimulationStep(self):
+        """Runs 1 simulation step, equivalent to NumericalPsystem.runSimulationStep()"""
+
+        values = self.values
+        newValues = self.newValues
+
+        self.chooseActivePrograms()
+        self.runProductionPhase()
+
+        # reset variable and enzymes phase
+        if (self.allActive):
+            values[self.alwaysConsumedIndexes] = 0
+        else:
+            values[self.consumedIndexes[self.activeMask[self.consumedPrograms]]] = 0
+
+        # distribution phase for all programs
+        if (self.allActive):
+            np.add.at(values, self.distributionIndexes, self.distributionCoefficients * newValues[self.distributionPrograms])
+        else:
+            selected = self.activeMask[self.distributionPrograms]
+            np.add.at(values, self.distributionIndexes[selected],
+                    self.distributionCoefficients[selected] * newValues[self.distributionPrograms[selected]])
+    # end runSimulationStep()
+
+    def runProductionPhase(self):
+        """Evaluates the production functions of the active programs (see chooseActivePrograms()) into self.newValues"""
+
+        values = self.values
+        newValues = self.newValues
+
+        # production phase for all groups of programs
+        with np.errstate(divide='raise', invalid='raise', over='ignore', under='ignore'):
+            try:
+                for group in self.groups:
+                    if (group.alwaysActive):
+                        newValues[group.programs] = group.evaluate(values)
+                    else:
+                        rows = np.flatnonzero(self.activeMask[group.programs])
+                        if (len(rows) > 0):
+                            newValues[group.programs[rows]] = group.evaluate(values, rows)
+            except (FloatingPointError, OverflowError):
+                logging.error("Error encountered during the production phase of programs %s" % group.programs.tolist())
+                raise
+    # end runProductionPhase()
+
+    def run(self, nrSteps):
+        """Runs several simulation steps
+        The number of completed steps is stored in self.completedSteps, also if a step raises an error
+
+        :nrSteps: number of simulation steps"""
+
+        self.completedSteps = 0
+        for step in range(nrSteps):
+            self.runSimulationStep()
+            self.completedSteps += 1
+    # end run()
+
+    def getValues(self):
+        """Returns the values of all Pobjects (variables followed by enzymes)
+
+        :returns: list of values"""
+
+        return self.values.tolist()
+    # end getValues()
+
+    def loadFromSystem(self):
+        """Copies the current values of the Pobjects of the P system into the engine"""
+
+        self.values[:] = self.system.getValues()
+    # end loadFromSystem()
+
+    def syncToSystem(self):
+        """Copies the values from the engine into the Pobjects of the P system"""
+
+        self.system.setValues(self.values.tolist())
+    # end syncToSystem()
+# end class VectorizedEngine
+
+class ReplicaBatchEngine(VectorizedEngine):
+
+    """Simulation engine that runs several independent copies (replicas) of the same P system in lockstep
+    The state is stored as a (nrReplicas x nrPobjects) float64 array and each replica chooses its own programs,
+    so that a batch advances using the same number of array operations as a single VectorizedEngine step.
+    Errors of the production functions (e.g. division by zero) do not stop the batch, the affected values become inf / nan.
+
+    :ivar int nrReplicas: number of replicas
+    :ivar ndarray values: (nrReplicas x nrPobjects) array of values
+    :ivar Generator rng: NumPy random number generator used for the stochastic choice of programs
+    """
+
+    operatorUfuncs = dictBatchOperatorUfuncs
+
+    def __init__(self, system, nrReplicas, seed = None, model = None):
+        """Builds the engine arrays; all replicas start from the current state of the P system
+
+        :system: NumericalPsystem object whose values are used as the initial state
+        :nrReplicas: number of replicas
+        :seed: seed of the random number generator (None for a random seed)
+        :model: FlatModel of the system, if it was already constructed"""
+
+        VectorizedEngine.__init__(self, system, model)
+
+        self.nrReplicas = nrReplicas
+        self.rng = np.random.default_rng(seed)
+        self.values = np.tile(self.values, (nrReplicas, 1))
+        self.newValues = np.zeros((nrReplicas, len(self.model.programItems)), dtype=np.float64)
+        self.activeMask = np.tile(self.alwaysActive, (nrReplicas, 1))
+        self.stochasticSizesArray = np.array(self.stochasticSizes, dtype=np.intp)
+        self.replicaIndexes = np.arange(nrReplicas)[:, np.newaxis]
+
+        # positions in the flattened (row-major) values array, for each replica and each consumed / distribution entry
+        replicaOffsets = self.replicaIndexes * self.values.shape[1]
+        self.consumedTargets = replicaOffsets + self.consumedIndexes
+        self.distributionTargets = replicaOffsets + self.distributionIndexes
+
+    def chooseActivePrograms(self):
+        """Determines the programs that each replica executes in the current step and stores them in self.activeMask"""
+
+        if (self.allActive):
+            return
+
+        activeMask = self.activeMask
+        activeMask[:] = self.alwaysActive
+
+        # each replica chooses one program for each membrane that does not use enzymes
+        if (len(self.stochasticSizes) > 0):
+            choices = self.rng.integers(0, self.stochasticSizesArray, size=(self.nrReplicas, len(self.stochasticSizes)))
+            activeMask[self.replicaIndexes, self.stochasticFirstProgram + choices] = True
+
+        # all programs whose enzyme is greater than min(production function variables) are executed
+        if (len(self.enzymaticPrograms) > 0):
+            activated = np.ones((self.nrReplicas, len(self.enzymaticPrograms)), dtype=bool)
+            if (len(self.activationStarts) > 0):
+                minValues = np.minimum.reduceat(self.values[:, self.activationIndexes], self.activationStarts, axis=1)
+                activated[:, self.enzymaticWithVariables] = self.values[:, self.enzymaticEnzymes[self.enzymaticWithVariables]] > minValues
+            activeMask[:, self.enzymaticPrograms] = activated
+    # end chooseActivePrograms()
+
+    def runSimulationStep(self):
+        """Runs 1 simulation step for all replicas"""
+
+        values = self.values
+        newValues = self.newValues
+
+        self.chooseActivePrograms()
+
+        # errors of the production functions and their propagation (e.g. inf - inf) do not raise or warn, see the class description
+        with np.errstate(all='ignore'):
+            # production phase; all programs are evaluated for all replicas and only the active ones are used afterwards
+            for group in self.groups:
+                newValues[:, group.programs] = group.evaluate(values)
+
+            # operate on the flattened values array, where the entries of each replica are contiguous
+            flatValues = values.reshape(-1)
+            contributions = self.distributionCoefficients * newValues[:, self.distributionPrograms]
+
+            # reset variable and enzymes phase
+            if (self.allActive):
+                values[:, self.alwaysConsumedIndexes] = 0
+            else:
+                flatValues[self.consumedTargets[self.activeMask[:, self.consumedPrograms]]] = 0
+
+            # distribution phase; boolean selection keeps the rules of each replica in the original order
+            if (self.allActive):
+                np.add.at(flatValues, self.distributionTargets.reshape(-1), contributions.reshape(-1))
+            else:
+                selected = self.activeMask[:, self.distributionPrograms]
+                np.add.at(flatValues, self.distributionTargets[selected], contributions[selected])
+    # end runSimulationStep()
+
+    def run(self, nrSteps, recordTrace = False):
+        """Runs several simulation steps for all replicas
+
+        :nrSteps: number of simulation steps
+        :recordTrace: True / False - whether or not to return the state of all replicas after each step
+        :returns: (nrSteps x nrReplicas x nrPobjects) array if recordTrace = True otherwise None"""
+
+        trace = np.empty((nrSteps,) + self.values.shape, dtype=np.float64) if recordTrace else None
+        for step in range(nrSteps):
+            self.runSimulationStep()
+            if (recordTrace):
+                trace[step] = self.values
+
+        return trace
+    # end run()
+
+    def getValues(self, replicaNr = 0):
+        """Returns the values of all Pobjects (variables followed by enzymes) of one replica
+
+        :replicaNr: replica number
+        :returns: list of values"""
+
+        return self.values[replicaNr].tolist()
+    # end getValues()
+
+    def getReplicaStates(self):
+        """Returns the state of each replica as a map between Pobject names and values
+        Names that are declared more than once keep the value of the last declaration
+
+        :returns: list of dictionaries (one for each replica)"""
+
+        return [dict(zip(self.model.names, replicaValues)) for replicaValues in self.values.tolist()]
+    # end getReplicaStates()
+
+    def loadFromSystem(self):
+        """Copies the current values of the Pobjects of the P system into all replicas"""
+
+        self.values[:] = self.system.getValues()
+    # end loadFromSystem()
+
+    def syncToSystem(self, replicaNr = 0):
+        """Copies the values of one replica into the Pobjects of the P system
+
+        :replicaNr: replica number"""
+
+        self.system.setValues(self.values[replicaNr].tolist())
+    # end syncToSystem()
+# end class ReplicaBatchEngine
+
+class SparseEngine(VectorizedEngine):
+
+    """Simulation engine for very large P systems in which each Pobject is used by only a few programs
+    Production functions are evaluated per program group (as in VectorizedEngine), while consumption and distribution
+    are stored as sparse programs x Pobjects matrices (see CsrMatrix), so that the memory is proportional to the number of rules
+    and a simulation step consists of a few array operations over the rules:
+        * reset: the Pobjects consumed by the active programs are selected from the consumption matrix and set to 0
+        * distribution: values += distribution matrix (transposed) x produced values of the active programs
+    The contributions of all distribution rules to a Pobject are added together before they are added to its value,
+    so the results can differ in the last bit from those of NumericalPsystem.runSimulationStep()
+
+    :ivar CsrMatrix consumption: Pobjects consumed by each program (without data)
+    :ivar CsrMatrix distribution: distribution coefficients (proportion / proportionTotal) of each program
+    """
+
+    def buildRules(self, model):
+        """Builds the consumption and distribution matrices
+
+        :model: FlatModel of the system"""
+
+        nrPobjects = len(model.names)
+        self.consumption = CsrMatrix(model.programVariables, nrPobjects, withData = False)
+        self.alwaysConsumedIndexes = np.unique(self.consumption.selectColumns(self.alwaysActive))
+        self.distribution = CsrMatrix([[(index, proportion / proportionTotal) for index, proportion, proportionTotal in rules]
+            for rules in model.programDistribution], nrPobjects)
+        self.producedValues = np.zeros(len(model.programItems), dtype=np.float64)
+    # end buildRules()
+
+    def runSimulationStep(self):
+        """Runs 1 simulation step, equivalent to NumericalPsystem.runSimulationStep() (see the class description)"""
+
+        values = self.values
+
+        self.chooseActivePrograms()
+        self.runProductionPhase()
+
+        # the values produced by the programs that are not executed are not distributed (they can be left from previous steps)
+        if (self.allActive):
+            producedValues = self.newValues
+            values[self.alwaysConsumedIndexes] = 0
+        else:
+            producedValues = self.producedValues
+            np.copyto(producedValues, 0.0)
+            np.copyto(producedValues, self.newValues, where=self.activeMask)
+            values[self.consumption.selectColumns(self.activeMask)] = 0
+
+        values += self.distribution.transposeDot(producedValues)
+    # end runSimulationStep()
+# end class SparseEngine
+
+##########################################################################
+# auxiliary functions
+
+def groupPrograms(programItems):
+    """Groups programs according to the shape of their production function
+    The shape is a tuple that contains the OperatorType value for operators and -FlatItemType for operands
+
+    :programItems: FlatModel.programItems
+    :returns: OrderedDict between shape: list of program numbers"""
+
+    groups = collections.OrderedDict()
+    for prgNr, items in enumerate(programItems):
+        shape = tuple(value if kind == FlatItemType.operator else -kind for kind, value in items)
+        groups.setdefault(shape, []).append(prgNr)
+
+    return groups
+# end groupPrograms()
@@ -0,0 +1,352 @@
+#!/usr/bin/python3
+
+"""Real-time controller mode for numerical P systems (see pep.py), e.g. for driving robot controllers
+
+The P system is stepped at a fixed rate. Before each step, the latest sensor values received on a local socket are written
+into the input variables; after each step, the output variables are published on another local socket.
+Missed deadlines and the latency of each step (from the start of the period until the outputs are published) are measured.
+
+Packets are binary and little-endian, so that they can be produced and consumed by small controller programs:
+
+    * input packet: the values (float64) of the input variables, in the order of --inputs
+    * output packet: the step number (int64) followed by the values (float64) of the output variables, in the order of --outputs
+
+Addresses are written as udp:HOST:PORT or unix:PATH (Unix datagram socket).
+The --stand-in-sender and --stand-in-receiver modes replace the robot for testing."""
+
+import collections # for the bounded history of latencies
+import logging # for reporting
+import os # for removing Unix socket files
+import socket # for local I/O
+import struct # for packets
+import sys # for argv
+import time # for perf_counter() and sleep()
+
+import pep # the simulator
+
+##########################################################################
+# class definitions
+
+class RealtimeController():
+
+    """Steps a simulation at a fixed rate, exchanging the values of input and output variables over local sockets
+
+    :ivar Simulation simulation: the simulated P system (see pep.Simulation)
+    :ivar double period: duration of a simulation step (1 / frequency), in seconds
+    :ivar list(int) inputHandles: handles of the input variables
+    :ivar list(int) outputHandles: handles of the output variables
+    :ivar socket inputSocket: socket that receives the input packets (None if there are no inputs)
+    :ivar socket outputSocket: socket that sends the output packets (None if there are no outputs)
+    :ivar tuple outputAddress: address of the output packets
+    :ivar deque latencies: latency of the most recent steps, in seconds
+    :ivar int missedDeadlines: number of steps that ended after the end of their period
+    :ivar int receivedPackets: number of valid input packets
+    :ivar int invalidPackets: number of input packets with a wrong size
+    """
+
+    def __init__(self, simulation, frequency, inputNames = (), outputNames = (), inputAddress = None, outputAddress = None, historySize = 100000):
+        """Resolves the input / output variables and opens the sockets
+
+        :simulation: pep.Simulation object
+        :frequency: number of simulation steps per second
+        :inputNames: names of the input variables
+        :outputNames: names of the output variables
+        :inputAddress: address (see parseAddress()) where input packets are received
+        :outputAddress: address (see parseAddress()) where output packets are sent
+        :historySize: number of latencies that are kept for the percentiles"""
+
+        if (frequency <= 0):
+            raise RuntimeError("The frequency has to be positive")
+
+        self.simulation = simulation
+        self.period = 1.0 / frequency
+        self.inputHandles = [simulation.handle(name) for name in inputNames]
+        self.outputHandles = [simulation.handle(name) for name in outputNames]
+        self.inputPacket = struct.Struct("<%dd" % len(self.inputHandles))
+        self.outputPacket = struct.Struct("<q%dd" % len(self.outputHandles))
+
+        self.inputSocket = None
+        if (len(self.inputHandles) > 0):
+            if (inputAddress == None):
+                raise RuntimeError("Input variables require an input address")
+            self.inputSocket = openSocket(inputAddress, bind = True)
+            self.inputSocket.setblocking(False)
+
+        self.outputSocket = None
+        self.outputAddress = None
+        if (len(self.outputHandles) > 0):
+            if (outputAddress == None):
+                raise RuntimeError("Output variables require an output address")
+            self.outputSocket = openSocket(outputAddress)
+            self.outputAddress = parseAddress(outputAddress)[1]
+
+        self.latencies = collections.deque(maxlen = historySize)
+        self.missedDeadlines = 0
+        self.receivedPackets = 0
+        self.invalidPackets = 0
+
+    def receiveInputs(self):
+        """Reads all pending input packets and writes the values of the latest valid one into the input variables"""
+
+        latest = None
+        while (True):
+            try:
+                packet = self.inputSocket.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                break
+            if (len(packet) != self.inputPacket.size):
+                self.invalidPackets += 1
+                continue
+            latest = packet
+            self.receivedPackets += 1
+
+        if (latest != None):
+            for handle, value in zip(self.inputHandles, self.inputPacket.unpack(latest)):
+                self.simulation.setValue(handle, value)
+    # end receiveInputs()
+
+    def publishOutputs(self):
+        """Sends the values of the output variables"""
+
+        values = [self.simulation.getValue(handle) for handle in self.outputHandles]
+        try:
+            self.outputSocket.sendto(self.outputPacket.pack(self.simulation.stepNr, *values), self.outputAddress)
+        # a missing receiver must not stop the controller
+        except (ConnectionRefusedError, FileNotFoundError):
+            pass
+    # end publishOutputs()
+
+    def run(self, nrSteps = None):
+        """Runs the control loop
+
+        :nrSteps: number of simulation steps (None to run until interrupted)
+        :returns: statistics dictionary (see statistics())"""
+
+        period = self.period
+        nextStart = time.perf_counter()
+        stepNr = 0
+        try:
+            while (nrSteps == None or stepNr < nrSteps):
+                start = nextStart
+                deadline = start + period
+
+                if (self.inputSocket != None):
+                    self.receiveInputs()
+                self.simulation.step()
+                if (self.outputSocket != None):
+                    self.publishOutputs()
+
+                end = time.perf_counter()
+                self.latencies.append(end - start)
+                stepNr += 1
+
+                if (end > deadline):
+                    # the next step starts immediately, without trying to catch up on the missed periods
+                    self.missedDeadlines += 1
+                    nextStart = end
+                else:
+                    nextStart = deadline
+                    time.sleep(max(0.0, nextStart - time.perf_counter()))
+        except KeyboardInterrupt:
+            logging.info("Controller interrupted after %d steps", stepNr)
+
+        return self.statistics()
+    # end run()
+
+    def statistics(self):
+        """:returns: dictionary with the number of steps, missed deadlines, received / invalid input packets
+        and the latency percentiles (in seconds) of the most recent steps"""
+
+        latencies = sorted(self.latencies)
+        return {
+            "steps": self.simulation.stepNr,
+            "period": self.period,
+            "missedDeadlines": self.missedDeadlines,
+            "receivedPackets": self.receivedPackets,
+            "invalidPackets": self.invalidPackets,
+            "p50": percentile(latencies, 50),
+            "p90": percentile(latencies, 90),
+            "p99": percentile(latencies, 99),
+            "max": latencies[-1] if len(latencies) > 0 else 0.0,
+            }
+    # end statistics()
+
+    def close(self):
+        """Closes the sockets (and removes the Unix socket file of the inputs)"""
+
+        for openedSocket in (self.inputSocket, self.outputSocket):
+            if (openedSocket != None):
+                if (openedSocket.family == getattr(socket, "AF_UNIX", None) and openedSocket is self.inputSocket):
+                    removeSocketFile(openedSocket.getsockname())
+                openedSocket.close()
+    # end close()
+# end class RealtimeController
+
+##########################################################################
+# auxiliary functions
+
+def parseAddress(text):
+    """Parses a socket address
+
+    :text: udp:HOST:PORT or unix:PATH
+    :returns: (address family, address) tuple"""
+
+    kind, separator, rest = text.partition(':')
+    if (kind == "udp"):
+        host, separator, port = rest.rpartition(':')
+        try:
+            return socket.AF_INET, (host if host != "" else "127.0.0.1", int(port))
+        except ValueError:
+            pass
+    elif (kind == "unix" and rest != "" and hasattr(socket, "AF_UNIX")):
+        return socket.AF_UNIX, rest
+
+    raise RuntimeError("Invalid address '%s'; expected udp:HOST:PORT or unix:PATH" % text)
+# end parseAddress()
+
+def openSocket(text, bind = False):
+    """Opens a datagram socket
+
+    :text: address (see parseAddress())
+    :bind: True for receiving sockets (bound to the address), False for sending sockets
+    :returns: socket object"""
+
+    family, address = parseAddress(text)
+    datagramSocket = socket.socket(family, socket.SOCK_DGRAM)
+    if (bind):
+        if (family == socket.AF_INET):
+            datagramSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        else:
+            # a socket file left by a previous run
+            removeSocketFile(address)
+        datagramSocket.bind(address)
+    return datagramSocket
+# end openSocket()
+
+def removeSocketFile(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+# end removeSocketFile()
+
+def percentile(sortedValues, percent):
+    """:returns: the nearest-rank percentile of a sorted list (0 for an empty list)"""
+
+    if (len(sortedValues) == 0):
+        return 0.0
+    rank = max(1, -(-len(sortedValues) * percent // 100))
+    return sortedValues[int(rank) - 1]
+# end percentile()
+
+def runStandInSender(address, values, frequency, nrPackets = None):
+    """Sends input packets at a fixed rate, as a stand-in for the robot sensors
+
+    :address: address of the controller inputs (see parseAddress())
+    :values: list of input values; each packet increments them by 1, so that changes can be observed
+    :frequency: number of packets per second
+    :nrPackets: number of packets (None to send until interrupted)"""
+
+    family, socketAddress = parseAddress(address)
+    packet = struct.Struct("<%dd" % len(values))
+    with socket.socket(family, socket.SOCK_DGRAM) as senderSocket:
+        packetNr = 0
+        try:
+            while (nrPackets == None or packetNr < nrPackets):
+                try:
+                    senderSocket.sendto(packet.pack(*[value + packetNr for value in values]), socketAddress)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    pass
+                packetNr += 1
+                time.sleep(1.0 / frequency)
+        except KeyboardInterrupt:
+            pass
+    return packetNr
+# end runStandInSender()
+
+def runStandInReceiver(address, nrOutputs, nrPackets = None):
+    """Receives output packets and prints them, as a stand-in for the robot actuators
+
+    :address: address of the controller outputs (see parseAddress())
+    :nrOutputs: number of output variables
+    :nrPackets: number of packets (None to receive until interrupted)"""
+
+    packet = struct.Struct("<q%dd" % nrOutputs)
+    receiverSocket = openSocket(address, bind = True)
+    packetNr = 0
+    try:
+        while (nrPackets == None or packetNr < nrPackets):
+            data = receiverSocket.recv(65536)
+            if (len(data) != packet.size):
+                logging.warning("Ignoring an output packet of %d bytes (expected %d)", len(data), packet.size)
+                continue
+            values = packet.unpack(data)
+            print("step %d: %s" % (values[0], " ".join([repr(value) for value in values[1:]])))
+            packetNr += 1
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if (receiverSocket.family == getattr(socket, "AF_UNIX", None)):
+            removeSocketFile(receiverSocket.getsockname())
+        receiverSocket.close()
+    return packetNr
+# end runStandInReceiver()
+
+##########################################################################
+#   MAIN
+
+if (__name__ == "__main__"):
+    logging.basicConfig(format='%(levelname)s:%(message)s', level = logging.INFO if '-v' in sys.argv else logging.WARNING)
+
+    if (len(sys.argv) < 2 or '-h' in sys.argv or '--help' in sys.argv):
+        print("Usage: pep_realtime.py PEP_INPUT_FILE --rate HZ [options]")
+        print("       pep_realtime.py --stand-in-sender ADDRESS --values V1,V2 [--rate HZ] [-n NR]")
+        print("       pep_realtime.py --stand-in-receiver ADDRESS --outputs NR [-n NR]")
+        print("    addresses are udp:HOST:PORT or unix:PATH")
+        print("    [options] can be:")
+        print("        * --rate HZ:       number of simulation steps (or stand-in packets) per second (default 10)")
+        print("        * --inputs A,B:    input variables, set from the packets received on the --listen address before each step")
+        print("        * --listen ADDR:   address of the input packets (float64 values of the input variables)")
+        print("        * --outputs A,B:   output variables, sent to the --publish address after each step")
+        print("        * --publish ADDR:  address of the output packets (int64 step followed by the float64 values of the output variables)")
+        print("        * -n NR:           stop after NR simulation steps (default: run until interrupted)")
+        print("        * --engine NAME:   simulation engine: python (default), numpy, sparse or codegen")
+        print("        * --seed S:        seed of the random choice of programs")
+        print("        * -v:              print progress messages")
+        exit(1)
+
+    try:
+        frequency = pep.getOptionValue(sys.argv, '--rate', float, 10.0)
+        nrSteps = pep.getOptionValue(sys.argv, '-n', int)
+
+        if ('--stand-in-sender' in sys.argv):
+            values = pep.getOptionValue(sys.argv, '--values', lambda value: [float(item) for item in value.split(',')], [])
+            runStandInSender(pep.getOptionValue(sys.argv, '--stand-in-sender'), values, frequency, nrSteps)
+            exit(0)
+
+        if ('--stand-in-receiver' in sys.argv):
+            runStandInReceiver(pep.getOptionValue(sys.argv, '--stand-in-receiver'), pep.getOptionValue(sys.argv, '--outputs', int, 0), nrSteps)
+            exit(0)
+
+        simulation = pep.Simulation.fromFile(sys.argv[1],
+                engine = pep.getOptionValue(sys.argv, '--engine', str, "python"),
+                seed = pep.getOptionValue(sys.argv, '--seed', int))
+        controller = RealtimeController(simulation, frequency,
+                inputNames = pep.getOptionValue(sys.argv, '--inputs', lambda value: value.split(','), []),
+                outputNames = pep.getOptionValue(sys.argv, '--outputs', lambda value: value.split(','), []),
+                inputAddress = pep.getOptionValue(sys.argv, '--listen'),
+                outputAddress = pep.getOptionValue(sys.argv, '--publish'))
+    except (ValueError, RuntimeError, OSError) as e:
+        logging.error(str(e))
+        exit(1)
+
+    try:
+        statistics = controller.run(nrSteps)
+    finally:
+        controller.close()
+
+    print("%d steps at %g Hz: %d missed deadlines, latency p50 %.3f ms, p90 %.3f ms, p99 %.3f ms, max %.3f ms (budget %.3f ms); "
+            "%d input packets received, %d invalid" % (
+            statistics["steps"], 1.0 / statistics["period"], statistics["missedDeadlines"],
+            statistics["p50"] * 1e3, statistics["p90"] * 1e3, statistics["p99"] * 1e3, statistics["max"] * 1e3, statistics["period"] * 1e3,
+            statistics["receivedPackets"], statistics["invalidPackets"]))
@@ -0,0 +1,334 @@
+#!/usr/bin/python3
+
+"""Independent replicas and parameter sweeps of a numerical P system, run in forked worker processes (see pep.py)
+
+The P system is parsed once, by the calling process. Each worker process is forked with a WorkerState that holds
+the parsed P system, the engine and the initial values (inherited copy-on-write, without pickling them), runs its share
+of the tasks and sends their results back through a pipe. Every task starts from the initial state of the P system
+and uses its own seed, derived from a base seed, so the results do not depend on the number of workers."""
+
+import collections # for OrderedDict
+import hashlib # for deriving replica seeds
+import logging # for logging functions
+import math # for the number of values of sweep ranges
+import multiprocessing # for the worker processes
+import pickle # for reporting errors of the worker processes
+import random # for the random number generator of each task
+import time # for the default output file names
+
+##########################################################################
+# class definitions
+
+class WorkerState():
+
+    """State of a P system that the worker processes inherit when they are forked (see runInWorkers())
+
+    :ivar NumericalPsystem system: the parsed P system
+    :ivar engine: engine object used instead of the P system (e.g. pep_numpy.VectorizedEngine) or None
+    :ivar list initialValues: values of all Pobjects at the start of each task (variables followed by enzymes)
+    """
+
+    def __init__(self, system, engine = None):
+        """Captures the current values of the P system as the initial state of the tasks
+
+        :system: NumericalPsystem object
+        :engine: engine object used instead of the P system or None"""
+
+        self.system = system
+        self.engine = engine
+        self.initialValues = system.getValues()
+# end class WorkerState
+
+##########################################################################
+# auxiliary functions
+
+def deriveReplicaSeed(seed, replicaNr):
+    """Derives the seed of a replica from a base seed, independently of the number of replicas or workers
+
+    :seed: the base seed (int)
+    :replicaNr: the replica number
+    :returns: int seed"""
+
+    digest = hashlib.sha256(("pep replica %d %d" % (seed, replicaNr)).encode()).digest()
+    return int.from_bytes(digest[:8], "little")
+# end deriveReplicaSeed()
+
+def runInWorkers(system, function, tasks, nrWorkers = 1, engine = None):
+    """Calls function(state, task) for each task, in forked worker processes that inherit (copy-on-write) the already parsed P system
+    Each worker runs every nrWorkers-th task and sends all its results back at the end; an exception raised by a task is raised again here
+
+    :system: NumericalPsystem object
+    :function: module level function that receives the WorkerState and one task and returns a (picklable) result
+    :tasks: list of (picklable) tasks
+    :nrWorkers: number of worker processes (tasks are run in the current process if nrWorkers <= 1)
+    :engine: engine object used instead of the P system (e.g. pep_numpy.VectorizedEngine)
+    :returns: list of results, in the order of tasks"""
+
+    state = WorkerState(system, engine)
+    initialParameters = system.getParameters()
+    # tasks that run in this process replace the random number generator
+    previousRng = system.rng
+
+    try:
+        context = multiprocessing.get_context("fork")
+    except ValueError:
+        logging.warning("Forking worker processes is not supported on this platform; running sequentially")
+        nrWorkers = 1
+
+    processes = []
+    try:
+        if (nrWorkers <= 1 or len(tasks) <= 1):
+            results = [function(state, task) for task in tasks]
+        else:
+            nrWorkers = min(nrWorkers, len(tasks))
+            connections = []
+            for workerNr in range(nrWorkers):
+                receiver, sender = context.Pipe(duplex = False)
+                process = context.Process(target = runTasks, args = (function, state, tasks[workerNr::nrWorkers], sender), daemon = True)
+                process.start()
+                # the worker holds the only sending end, so its exit is seen as EOFError
+                sender.close()
+                processes.append(process)
+                connections.append(receiver)
+
+            results = [None] * len(tasks)
+            for workerNr, connection in enumerate(connections):
+                try:
+                    succeeded, payload = connection.recv()
+                except EOFError:
+                    raise RuntimeError("Worker process %d exited unexpectedly (exit code %s)" % (workerNr, processes[workerNr].exitcode))
+                finally:
+                    connection.close()
+                if (not succeeded):
+                    raise payload
+                results[workerNr::nrWorkers] = payload
+    finally:
+        for process in processes:
+            if (process.is_alive()):
+                process.terminate()
+            process.join()
+        # restore the initial state (tasks that ran in this process have modified it)
+        system.setParameters(initialParameters)
+        system.setValues(state.initialValues)
+        system.rng = previousRng
+        if (engine != None):
+            engine.loadFromSystem()
+
+    return results
+# end runInWorkers()
+
+def runTasks(function, state, tasks, connection):
+    """Runs the tasks of one worker process and sends (True, list of results) or (False, exception) through the connection
+    Is the target of the worker processes of runInWorkers()
+
+    :function: function(state, task) that runs one task
+    :state: WorkerState object
+    :tasks: list of tasks
+    :connection: sending end of the pipe to the calling process"""
+
+    try:
+        try:
+            message = (True, [function(state, task) for task in tasks])
+        except Exception as e:
+            message = (False, e)
+        try:
+            connection.send(message)
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            # results or exceptions that cannot be pickled
+            connection.send((False, RuntimeError("%s: %s" % (type(message[1]).__name__, message[1]))))
+    finally:
+        connection.close()
+# end runTasks()
+
+def runReplica(state, arguments):
+    """Runs one replica of the P system (using the engine if set), starting from the initial values
+    Is called by runInWorkers() for runReplicas()
+
+    :state: WorkerState object
+    :arguments: (replicaNr, seed, nrSteps, recordTrace) tuple
+    :returns: (replicaNr, seed, final values, list of values after each step (empty if recordTrace = False)) tuple"""
+
+    replicaNr, seed, nrSteps, recordTrace = arguments
+
+    state.system.setValues(state.initialValues)
+    state.system.rng = random.Random(seed)
+    stepper = state.system
+    if (state.engine != None):
+        state.engine.loadFromSystem()
+        stepper = state.engine
+
+    trace = []
+    if (recordTrace):
+        trace.append(stepper.getValues())
+    for step in range(nrSteps):
+        stepper.runSimulationStep()
+        if (recordTrace):
+            trace.append(stepper.getValues())
+
+    return replicaNr, seed, stepper.getValues(), trace
+# end runReplica()
+
+def runReplicas(system, nrReplicas, nrSteps, nrWorkers = 1, seed = 0, recordTrace = False, engine = None):
+    """Runs several independent replicas of a P system, each one with its own seed derived from a base seed
+    Replicas are distributed to forked worker processes that inherit the already parsed P system
+
+    :system: NumericalPsystem object whose current values are the initial state of all replicas
+    :nrReplicas: number of replicas
+    :nrSteps: number of simulation steps executed by each replica
+    :nrWorkers: number of worker processes (replicas are run in the current process if nrWorkers <= 1)
+    :seed: base seed from which the seed of each replica is derived (see deriveReplicaSeed())
+    :recordTrace: True / False - whether or not to return the values after each simulation step
+    :engine: engine object used instead of the P system (e.g. pep_numpy.VectorizedEngine)
+    :returns: list of (replicaNr, seed, final values, trace) tuples, ordered by replica number"""
+
+    tasks = [(replicaNr, deriveReplicaSeed(seed, replicaNr), nrSteps, recordTrace) for replicaNr in range(nrReplicas)]
+    return runInWorkers(system, runReplica, tasks, nrWorkers, engine)
+# end runReplicas()
+
+def runSweepPoint(state, arguments):
+    """Simulates the P system for one point of a parameter sweep, starting from the initial values
+    Is called by runInWorkers() for sweepParameters()
+
+    :state: WorkerState object
+    :arguments: (pointNr, point, seed, nrSteps, variableIndexes) tuple
+    :returns: (pointNr, point, list of final values of the selected Pobjects) tuple"""
+
+    pointNr, point, seed, nrSteps, variableIndexes = arguments
+
+    state.system.setValues(state.initialValues)
+    state.system.setParameters(point)
+    state.system.rng = random.Random(seed)
+    stepper = state.system
+    if (state.engine != None):
+        # parameters used in production functions are embedded in the engine when it is built
+        stepper = type(state.engine)(state.system)
+
+    for step in range(nrSteps):
+        stepper.runSimulationStep()
+
+    values = stepper.getValues()
+    return pointNr, point, [values[index] for index in variableIndexes]
+# end runSweepPoint()
+
+def sweepParameters(system, points, nrSteps, variableNames = None, nrWorkers = 1, seed = 0, engine = None):
+    """Simulates an already parsed P system for each point of a parameter sweep
+    Each point is simulated starting from the initial state of the P system, in forked worker processes
+
+    :system: NumericalPsystem object
+    :points: list of maps (dictionaries) between String parameter_name: value (see parameterGrid())
+    :nrSteps: number of simulation steps for each point
+    :variableNames: names of the Pobjects whose final values are reported (None for all variables and enzymes)
+    :nrWorkers: number of worker processes (points are run in the current process if nrWorkers <= 1)
+    :seed: base seed from which the seed of each point is derived (see deriveReplicaSeed())
+    :engine: engine object used instead of the P system (e.g. pep_numpy.VectorizedEngine)
+    :returns: list of (pointNr, point, list of final values of the selected Pobjects) tuples, ordered by point number"""
+
+    names = [pobject.name for pobject in system.variables + system.enzymes]
+    if (variableNames == None):
+        variableIndexes = list(range(len(names)))
+    else:
+        for name in variableNames:
+            if (name not in names):
+                raise RuntimeError("Unknown variable '%s'" % name)
+        variableIndexes = [names.index(name) for name in variableNames]
+
+    for point in points:
+        for name in point:
+            if (name not in system.parameters):
+                raise RuntimeError("Unknown parameter '%s'" % name)
+
+    tasks = [(pointNr, point, deriveReplicaSeed(seed, pointNr), nrSteps, variableIndexes) for pointNr, point in enumerate(points)]
+    return runInWorkers(system, runSweepPoint, tasks, nrWorkers, engine)
+# end sweepParameters()
+
+def parameterGrid(parameterValues):
+    """Constructs the list of points of a grid sweep (the cartesian product of the values of each parameter)
+
+    :parameterValues: OrderedDict between String parameter_name: list of values
+    :returns: list of OrderedDict between String parameter_name: value"""
+
+    points = [collections.OrderedDict()]
+    for name, values in parameterValues.items():
+        points = [collections.OrderedDict(list(point.items()) + [(name, value)]) for point in points for value in values]
+
+    return points
+# end parameterGrid()
+
+def parseSweepValues(text):
+    """Parses the values of a swept parameter, written either as a comma separated list (1,2,5) or as a range START:STOP:STEP (STOP included)
+
+    :text: string
+    :returns: list of numbers
+    :raises ValueError: if the values cannot be parsed"""
+
+    def toNumber(value):
+        return float(value) if ('.' in value or 'e' in value) else int(value)
+
+    if (':' in text):
+        start, stop, step = [toNumber(value) for value in text.split(':')]
+        if (step <= 0):
+            raise ValueError("The step of '%s' has to be positive" % text)
+        nrValues = int(math.floor((stop - start) / step + 1e-9)) + 1
+        return [start + i * step for i in range(nrValues)]
+
+    return [toNumber(value) for value in text.split(',')]
+# end parseSweepValues()
+
+def writeSweepResults(results, variableNames, filename = None):
+    """Writes the results of sweepParameters() into a .csv file
+    The output file is named using the pattern pep_sweep_DAY-MONTH-YEAR_HOUR-MINUTE-SECOND.csv if filename is not specified
+
+    :results: list of (pointNr, point, values) tuples
+    :variableNames: names of the reported Pobjects
+    :filename: path of the output file
+    :returns: the path of the output file"""
+
+    if (filename == None):
+        filename = "pep_sweep_%s.csv" % time.strftime("%d-%m-%Y_%H-%M-%S")
+    parameterNames = list(results[0][1].keys()) if len(results) > 0 else []
+
+    with open(filename, mode="w") as csvFile:
+        csvFile.write("PeP sweep csv output. Format = POINT_NR PARAMETER_COLUMNS EMPTY_COLUMN VARIABLE_COLUMNS\n")
+        csvFile.write("point, %s, ,%s\n" % (", ".join(parameterNames), ", ".join(variableNames)))
+        for pointNr, point, values in results:
+            csvFile.write("%d, %s, ,%s\n" % (
+                    pointNr,
+                    ", ".join([str(point[name]) for name in parameterNames]),
+                    ", ".join([str(value) for value in values])))
+
+    return filename
+# end writeSweepResults()
+
+def writeReplicaResults(system, results, filename = None):
+    """Writes the results of runReplicas() into a .csv file
+    Each replica contributes one row for each recorded step (step 0 is the initial state) or only its final state if no trace was recorded
+    The output file is named using the pattern pep_replicas_DAY-MONTH-YEAR_HOUR-MINUTE-SECOND.csv if filename is not specified
+
+    :system: the NumericalPsystem object that was simulated
+    :results: list of (replicaNr, seed, final values, trace) tuples
+    :filename: path of the output file
+    :returns: the path of the output file"""
+
+    if (filename == None):
+        filename = "pep_replicas_%s.csv" % time.strftime("%d-%m-%Y_%H-%M-%S")
+    nrVariables = len(system.variables)
+
+    with open(filename, mode="w") as csvFile:
+        csvFile.write("PeP replica csv output. Format = REPLICA_NR SEED STEP_NR VARIABLE_COLUMNS EMPTY_COLUMN ENZYME_COLUMNS\n")
+        csvFile.write("replica, seed, step, %s, ,%s\n" % (
+                ", ".join([var.name for var in system.variables]),
+                ", ".join([enz.name for enz in system.enzymes])))
+
+        for replicaNr, seed, finalValues, trace in results:
+            rows = list(enumerate(trace)) if len(trace) > 0 else [(-1, finalValues)]
+            for step, values in rows:
+                csvFile.write("%d, %d, %s, %s, ,%s\n" % (
+                        replicaNr,
+                        seed,
+                        "final" if step < 0 else str(step),
+                        ", ".join([str(value) for value in values[:nrVariables]]),
+                        ", ".join([str(value) for value in values[nrVariables:]])))
+
+    return filename
+# end writeReplicaResults()
+
@@ -0,0 +1,453 @@
+#!/usr/bin/python3
+
+"""Long-lived simulation service for numerical P systems (see pep.py)
+
+Other tools send requests to a local Unix socket (or TCP port) instead of starting a new pep.py process for each simulation.
+Requests and responses are JSON objects, one per line; a connection can send several requests, one after the other.
+
+    * {"op": "upload", "model": "num_ps = {...}"}
+        -> {"event": "uploaded", "model": KEY} (once the model was parsed by a worker process)
+    * {"op": "simulate", "model": "num_ps = {...}" | "key": KEY, "steps": N,
+       "values": {NAME: VALUE}, "parameters": {NAME: VALUE}, "seed": S, "engine": "python" | "numpy" | "sparse" | "codegen",
+       "trace": {"every": K, "vars": [NAME, ...]}}
+        -> zero or more {"event": "trace", "steps": [STEP, ...], "values": [[VALUE, ...], ...]} chunks
+        -> {"event": "result", "model": KEY, "step": N, "values": {NAME: VALUE}, "seconds": T}
+    * {"op": "metrics"}
+        -> {"event": "metrics", "queued": ..., "running": ..., "completed": ..., "failed": ..., ...}
+
+Errors are reported as {"event": "error", "message": "..."}.
+
+Parsed and compiled P systems are kept in an LRU cache in each worker process (and optionally in the model cache files of pep.py),
+so a model is only parsed once per worker. Simulations run in a process pool, in segments of at most segmentSteps steps;
+the state between segments is passed as a pep.Checkpoint, so that trace chunks are streamed while the simulation runs."""
+
+import asyncio # for the service
+import collections # for the LRU caches
+import concurrent.futures # for the process pool
+import json # for requests and responses
+import logging # for reporting
+import os # for removing Unix socket files
+import random # for seeding the simulations
+import socket # for the client
+import sys # for argv
+import time # for durations
+
+import pep # the simulator
+
+##########################################################################
+# global variables
+
+# state of each worker process (see initWorker())
+workerModels = collections.OrderedDict()
+workerMaxModels = 16
+workerCacheDirectory = None
+
+##########################################################################
+# class definitions
+
+class SimulationService():
+
+    """Serves simulation requests (see the module description) using a process pool
+
+    :ivar ProcessPoolExecutor pool: worker processes that run the simulations
+    :ivar tuple poolArguments: (number of workers, maxModels, cacheDirectory) used for (re)creating the pool
+    :ivar Semaphore slots: limits the number of simulations that run at the same time
+    :ivar OrderedDict models: LRU cache of the models that were parsed successfully (key -> description)
+    :ivar int maxModels: maximum number of models that are kept
+    :ivar int segmentSteps: maximum number of simulation steps of each task submitted to the pool
+    :ivar dict metrics: request counters (queued, running, completed, failed, ...)
+    """
+
+    def __init__(self, nrWorkers = 1, maxConcurrent = None, maxModels = 64, segmentSteps = 10000, cacheDirectory = None):
+        """Starts the worker processes
+
+        :nrWorkers: number of worker processes
+        :maxConcurrent: maximum number of simulations that run at the same time (the number of workers by default); others wait in a queue
+        :maxModels: maximum number of models that are kept in memory, by the service and by each worker
+        :segmentSteps: maximum number of simulation steps of each task submitted to the pool (at least 1)
+        :cacheDirectory: directory of the model cache files of the workers (None to only cache models in memory)"""
+
+        if (segmentSteps < 1):
+            raise RuntimeError("The number of simulation steps of each segment has to be at least 1")
+        self.poolArguments = (nrWorkers, maxModels, cacheDirectory)
+        self.pool = self.createPool()
+        self.slots = asyncio.Semaphore(maxConcurrent if maxConcurrent != None else nrWorkers)
+        self.models = collections.OrderedDict()
+        self.maxModels = maxModels
+        self.segmentSteps = segmentSteps
+        self.startTime = time.time()
+        self.metrics = {"queued": 0, "running": 0, "completed": 0, "failed": 0, "uploads": 0, "modelHits": 0, "modelMisses": 0}
+
+    def createPool(self):
+        """:returns: a new pool of worker processes"""
+
+        nrWorkers, maxModels, cacheDirectory = self.poolArguments
+        return concurrent.futures.ProcessPoolExecutor(nrWorkers, initializer = initWorker, initargs = (maxModels, cacheDirectory))
+    # end createPool()
+
+    def storeModel(self, key, description):
+        """Stores a model in the LRU cache
+        Should only be called after a worker process parsed the model, so that invalid models are not kept
+
+        :key: key of the model (see pep.getModelCacheKey())
+        :description: contents of a .pep file"""
+
+        self.models[key] = description
+        self.models.move_to_end(key)
+        while (len(self.models) > self.maxModels):
+            self.models.popitem(last = False)
+    # end storeModel()
+
+    def findModel(self, request):
+        """Finds the model of a request, given as text or as the key of an uploaded model
+        Models given as text are not stored (see storeModel())
+
+        :returns: (key, description) tuple"""
+
+        if ("model" in request):
+            description = request["model"]
+            if (type(description) != str):
+                raise RuntimeError("Expected the contents of a .pep file as model")
+            return pep.getModelCacheKey(description.encode("utf-8")), description
+
+        key = request.get("key")
+        if (key not in self.models):
+            self.metrics["modelMisses"] += 1
+            raise RuntimeError("Unknown model key '%s'; the model has to be uploaded (again)" % key)
+        self.metrics["modelHits"] += 1
+        self.models.move_to_end(key)
+        return key, self.models[key]
+    # end findModel()
+
+    async def upload(self, request, send):
+        """Parses an uploaded model in a worker process and stores it if it is valid
+
+        :request: upload request (dictionary)
+        :send: coroutine function that sends a response"""
+
+        if ("model" not in request):
+            raise RuntimeError("Expected the contents of a .pep file as model")
+        key, description = self.findModel(request)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.pool, loadModel, key, description)
+        self.storeModel(key, description)
+        await send({"event": "uploaded", "model": key})
+    # end upload()
+
+    async def simulate(self, request, send):
+        """Runs a simulation request, sending trace chunks as they become available
+
+        :request: simulate request (dictionary)
+        :send: coroutine function that sends a response"""
+
+        key, description = self.findModel(request)
+        nrSteps = int(request.get("steps", 0))
+        if (nrSteps < 0):
+            raise RuntimeError("The number of steps has to be positive")
+        trace = request.get("trace")
+        setup = (request.get("values", {}), request.get("parameters", {}), request.get("seed"), request.get("engine", "python"),
+                trace.get("every", 1) if trace != None else 0, trace.get("vars") if trace != None else None)
+
+        pool = None
+        self.metrics["queued"] += 1
+        async with self.slots:
+            self.metrics["queued"] -= 1
+            self.metrics["running"] += 1
+            try:
+                loop = asyncio.get_running_loop()
+                startTime = time.perf_counter()
+                checkpoint = None
+                remainingSteps = nrSteps
+                # the first segment also applies the initial values, so it runs even for 0 steps
+                while (checkpoint == None or remainingSteps > 0):
+                    segmentSteps = min(remainingSteps, self.segmentSteps)
+                    # the pool may be replaced (by another request) while this segment runs
+                    pool = self.pool
+                    firstSegment = (checkpoint == None)
+                    checkpoint, names, traceSteps, traceValues = await loop.run_in_executor(pool, runSegment,
+                            (key, description, setup, checkpoint, segmentSteps))
+                    remainingSteps -= segmentSteps
+                    # the model was parsed successfully by the first segment
+                    if (firstSegment):
+                        self.storeModel(key, description)
+                    if (len(traceSteps) > 0):
+                        await send({"event": "trace", "steps": traceSteps, "values": traceValues})
+
+                values = {}
+                for name, value in zip(names, checkpoint.values):
+                    values.setdefault(name, value)
+                await send({"event": "result", "model": key, "step": checkpoint.step, "values": values,
+                        "seconds": time.perf_counter() - startTime})
+                self.metrics["completed"] += 1
+            except Exception as e:
+                self.metrics["failed"] += 1
+                # a worker process crashed; the pool cannot run any other task, so it is replaced
+                if (isinstance(e, concurrent.futures.process.BrokenProcessPool) and pool is self.pool):
+                    logging.warning("A worker process crashed; restarting the process pool")
+                    self.pool.shutdown(wait = False)
+                    self.pool = self.createPool()
+                raise
+            finally:
+                self.metrics["running"] -= 1
+    # end simulate()
+
+    async def handleRequest(self, request, send):
+        """Dispatches a request
+
+        :request: request (dictionary)
+        :send: coroutine function that sends a response"""
+
+        operation = request.get("op")
+        if (operation == "upload"):
+            self.metrics["uploads"] += 1
+            await self.upload(request, send)
+        elif (operation == "simulate"):
+            await self.simulate(request, send)
+        elif (operation == "metrics"):
+            metrics = {"event": "metrics", "models": len(self.models), "uptime": time.time() - self.startTime}
+            metrics.update(self.metrics)
+            await send(metrics)
+        else:
+            raise RuntimeError("Unknown operation '%s'; expected upload, simulate or metrics" % operation)
+    # end handleRequest()
+
+    async def handleConnection(self, reader, writer):
+        """Serves the requests of a client connection, one after the other"""
+
+        async def send(response):
+            writer.write(json.dumps(response).encode("utf-8") + b"\n")
+            await writer.drain()
+
+        try:
+            while (True):
+                line = await reader.readline()
+                if (len(line) == 0):
+                    break
+                try:
+                    request = json.loads(line)
+                    if (type(request) != dict):
+                        raise RuntimeError("Expected a JSON object")
+                    await self.handleRequest(request, send)
+                # the connection itself failed, so no error can be sent
+                except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                    raise
+                # any other failure (including a crashed worker process) is reported to the client
+                except Exception as e:
+                    if (not isinstance(e, (ValueError, KeyError, TypeError, RuntimeError, ArithmeticError))):
+                        logging.exception("Unexpected error while serving a request")
+                    await send({"event": "error", "message": "%s: %s" % (type(e).__name__, e)})
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
+    # end handleConnection()
+
+    async def serve(self, address):
+        """Serves requests until cancelled
+
+        :address: unix:PATH or tcp:HOST:PORT"""
+
+        kind, separator, rest = address.partition(':')
+        # models are sent on a single line
+        limit = 1 << 28
+        if (kind == "unix"):
+            if (os.path.exists(rest)):
+                os.unlink(rest)
+            server = await asyncio.start_unix_server(self.handleConnection, rest, limit = limit)
+        elif (kind == "tcp"):
+            host, separator, port = rest.rpartition(':')
+            server = await asyncio.start_server(self.handleConnection, host if host != "" else "127.0.0.1", int(port), limit = limit)
+        else:
+            raise RuntimeError("Invalid address '%s'; expected unix:PATH or tcp:HOST:PORT" % address)
+
+        logging.info("Simulation service listening on %s", address)
+        async with server:
+            await server.serve_forever()
+    # end serve()
+
+    def close(self):
+        self.pool.shutdown()
+# end class SimulationService
+
+##########################################################################
+# auxiliary functions
+
+def initWorker(maxModels, cacheDirectory):
+    """Configures the model cache of a worker process"""
+
+    global workerMaxModels, workerCacheDirectory
+    workerMaxModels = maxModels
+    workerCacheDirectory = cacheDirectory
+    # parse messages of the workers are not shown
+    logging.getLogger().setLevel(logging.WARNING)
+# end initWorker()
+
+def getWorkerModel(key, description):
+    """Returns the parsed and compiled P system of a model, using the LRU cache of the worker process
+    (and the model cache files, if a cache directory was configured)
+
+    :key: key of the model (see pep.getModelCacheKey())
+    :description: contents of the .pep file
+    :returns: (P system, initial values, initial parameter values) tuple"""
+
+    if (key in workerModels):
+        workerModels.move_to_end(key)
+        return workerModels[key]
+
+    system = None
+    if (workerCacheDirectory != None):
+        cacheFileName = os.path.join(workerCacheDirectory, key + pep.CACHE_EXTENSION)
+        system = pep.readModelCache(cacheFileName, key)
+    if (system == None):
+        system = pep.readInputString(description)
+        if (workerCacheDirectory != None):
+            os.makedirs(workerCacheDirectory, exist_ok = True)
+            pep.writeModelCache(system, cacheFileName, key)
+
+    workerModels[key] = (system, system.getValues(), system.getParameters())
+    while (len(workerModels) > workerMaxModels):
+        workerModels.popitem(last = False)
+    return workerModels[key]
+# end getWorkerModel()
+
+def loadModel(key, description):
+    """Parses a model in a worker process (see getWorkerModel()), raising an error if it is invalid"""
+
+    getWorkerModel(key, description)
+# end loadModel()
+
+def runSegment(arguments):
+    """Runs a segment of a simulation in a worker process
+
+    :arguments: (key, description, setup, checkpoint, nrSteps) tuple, where setup contains the initial values, parameters,
+        seed, engine name, trace decimation and traced variables of the request and checkpoint is the state at the end
+        of the previous segment (None for the first segment)
+    :returns: (checkpoint, Pobject names, traced steps, traced values) tuple"""
+
+    key, description, setup, checkpoint, nrSteps = arguments
+    initialValues, parameters, seed, engineName, traceEvery, traceVariables = setup
+    system, defaultValues, defaultParameters = getWorkerModel(key, description)
+    names = [pobject.name for pobject in system.variables + system.enzymes]
+
+    # the cached P system is shared by all requests, so the whole state is set before each segment
+    system.setValues(defaultValues)
+    system.setParameters(defaultParameters)
+    system.setParameters(parameters)
+    system.rng = random.Random(seed)
+    if (checkpoint == None):
+        checkpoint = pep.Checkpoint()
+        checkpoint.modelKey = system.getModelKey()
+        values = system.getValues()
+        indexes = dict([(name, index) for index, name in reversed(list(enumerate(names)))])
+        for name, value in initialValues.items():
+            if (name not in indexes):
+                raise RuntimeError("Unknown variable '%s'" % name)
+            values[indexes[name]] = value
+        checkpoint.values = values
+        checkpoint.consumed = bytes(len(values))
+        checkpoint.rngState = system.rng.getstate()
+    system.restoreCheckpoint(checkpoint)
+
+    simulation = pep.Simulation(system, engineName)
+    # the Simulation seeds its own generator, which continues the state of the checkpoint
+    system.rng.setstate(checkpoint.rngState)
+    simulation.stepNr = checkpoint.step
+
+    columns = None
+    if (traceVariables != None):
+        columns = [simulation.handle(name) for name in traceVariables]
+    traceSteps = []
+    traceValues = []
+    # the initial state is traced as step 0
+    if (traceEvery > 0 and checkpoint.step == 0):
+        traceSteps.append(0)
+        traceValues.append(selectValues(simulation.getValues(), columns))
+
+    for stepNr in range(nrSteps):
+        simulation.step()
+        if (traceEvery > 0 and simulation.stepNr % traceEvery == 0):
+            traceSteps.append(simulation.stepNr)
+            traceValues.append(selectValues(simulation.getValues(), columns))
+
+    return system.getCheckpoint(simulation.stepNr, simulation.engine), names, traceSteps, traceValues
+# end runSegment()
+
+def selectValues(values, columns):
+    """:returns: the values at the given positions (all values if columns is None)"""
+
+    if (columns == None):
+        return values
+    return [values[column] for column in columns]
+# end selectValues()
+
+def sendRequest(address, request):
+    """Sends a request to a running service and returns its responses (a simple synchronous client)
+
+    :address: unix:PATH or tcp:HOST:PORT
+    :request: request (dictionary)
+    :returns: generator of response dictionaries, that ends after the final response"""
+
+    kind, separator, rest = address.partition(':')
+    if (kind == "unix"):
+        clientSocket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        clientSocket.connect(rest)
+    else:
+        host, separator, port = rest.rpartition(':')
+        clientSocket = socket.create_connection((host if host != "" else "127.0.0.1", int(port)))
+
+    with clientSocket, clientSocket.makefile("rwb") as stream:
+        stream.write(json.dumps(request).encode("utf-8") + b"\n")
+        stream.flush()
+        for line in stream:
+            response = json.loads(line)
+            yield response
+            if (response["event"] != "trace"):
+                break
+# end sendRequest()
+
+##########################################################################
+#   MAIN
+
+if (__name__ == "__main__"):
+    logging.basicConfig(format='%(levelname)s:%(message)s', level = logging.INFO if '-v' in sys.argv else logging.WARNING)
+
+    if ('-h' in sys.argv or '--help' in sys.argv):
+        print("Usage: pep_service.py [options]")
+        print("    [options] can be:")
+        print("        * --listen ADDR:      unix:PATH or tcp:HOST:PORT (default unix:pep_service.sock)")
+        print("        * --workers K:        number of worker processes (default: number of CPUs)")
+        print("        * --max-concurrent M: maximum number of simulations that run at the same time (default: number of workers)")
+        print("        * --max-models N:     number of models kept in memory by the service and by each worker (default 64)")
+        print("        * --segment S:        maximum number of simulation steps of each worker task (default 10000)")
+        print("        * --cache DIR:        directory of the model cache files of the workers")
+        print("        * -v:                 print progress messages")
+        exit(1)
+
+    try:
+        address = pep.getOptionValue(sys.argv, '--listen', str, "unix:pep_service.sock")
+        nrWorkers = pep.getOptionValue(sys.argv, '--workers', int, os.cpu_count())
+        maxConcurrent = pep.getOptionValue(sys.argv, '--max-concurrent', int)
+        maxModels = pep.getOptionValue(sys.argv, '--max-models', int, 64)
+        segmentSteps = pep.getOptionValue(sys.argv, '--segment', int, 10000)
+        cacheDirectory = pep.getOptionValue(sys.argv, '--cache')
+    except ValueError as e:
+        logging.error(str(e))
+        exit(1)
+    if (segmentSteps < 1):
+        logging.error("Expected a positive number after the '--segment' parameter")
+        exit(1)
+
+    async def main():
+        service = SimulationService(nrWorkers, maxConcurrent, maxModels, segmentSteps, cacheDirectory)
+        try:
+            await service.serve(address)
+        finally:
+            service.close()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+    except (OSError, RuntimeError) as e:
+        logging.error(str(e))
+        exit(1)
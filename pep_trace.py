@@ -0,0 +1,846 @@
+#!/usr/bin/python3
+
+"""Trace output for numerical P system simulations (see pep.py)
+
+CsvTraceWriter formats and writes csv rows on a background thread, optionally decimated, restricted to a subset of columns and compressed.
+
+TracedEngine runs simulation steps like NumericalPsystem.runSimulationStep() while recording activation, production, reset
+and distribution events through an EventTracer, as JSON lines. The untraced simulation does not pay for any of it.
+
+A binary trace file contains a header followed by fixed-width records, one for each recorded simulation step:
+
+    * header: magic string, format version, number of variables, number of enzymes, size of the header
+      and the Pobject names (variables followed by enzymes), padded to a multiple of 8 bytes
+    * record: the step number (int64) followed by the value of each Pobject (float64), all little-endian
+
+Because all records have the same size, the file can be memory-mapped and viewed as a 2D array without any parsing.
+
+A delta trace file (for large P systems in which few Pobjects change at each step) has the same header, with a different
+magic string, followed by variable-size records:
+
+    * record header: the step number (int64), the record type (uint8, 1 for keyframes and 0 for deltas)
+      and the number of values (uint32), all little-endian
+    * keyframe: the value of each Pobject (float64)
+    * delta: the indexes (uint32) of the Pobjects whose value changed since the previous record, followed by their new values (float64)
+
+A keyframe is written for the first recorded step and then every K records, so the state of any step is reconstructed by
+replaying the deltas that follow the nearest keyframe.
+The writers only use the standard library, while the readers require NumPy."""
+
+import array # for packing values as float64
+import bisect # for locating steps and keyframes in delta traces
+import gzip # for compressed csv output
+import io # for text streams over compressed files
+import json # for event records
+import mmap # for reading delta traces
+import queue # for passing steps to the csv writer thread
+import struct # for the file header and step numbers
+import sys # for byteorder
+import threading # for the csv writer thread
+
+##########################################################################
+# auxiliary definitions
+
+TRACE_MAGIC = b"PEPTRACE"
+TRACE_VERSION = 1
+# magic, version, nrVariables, nrEnzymes, headerSize, namesSize
+TRACE_HEADER = struct.Struct("<8sIIIII")
+
+DELTA_TRACE_MAGIC = b"PEPDELTA"
+# step, record type (DELTA_KEYFRAME or DELTA_CHANGES), number of values
+DELTA_RECORD_HEADER = struct.Struct("<qBI")
+DELTA_CHANGES = 0
+DELTA_KEYFRAME = 1
+# array type code of the uint32 indexes of delta records
+DELTA_INDEX_TYPECODE = "I" if array.array("I").itemsize == 4 else "L"
+# number of bytes of the packed values that are compared at once, in order to find the changed values
+DELTA_BLOCK_SIZE = 512
+
+##########################################################################
+# class definitions
+
+class CsvTraceWriter():
+
+    """Writes simulation steps into a .csv file from a background thread
+    Steps are passed through a bounded queue, so that formatting and writing do not stall the simulation loop
+    (the simulation only waits if the writer falls behind by more than queueSize steps)
+
+    :ivar str name: path of the csv file
+    :ivar int every: only every K-th simulation step is written (decimation), see NumericalPsystem.simulate()
+    :ivar list(int) variableColumns: positions (in the list of all Pobject values) of the written variables
+    :ivar list(int) enzymeColumns: positions (in the list of all Pobject values) of the written enzymes
+    :ivar str compression: None, 'gzip' or 'zstd'
+    """
+
+    def __init__(self, filename, variableNames, enzymeNames, every = 1, columns = None, compression = None, queueSize = 1024, bufferSize = 1 << 20,
+            resumeOffset = None):
+        """Opens the csv file, writes its header and starts the writer thread
+
+        :filename: path of the csv file
+        :variableNames: list of variable names
+        :enzymeNames: list of enzyme names
+        :every: only every K-th simulation step is written
+        :columns: list of variable / enzyme names that are written (None for all Pobjects)
+        :compression: None, 'gzip' or 'zstd' (requires the zstandard module)
+        :queueSize: maximum number of steps waiting to be written
+        :bufferSize: number of characters that are accumulated before each write
+        :resumeOffset: None to create the file or the size (see tell()) at which an existing file is truncated and continued (uncompressed only)"""
+
+        self.name = filename
+        self.every = every
+        self.compression = compression
+        self.bufferSize = bufferSize
+        self.error = None
+
+        nrVariables = len(variableNames)
+        if (columns == None):
+            self.variableColumns = list(range(nrVariables))
+            self.enzymeColumns = list(range(nrVariables, nrVariables + len(enzymeNames)))
+        else:
+            for name in columns:
+                if (name not in variableNames and name not in enzymeNames):
+                    raise RuntimeError("Unknown variable '%s' selected for csv output" % name)
+            self.variableColumns = [column for column, name in enumerate(variableNames) if name in columns]
+            self.enzymeColumns = [nrVariables + column for column, name in enumerate(enzymeNames) if name in columns]
+
+        if (resumeOffset != None):
+            if (compression != None):
+                raise RuntimeError("Compressed csv files cannot be resumed")
+            truncateFile(filename, resumeOffset)
+            self.file = open(filename, mode="a", buffering=bufferSize)
+        else:
+            self.file = openTextFile(filename, compression, bufferSize)
+            self.file.write("PeP csv output. Format = STEP_NR VARIABLE_COLUMNS EMPTY_COLUMN ENZYME_COLUMNS\n")
+            self.file.write("step, %s, ,%s\n" % (
+                    ", ".join([variableNames[column] for column in self.variableColumns]),
+                    ", ".join([enzymeNames[column - nrVariables] for column in self.enzymeColumns])))
+
+        self.queue = queue.Queue(maxsize = queueSize)
+        self.thread = threading.Thread(target = self.writeLoop, name = "pep csv writer", daemon = True)
+        self.thread.start()
+
+    def writeStep(self, step, values):
+        """Queues the values of a simulation step for writing
+
+        :step: the step number
+        :values: list of Pobject values (variables followed by enzymes); the list must not be modified afterwards"""
+
+        if (self.error != None):
+            raise RuntimeError("csv writer failed: %s" % self.error)
+        self.queue.put((step, values))
+    # end writeStep()
+
+    def writeLoop(self):
+        """Formats and writes queued steps until None is received (runs on the writer thread)"""
+
+        variableColumns = self.variableColumns
+        enzymeColumns = self.enzymeColumns
+        lines = []
+        nrCharacters = 0
+
+        while (True):
+            item = self.queue.get()
+            try:
+                if (item == None or type(item) == threading.Event):
+                    if (len(lines) > 0):
+                        self.file.write("".join(lines))
+                        lines = []
+                        nrCharacters = 0
+                    self.file.flush()
+                    if (item == None):
+                        return
+                    item.set()
+                    continue
+
+                step, values = item
+                line = "%d, %s, ,%s\n" % (
+                        step,
+                        ", ".join([str(values[column]) for column in variableColumns]),
+                        ", ".join([str(values[column]) for column in enzymeColumns]))
+                lines.append(line)
+                nrCharacters += len(line)
+                if (nrCharacters >= self.bufferSize):
+                    self.file.write("".join(lines))
+                    lines = []
+                    nrCharacters = 0
+
+            except Exception as e:
+                # keep consuming the queue so that the simulation does not block; the error is reported by writeStep() / close()
+                self.error = e
+                if (type(item) == threading.Event):
+                    item.set()
+                elif (item == None):
+                    return
+            finally:
+                self.queue.task_done()
+    # end writeLoop()
+
+    def flush(self):
+        """Waits until all queued steps are written to the file"""
+
+        flushed = threading.Event()
+        self.queue.put(flushed)
+        flushed.wait()
+        if (self.error != None):
+            raise RuntimeError("csv writer failed: %s" % self.error)
+    # end flush()
+
+    def tell(self):
+        """Writes all queued steps and returns the size of the file (stored in checkpoints, see resumeOffset)
+
+        :returns: size in bytes"""
+
+        if (self.compression != None):
+            raise RuntimeError("Compressed csv files cannot be resumed")
+        self.flush()
+        # the writer thread is idle until the next step is queued
+        self.file.flush()
+        return self.file.tell()
+    # end tell()
+
+    def close(self):
+        """Writes all queued steps, stops the writer thread and closes the file"""
+
+        if (self.thread.is_alive()):
+            self.queue.put(None)
+            self.thread.join()
+        if (not self.file.closed):
+            self.file.close()
+        if (self.error != None):
+            raise RuntimeError("csv writer failed: %s" % self.error)
+    # end close()
+# end class CsvTraceWriter
+
+class BinaryTraceWriter():
+
+    """Writes simulation steps as fixed-width binary records that are buffered and written in chunks
+
+    :ivar str name: path of the trace file
+    :ivar int nrColumns: number of values in each record
+    :ivar int chunkSteps: number of records that are buffered before being written to the file
+    """
+
+    def __init__(self, filename, variableNames, enzymeNames, chunkSteps = 256, resumeOffset = None):
+        """Creates the trace file and writes its header
+
+        :filename: path of the trace file
+        :variableNames: list of variable names
+        :enzymeNames: list of enzyme names
+        :chunkSteps: number of records that are buffered before being written to the file
+        :resumeOffset: None to create the file or the size (see tell()) at which an existing trace file is truncated and continued"""
+
+        self.name = filename
+        self.nrColumns = len(variableNames) + len(enzymeNames)
+        self.chunkSteps = chunkSteps
+        self.buffer = bytearray()
+        self.nrBufferedSteps = 0
+
+        header = encodeHeader(variableNames, enzymeNames)
+        if (resumeOffset != None):
+            with open(filename, mode="rb") as traceFile:
+                if (traceFile.read(len(header)) != header):
+                    raise RuntimeError("Trace file %s was not written for this P system" % filename)
+            truncateFile(filename, resumeOffset)
+            self.file = open(filename, mode="ab")
+        else:
+            self.file = open(filename, mode="wb")
+            self.file.write(header)
+
+    def writeStep(self, step, values):
+        """Appends the values of a simulation step
+
+        :step: the step number
+        :values: sequence of Pobject values (variables followed by enzymes)"""
+
+        if (len(values) != self.nrColumns):
+            raise RuntimeError("Expected %d values for step %d, got %d" % (self.nrColumns, step, len(values)))
+
+        self.buffer += struct.pack("<q", step)
+        packedValues = array.array("d", values)
+        if (sys.byteorder != "little"):
+            packedValues.byteswap()
+        self.buffer += packedValues.tobytes()
+
+        self.nrBufferedSteps += 1
+        if (self.nrBufferedSteps >= self.chunkSteps):
+            self.flush()
+    # end writeStep()
+
+    def flush(self):
+        """Writes all buffered records to the file"""
+
+        self.file.write(self.buffer)
+        self.file.flush()
+        self.buffer = bytearray()
+        self.nrBufferedSteps = 0
+    # end flush()
+
+    def tell(self):
+        """Writes all buffered records and returns the size of the file (stored in checkpoints, see resumeOffset)
+
+        :returns: size in bytes"""
+
+        self.flush()
+        return self.file.tell()
+    # end tell()
+
+    def close(self):
+        """Writes the remaining records and closes the file"""
+
+        if (not self.file.closed):
+            self.flush()
+            self.file.close()
+    # end close()
+# end class BinaryTraceWriter
+
+class DeltaTraceWriter(BinaryTraceWriter):
+
+    """Writes simulation steps as delta records (the Pobjects whose value changed since the previous step) and periodic keyframes
+    (see the description of delta trace files above); records are buffered and written in chunks
+
+    :ivar int keyframeEvery: maximum number of records between two keyframes
+    :ivar int nrRecordsSinceKeyframe: number of records written after the last keyframe
+    :ivar bytes previousValues: packed values (float64) of the previous record (None before the first record)
+    """
+
+    def __init__(self, filename, variableNames, enzymeNames, keyframeEvery = 1000, chunkSteps = 256, resumeOffset = None):
+        """Creates the trace file and writes its header
+
+        :filename: path of the trace file
+        :variableNames: list of variable names
+        :enzymeNames: list of enzyme names
+        :keyframeEvery: maximum number of records between two keyframes
+        :chunkSteps: number of records that are buffered before being written to the file
+        :resumeOffset: None to create the file or the size (see tell()) at which an existing trace file is truncated and continued
+            (the first record after resuming is a keyframe)"""
+
+        self.name = filename
+        self.nrColumns = len(variableNames) + len(enzymeNames)
+        self.chunkSteps = chunkSteps
+        self.keyframeEvery = keyframeEvery
+        self.buffer = bytearray()
+        self.nrBufferedSteps = 0
+        self.nrRecordsSinceKeyframe = 0
+        self.previousValues = None
+
+        header = encodeHeader(variableNames, enzymeNames, DELTA_TRACE_MAGIC)
+        if (resumeOffset != None):
+            with open(filename, mode="rb") as traceFile:
+                if (traceFile.read(len(header)) != header):
+                    raise RuntimeError("Delta trace file %s was not written for this P system" % filename)
+            truncateFile(filename, resumeOffset)
+            self.file = open(filename, mode="ab")
+        else:
+            self.file = open(filename, mode="wb")
+            self.file.write(header)
+
+    def writeStep(self, step, values):
+        """Appends a keyframe or the values of the Pobjects that changed since the previous step
+
+        :step: the step number
+        :values: sequence of Pobject values (variables followed by enzymes)"""
+
+        if (len(values) != self.nrColumns):
+            raise RuntimeError("Expected %d values for step %d, got %d" % (self.nrColumns, step, len(values)))
+
+        packedValues = array.array("d", values)
+        data = packedValues.tobytes()
+        previous = self.previousValues
+        changed = None
+        if (previous != None and self.nrRecordsSinceKeyframe < self.keyframeEvery):
+            # the packed values are compared (bit for bit) in blocks and only the blocks that differ are compared value by value
+            changed = []
+            if (data != previous):
+                for start in range(0, len(data), DELTA_BLOCK_SIZE):
+                    stop = start + DELTA_BLOCK_SIZE
+                    if (data[start:stop] != previous[start:stop]):
+                        changed.extend([index for index in range(start // 8, min(stop, len(data)) // 8)
+                            if data[8 * index:8 * index + 8] != previous[8 * index:8 * index + 8]])
+            # a delta that is larger than a keyframe is written as a keyframe
+            if (len(changed) * 12 >= self.nrColumns * 8):
+                changed = None
+        self.previousValues = data
+
+        if (changed == None):
+            self.buffer += DELTA_RECORD_HEADER.pack(step, DELTA_KEYFRAME, self.nrColumns)
+            self.nrRecordsSinceKeyframe = 0
+        else:
+            self.buffer += DELTA_RECORD_HEADER.pack(step, DELTA_CHANGES, len(changed))
+            self.nrRecordsSinceKeyframe += 1
+            indexes = array.array(DELTA_INDEX_TYPECODE, changed)
+            packedValues = array.array("d", [packedValues[index] for index in changed])
+            if (sys.byteorder != "little"):
+                indexes.byteswap()
+            self.buffer += indexes.tobytes()
+
+        if (sys.byteorder != "little"):
+            packedValues = array.array("d", packedValues)
+            packedValues.byteswap()
+        self.buffer += packedValues.tobytes()
+
+        self.nrBufferedSteps += 1
+        if (self.nrBufferedSteps >= self.chunkSteps):
+            self.flush()
+    # end writeStep()
+# end class DeltaTraceWriter
+
+class BinaryTraceReader():
+
+    """Memory-maps a binary trace file and provides NumPy views of its records
+
+    :ivar str name: path of the trace file
+    :ivar list(str) names: Pobject names (variables followed by enzymes)
+    :ivar int nrVariables: number of variables (the first nrVariables columns), the rest are enzymes
+    :ivar ndarray steps: step number of each record (view of the file)
+    :ivar ndarray values: (nrRecords x nrColumns) array of values (view of the file)
+    """
+
+    def __init__(self, filename):
+        """Reads the header and memory-maps the records of a trace file
+
+        :filename: path of the trace file"""
+
+        import numpy as np # for memory-mapping the records
+
+        self.name = filename
+        with open(filename, mode="rb") as traceFile:
+            self.names, self.nrVariables, headerSize = decodeHeader(traceFile.read(TRACE_HEADER.size), traceFile)
+            traceFile.seek(0, 2)
+            fileSize = traceFile.tell()
+
+        self.columns = {name: column for column, name in reversed(list(enumerate(self.names)))}
+        recordType = np.dtype([("step", "<i8"), ("values", "<f8", (len(self.names),))])
+        # an incomplete last record (e.g. of an interrupted simulation) is ignored
+        nrRecords = (fileSize - headerSize) // recordType.itemsize
+
+        if (nrRecords > 0):
+            self.records = np.memmap(filename, dtype=recordType, mode="r", offset=headerSize, shape=(nrRecords,))
+        else:
+            self.records = np.zeros(0, dtype=recordType)
+        self.steps = self.records["step"]
+        self.values = self.records["values"]
+
+    def __len__(self):
+        return len(self.records)
+
+    def getColumns(self, names):
+        """Returns the column numbers of several Pobjects
+
+        :names: list of Pobject names
+        :returns: list of column numbers"""
+
+        for name in names:
+            if (name not in self.columns):
+                raise KeyError("Unknown variable '%s' in trace file %s" % (name, self.name))
+        return [self.columns[name] for name in names]
+    # end getColumns()
+
+    def read(self, startStep = None, stopStep = None, names = None):
+        """Returns the values of a range of steps, optionally restricted to a subset of Pobjects
+        Step ranges are located using the step index (binary search) and are returned as views of the file;
+        a subset of Pobjects is a view if the columns are consecutive and a copy otherwise
+
+        :startStep: first step of the range (None for the first recorded step)
+        :stopStep: last step of the range, inclusive (None for the last recorded step)
+        :names: list of Pobject names (None for all Pobjects)
+        :returns: (steps, values) - array of step numbers and (nrSteps x nrNames) array of values"""
+
+        start = 0 if startStep == None else int(self.steps.searchsorted(startStep, side="left"))
+        stop = len(self.steps) if stopStep == None else int(self.steps.searchsorted(stopStep, side="right"))
+        steps = self.steps[start:stop]
+        values = self.values[start:stop]
+
+        if (names != None):
+            columns = self.getColumns(names)
+            if (len(columns) > 0 and columns == list(range(columns[0], columns[0] + len(columns)))):
+                values = values[:, columns[0]:columns[0] + len(columns)]
+            else:
+                values = values[:, columns]
+
+        return steps, values
+    # end read()
+
+    def close(self):
+        """Releases the memory map"""
+
+        mmap = getattr(self.records, "_mmap", None)
+        self.steps = self.values = self.records = None
+        if (mmap != None):
+            mmap.close()
+    # end close()
+# end class BinaryTraceReader
+
+class DeltaTraceReader():
+
+    """Reads a delta trace file (see DeltaTraceWriter): the records are indexed once, when the file is opened,
+    and the values of a range of steps are reconstructed starting from the nearest keyframe
+
+    :ivar str name: path of the trace file
+    :ivar list(str) names: Pobject names (variables followed by enzymes)
+    :ivar int nrVariables: number of variables (the first nrVariables columns), the rest are enzymes
+    :ivar list steps: step number of each record
+    :ivar list offsets: offset (in the file) of each record
+    :ivar list keyframes: record numbers of the keyframes
+    """
+
+    def __init__(self, filename):
+        """Reads the header and indexes the records of a delta trace file
+
+        :filename: path of the trace file"""
+
+        self.name = filename
+        with open(filename, mode="rb") as traceFile:
+            self.names, self.nrVariables, headerSize = decodeHeader(traceFile.read(TRACE_HEADER.size), traceFile, DELTA_TRACE_MAGIC)
+            self.data = mmap.mmap(traceFile.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.columns = {name: column for column, name in reversed(list(enumerate(self.names)))}
+        self.steps = []
+        self.offsets = []
+        self.keyframes = []
+        offset = headerSize
+        while (offset + DELTA_RECORD_HEADER.size <= len(self.data)):
+            step, recordType, nrValues = DELTA_RECORD_HEADER.unpack_from(self.data, offset)
+            recordSize = DELTA_RECORD_HEADER.size + nrValues * (8 if recordType == DELTA_KEYFRAME else 12)
+            # an incomplete last record (e.g. of an interrupted simulation) is ignored
+            if (offset + recordSize > len(self.data)):
+                break
+            if (recordType == DELTA_KEYFRAME):
+                self.keyframes.append(len(self.steps))
+            self.steps.append(step)
+            self.offsets.append(offset)
+            offset += recordSize
+
+    def __len__(self):
+        return len(self.steps)
+
+    def getColumns(self, names):
+        """Returns the column numbers of several Pobjects
+
+        :names: list of Pobject names
+        :returns: list of column numbers"""
+
+        for name in names:
+            if (name not in self.columns):
+                raise KeyError("Unknown variable '%s' in trace file %s" % (name, self.name))
+        return [self.columns[name] for name in names]
+    # end getColumns()
+
+    def read(self, startStep = None, stopStep = None, names = None):
+        """Returns the values of a range of steps, optionally restricted to a subset of Pobjects
+        The deltas are replayed from the last keyframe before the first step of the range
+
+        :startStep: first step of the range (None for the first recorded step)
+        :stopStep: last step of the range, inclusive (None for the last recorded step)
+        :names: list of Pobject names (None for all Pobjects)
+        :returns: (steps, values) - array of step numbers and (nrSteps x nrNames) array of values"""
+
+        import numpy as np # for reconstructing the values
+
+        start = 0 if startStep == None else bisect.bisect_left(self.steps, startStep)
+        stop = len(self.steps) if stopStep == None else bisect.bisect_right(self.steps, stopStep)
+        columns = None if names == None else self.getColumns(names)
+        values = np.empty((max(stop - start, 0), len(self.names) if columns == None else len(columns)))
+        if (stop <= start):
+            return np.array(self.steps[start:stop], dtype=np.int64), values
+
+        keyframeNr = bisect.bisect_right(self.keyframes, start) - 1
+        if (keyframeNr < 0):
+            raise RuntimeError("Delta trace file %s does not start with a keyframe" % self.name)
+
+        state = np.zeros(len(self.names))
+        for recordNr in range(self.keyframes[keyframeNr], stop):
+            offset = self.offsets[recordNr]
+            step, recordType, nrValues = DELTA_RECORD_HEADER.unpack_from(self.data, offset)
+            offset += DELTA_RECORD_HEADER.size
+            if (recordType == DELTA_KEYFRAME):
+                state[:] = np.frombuffer(self.data, dtype="<f8", count=nrValues, offset=offset)
+            elif (nrValues > 0):
+                indexes = np.frombuffer(self.data, dtype="<u4", count=nrValues, offset=offset)
+                state[indexes] = np.frombuffer(self.data, dtype="<f8", count=nrValues, offset=offset + 4 * nrValues)
+            if (recordNr >= start):
+                values[recordNr - start] = state if columns == None else state[columns]
+
+        return np.array(self.steps[start:stop], dtype=np.int64), values
+    # end read()
+
+    def getState(self, step):
+        """Returns the values of all Pobjects at a step (the last recorded step before it, if it was not recorded)
+
+        :step: the step number
+        :returns: array of values"""
+
+        recordNr = bisect.bisect_right(self.steps, step) - 1
+        if (recordNr < 0):
+            raise KeyError("Step %d is not recorded in trace file %s" % (step, self.name))
+        return self.read(self.steps[recordNr], self.steps[recordNr])[1][-1]
+    # end getState()
+
+    def close(self):
+        """Releases the memory map"""
+
+        self.data.close()
+    # end close()
+# end class DeltaTraceReader
+
+class EventTracer():
+
+    """Writes simulation events as JSON lines (one object per line, with at least the 'step' and 'event' keys)
+
+    :ivar str name: path of the events file
+    """
+
+    def __init__(self, filename, bufferSize = 1 << 20, resumeOffset = None):
+        """Creates (or continues) an events file
+
+        :filename: path of the file
+        :bufferSize: size of the write buffer
+        :resumeOffset: None to create the file or the size (see tell()) at which an existing events file is truncated and continued"""
+
+        self.name = filename
+        if (resumeOffset != None):
+            truncateFile(filename, resumeOffset)
+            self.file = open(filename, mode="a", buffering=bufferSize)
+        else:
+            self.file = open(filename, mode="w", buffering=bufferSize)
+
+    def emit(self, step, event, **fields):
+        """Writes one event record
+
+        :step: the simulation step number
+        :event: the event type (activation, production, reset or distribution)
+        :fields: event-specific fields (must be JSON serializable)"""
+
+        record = {"step": step, "event": event}
+        record.update(fields)
+        self.file.write(json.dumps(record))
+        self.file.write("\n")
+    # end emit()
+
+    def tell(self):
+        """Writes all buffered events and returns the size of the file (stored in checkpoints, see resumeOffset)
+
+        :returns: size in bytes"""
+
+        self.file.flush()
+        return self.file.tell()
+    # end tell()
+
+    def close(self):
+        self.file.close()
+# end class EventTracer
+
+class TracedEngine():
+
+    """Simulation engine that runs the steps of a P system exactly like NumericalPsystem.runSimulationStep()
+    (including the random choice of programs) and records each step through an EventTracer:
+
+        * activation: {membrane, program, enzyme, active} for each program of an enzymatic membrane
+        * production: {membrane, program, value} for each executed program
+        * reset: {name, value} for each consumed variable / enzyme (value before the reset)
+        * distribution: {membrane, program, value, targets: [[name, amount], ...]} for each executed program
+
+    :ivar NumericalPsystem system: the simulated P system
+    :ivar EventTracer tracer: destination of the events
+    :ivar int step: number of the current simulation step
+    """
+
+    def __init__(self, system, tracer, startStep = 0):
+        """:system: the simulated P system
+        :tracer: EventTracer object
+        :startStep: number of simulation steps that were already run (e.g. when resuming from a checkpoint)"""
+
+        self.system = system
+        self.tracer = tracer
+        self.step = startStep
+
+    def runSimulationStep(self):
+        """Runs 1 simulation step and records its events"""
+
+        system = self.system
+        emit = self.tracer.emit
+        self.step += 1
+        step = self.step
+        system.sharedValues.clear()
+
+        # production phase for all membranes
+        for membraneName in system.H:
+            membrane = system.membranes[membraneName]
+            if (len(membrane.programs) < 1):
+                continue
+
+            # if this membrane does not use enzymes
+            if (len(membrane.enzymes) == 0):
+                membrane.chosenProgramNr = 0 if len(membrane.programs) == 1 else system.rng.randint(0, len(membrane.programs) - 1)
+                membrane.newValue = membrane.programs[membrane.chosenProgramNr].prodFunction.compiledFunction()
+                emit(step, "production", membrane=membraneName, program=membrane.chosenProgramNr, value=membrane.newValue)
+            else:
+                membrane.chosenProgramNr = []
+                for prgNr, prg in enumerate(membrane.programs):
+                    active = prg.isActivatedByEnzyme()
+                    emit(step, "activation", membrane=membraneName, program=prgNr, enzyme=prg.enzyme.name if prg.enzyme != None else None, active=active)
+                    if (active):
+                        membrane.chosenProgramNr.append(prgNr)
+                membrane.newValue = []
+                for prgNr in membrane.chosenProgramNr:
+                    membrane.newValue.append(membrane.programs[prgNr].prodFunction.compiledFunction())
+                    emit(step, "production", membrane=membraneName, program=prgNr, value=membrane.newValue[-1])
+
+        # reset phase for all variables and enzymes
+        for pobject in system.variables + system.enzymes:
+            if (pobject.wasConsumed):
+                emit(step, "reset", name=pobject.name, value=pobject.value)
+                if (pobject.value != 0):
+                    for membrane in pobject.watchers:
+                        membrane.activationDirty = True
+                pobject.value = 0
+                pobject.wasConsumed = False
+
+        # distribution phase for all membranes
+        for membraneName in system.H:
+            membrane = system.membranes[membraneName]
+            if (len(membrane.programs) < 1):
+                continue
+
+            if (type(membrane.chosenProgramNr) == int):
+                executed = [(membrane.chosenProgramNr, membrane.newValue)]
+            else:
+                executed = zip(membrane.chosenProgramNr, membrane.newValue)
+
+            for prgNr, newValue in executed:
+                distribFunction = membrane.programs[prgNr].distribFunction
+                emit(step, "distribution", membrane=membraneName, program=prgNr, value=newValue,
+                        targets=[[distribRule.variable.name, (distribRule.proportion / distribFunction.proportionTotal) * newValue] for distribRule in distribFunction])
+                distribFunction.distribute(newValue)
+    # end runSimulationStep()
+
+    def getValues(self):
+        return self.system.getValues()
+
+    def syncToSystem(self):
+        """The P system is simulated in place, so there is nothing to synchronize"""
+        pass
+# end class TracedEngine
+
+##########################################################################
+# auxiliary functions
+
+def openTextFile(filename, compression = None, bufferSize = 1 << 20):
+    """Opens a text file for writing, optionally using streaming compression
+
+    :filename: path of the file
+    :compression: None, 'gzip' or 'zstd' (requires the zstandard module)
+    :bufferSize: size of the write buffer
+    :returns: text file object"""
+
+    if (compression == None):
+        return open(filename, mode="w", buffering=bufferSize)
+
+    elif (compression == "gzip"):
+        # a lower compression level keeps compression from becoming the bottleneck
+        return io.TextIOWrapper(io.BufferedWriter(gzip.open(filename, mode="wb", compresslevel=6), buffer_size=bufferSize))
+
+    elif (compression == "zstd"):
+        try:
+            import zstandard # zstd streaming compression
+        except ImportError:
+            raise RuntimeError("zstd compression requires the zstandard module")
+        rawFile = open(filename, mode="wb")
+        return io.TextIOWrapper(io.BufferedWriter(zstandard.ZstdCompressor().stream_writer(rawFile, closefd=True), buffer_size=bufferSize))
+
+    raise RuntimeError("Unknown compression '%s'; expected gzip or zstd" % compression)
+# end openTextFile()
+
+def truncateFile(filename, size):
+    """Discards the end of a file that is continued (e.g. steps written after the checkpoint that a simulation is resumed from)
+
+    :filename: path of the file
+    :size: new size in bytes"""
+
+    with open(filename, mode="r+b") as truncatedFile:
+        truncatedFile.seek(0, 2)
+        if (truncatedFile.tell() < size):
+            raise RuntimeError("File %s is shorter than expected (%d bytes)" % (filename, size))
+        truncatedFile.truncate(size)
+# end truncateFile()
+
+def encodeHeader(variableNames, enzymeNames, magic = TRACE_MAGIC):
+    """Constructs the header of a trace file
+
+    :variableNames: list of variable names
+    :enzymeNames: list of enzyme names
+    :magic: TRACE_MAGIC for binary traces or DELTA_TRACE_MAGIC for delta traces
+    :returns: bytes"""
+
+    names = "\n".join(list(variableNames) + list(enzymeNames)).encode("utf-8")
+    headerSize = TRACE_HEADER.size + len(names)
+    # records start at a multiple of 8 bytes
+    padding = (8 - headerSize % 8) % 8
+    headerSize += padding
+
+    return TRACE_HEADER.pack(magic, TRACE_VERSION, len(variableNames), len(enzymeNames), headerSize, len(names)) + names + b"\0" * padding
+# end encodeHeader()
+
+def decodeHeader(data, traceFile, expectedMagic = TRACE_MAGIC):
+    """Decodes the header of a trace file
+
+    :data: the first TRACE_HEADER.size bytes of the file
+    :traceFile: file object positioned after data, used to read the names
+    :expectedMagic: TRACE_MAGIC for binary traces or DELTA_TRACE_MAGIC for delta traces
+    :returns: (names, nrVariables, headerSize) tuple"""
+
+    if (len(data) < TRACE_HEADER.size):
+        raise RuntimeError("%s is not a PeP trace file (file too short)" % traceFile.name)
+    magic, version, nrVariables, nrEnzymes, headerSize, namesSize = TRACE_HEADER.unpack(data)
+    if (magic != expectedMagic):
+        if (magic in (TRACE_MAGIC, DELTA_TRACE_MAGIC)):
+            raise RuntimeError("%s is a PeP %s trace file" % (traceFile.name, "delta" if magic == DELTA_TRACE_MAGIC else "binary"))
+        raise RuntimeError("%s is not a PeP trace file" % traceFile.name)
+    if (version != TRACE_VERSION):
+        raise RuntimeError("Unsupported trace file version %d in %s" % (version, traceFile.name))
+
+    names = traceFile.read(namesSize).decode("utf-8").split("\n") if namesSize > 0 else []
+    if (len(names) != nrVariables + nrEnzymes):
+        raise RuntimeError("Corrupted header in trace file %s" % traceFile.name)
+
+    return names, nrVariables, headerSize
+# end decodeHeader()
+
+def openTraceReader(filename):
+    """Opens a binary or a delta trace file, depending on its magic string
+
+    :filename: path of the trace file
+    :returns: BinaryTraceReader or DeltaTraceReader"""
+
+    with open(filename, mode="rb") as traceFile:
+        magic = traceFile.read(len(DELTA_TRACE_MAGIC))
+    if (magic == DELTA_TRACE_MAGIC):
+        return DeltaTraceReader(filename)
+    return BinaryTraceReader(filename)
+# end openTraceReader()
+
+##########################################################################
+#   MAIN
+
+if (__name__ == "__main__"):
+    # print (a part of) a trace file in csv format
+    import pep # for getOptionValue()
+
+    if (len(sys.argv) < 2):
+        print("Usage: pep_trace.py TRACE_FILE [options] (binary or delta trace file)")
+        print("    [options] can be:")
+        print("        * --steps A:B:   print only steps A to B (inclusive)")
+        print("        * --vars X,Y:    print only these variables / enzymes")
+        exit(1)
+
+    try:
+        stepRange = pep.getOptionValue(sys.argv, '--steps', lambda value: [int(step) if step != "" else None for step in value.split(':')], [None, None])
+        names = pep.getOptionValue(sys.argv, '--vars', lambda value: value.split(','))
+    except ValueError as e:
+        print(str(e))
+        exit(1)
+
+    reader = openTraceReader(sys.argv[1])
+    steps, values = reader.read(stepRange[0], stepRange[-1], names)
+    print("step, %s" % ", ".join(reader.names if names == None else names))
+    for step, row in zip(steps.tolist(), values.tolist()):
+        print("%d, %s" % (step, ", ".join([str(value) for value in row])))
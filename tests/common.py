@@ -0,0 +1,96 @@
+"""Test models and helpers shared by the test modules
+
+The simulator is imported inside the helpers, so that record_golden.py can load the original pep.py instead"""
+
+import glob # for listing the test models
+import os # for paths
+import random # for seeding the choice of programs
+
+##########################################################################
+# auxiliary definitions
+
+# seed of the random choice of programs
+SEED = 3
+
+# number of simulation steps compared between engines (input_example_2.pep overflows at step 14)
+NR_STEPS = 10
+
+# number of simulation steps recorded in the golden files
+NR_GOLDEN_STEPS = 30
+
+testsDirectory = os.path.dirname(os.path.abspath(__file__))
+repositoryDirectory = os.path.dirname(testsDirectory)
+goldenDirectory = os.path.join(testsDirectory, "golden")
+
+# example input files (input.pep is an example of an invalid input file) and generated models
+modelFiles = sorted([filename for filename in glob.glob(os.path.join(repositoryDirectory, "input_files", "*.pep"))
+        if os.path.basename(filename) != "input.pep"]) + sorted(glob.glob(os.path.join(testsDirectory, "models", "*.pep")))
+
+# generated model that uses all kinds of production function terms, enzymes and random choices of programs
+generatedModelFile = os.path.join(testsDirectory, "models", "generated.pep")
+
+##########################################################################
+# auxiliary functions
+
+def modelId(filename):
+    """:returns: the name used for a model in test ids and golden files"""
+
+    return os.path.splitext(os.path.basename(filename))[0]
+# end modelId()
+
+def goldenFileName(filename):
+    """:returns: path of the golden file of a model"""
+
+    return os.path.join(goldenDirectory, modelId(filename) + ".json")
+# end goldenFileName()
+
+def readModel(filename):
+    """Parses a model and seeds its choice of programs with SEED
+
+    :filename: path of the input file
+    :returns: NumericalPsystem object"""
+
+    import pep # the simulator
+
+    system = pep.readInputFile(filename)
+    system.rng = random.Random(SEED)
+    return system
+# end readModel()
+
+def runReference(filename, nrSteps = NR_STEPS):
+    """Simulates a model using NumericalPsystem.runSimulationStep()
+
+    :filename: path of the input file
+    :nrSteps: number of simulation steps
+    :returns: list of the values of all Pobjects after each step"""
+
+    system = readModel(filename)
+    trajectory = []
+    for step in range(nrSteps):
+        system.runSimulationStep()
+        trajectory.append(system.getValues())
+
+    return trajectory
+# end runReference()
+
+def runSimulation(filename, engineName, optimize = False, nrSteps = NR_STEPS):
+    """Simulates a model step by step using pep.Simulation
+
+    :filename: path of the input file
+    :engineName: name of the simulation engine (see pep.engineNames)
+    :optimize: True / False - whether or not to optimize the production functions first
+    :nrSteps: number of simulation steps
+    :returns: list of the values of all Pobjects after each step"""
+
+    import pep # the simulator
+
+    simulation = pep.Simulation.fromFile(filename, engineName, SEED)
+    if (optimize):
+        simulation.system.compile(optimize = True)
+    trajectory = []
+    for step in range(nrSteps):
+        simulation.step()
+        trajectory.append(list(simulation.getValues()))
+
+    return trajectory
+# end runSimulation()
@@ -0,0 +1,6 @@
+"""pytest configuration: the simulator modules are imported from the repository directory"""
+
+import os # for paths
+import sys # for the module search path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,45 @@
+#!/usr/bin/python3
+
+"""Records the expected trajectories (golden files) of the test models, using the original simulator
+
+The golden files in tests/golden were recorded with the pep.py of the first commit of the repository, whose
+runSimulationStep() is the reference algorithm, so that the optimized python engine is checked against it:
+    git show $(git rev-list --max-parents=0 HEAD):pep.py > /tmp/baseline/pep.py
+    python3 tests/record_golden.py /tmp/baseline"""
+
+import importlib # for loading the original pep.py
+import json # for the golden files
+import logging # for logging functions
+import os # for paths
+import random # for seeding the original simulator
+import sys # for argv
+
+import common # test models and golden file names
+
+if (__name__ == "__main__"):
+    if (len(sys.argv) != 2):
+        print("Usage: record_golden.py DIRECTORY_OF_ORIGINAL_PEP_PY")
+        exit(1)
+
+    logging.basicConfig(level=logging.ERROR)
+    sys.path.insert(0, os.path.abspath(sys.argv[1]))
+    pep = importlib.import_module("pep")
+
+    os.makedirs(common.goldenDirectory, exist_ok = True)
+    for filename in common.modelFiles:
+        system = pep.readInputFile(filename)
+        # the original simulator chooses programs using the random module
+        random.seed(common.SEED)
+        golden = {"seed": common.SEED, "trajectory": [], "error": None}
+        for step in range(1, common.NR_GOLDEN_STEPS + 1):
+            try:
+                system.runSimulationStep()
+            except ArithmeticError as e:
+                golden["error"] = {"step": step, "type": type(e).__name__}
+                break
+            golden["trajectory"].append([pobject.value for pobject in system.variables + system.enzymes])
+
+        with open(common.goldenFileName(filename), "w") as goldenFile:
+            json.dump(golden, goldenFile)
+            goldenFile.write("\n")
+        print("recorded %s (%d steps)" % (os.path.relpath(common.goldenFileName(filename), common.repositoryDirectory), len(golden["trajectory"])))
@@ -0,0 +1,63 @@
+"""Tests of the compiled model cache (pep.readInputFileCached())"""
+
+import os # for paths
+import pickle # for writing forged cache files
+import random # for the random number generator of the P system
+
+import pytest
+
+import common # test models and helpers
+import pep # the simulator
+
+class Forged():
+    """Object whose unpickling runs a shell command"""
+
+    def __init__(self, command):
+        self.command = command
+
+    def __reduce__(self):
+        return (os.system, (self.command,))
+# end class Forged
+
+def readCacheKey(filename):
+    with open(filename, "rb") as inputFile:
+        return pep.getModelCacheKey(inputFile.read())
+
+@pytest.mark.parametrize("filename", common.modelFiles, ids = common.modelId)
+def test_cached_model_matches_parsed_model(tmp_path, filename, monkeypatch):
+    cacheDirectory = str(tmp_path / "cache")
+    expected = common.runReference(filename)
+    pep.readInputFileCached(filename, cacheDirectory)
+    assert os.listdir(cacheDirectory) == [readCacheKey(filename) + pep.CACHE_EXTENSION]
+
+    # the second read is served from the cache file, without parsing
+    def parse(*arguments):
+        raise AssertionError("the model was parsed again")
+    monkeypatch.setattr(pep, "readInputString", parse)
+    system = pep.readInputFileCached(filename, cacheDirectory)
+    system.rng = random.Random(common.SEED)
+
+    trajectory = []
+    for step in range(common.NR_STEPS):
+        system.runSimulationStep()
+        trajectory.append(system.getValues())
+    assert trajectory == expected
+
+def test_cache_file_of_other_input_is_ignored(tmp_path):
+    cacheFileName = str(tmp_path / "model.pepc")
+    pep.writeModelCache(pep.readInputFile(common.generatedModelFile), cacheFileName, readCacheKey(common.generatedModelFile))
+
+    assert pep.readModelCache(cacheFileName, "0" * 64) == None
+    assert pep.readModelCache(cacheFileName, readCacheKey(common.generatedModelFile)) != None
+
+def test_forged_cache_file_is_rejected(tmp_path, caplog):
+    cacheFileName = str(tmp_path / "model.pepc")
+    markerFileName = str(tmp_path / "marker")
+    key = readCacheKey(common.generatedModelFile)
+    with open(cacheFileName, "wb") as cacheFile:
+        cacheFile.write(pep.CACHE_MAGIC + b"%d:" % pep.CACHE_FORMAT + key.encode("ascii") + b"\n")
+        pickle.dump(Forged("touch %s" % markerFileName), cacheFile)
+
+    assert pep.readModelCache(cacheFileName, key) == None
+    assert not os.path.exists(markerFileName)
+    assert "is not allowed in a model cache file" in caplog.text
@@ -0,0 +1,88 @@
+"""Tests of checkpoints and resumed simulations (pep.writeCheckpoint(), readCheckpoint() and NumericalPsystem.restoreCheckpoint())"""
+
+import random # for the random number generator of the P system
+
+import pytest
+
+import common # test models and helpers
+import pep # the simulator
+
+def simulateInterrupted(directory, engineName = "python", withOutput = False):
+    """Simulates the generated test model for 6 steps, writing a checkpoint every 4 steps, and resumes it from the checkpoint of step 4
+
+    :directory: directory of the checkpoint and output files
+    :engineName: name of the simulation engine (see pep.engineNames)
+    :withOutput: True / False - whether or not to write (and continue) csv and trace files
+    :returns: the resumed P system"""
+
+    checkpointFileName = str(directory / "run.checkpoint")
+
+    system = pep.readInputFile(common.generatedModelFile)
+    system.rng = random.Random(common.SEED)
+    if (withOutput):
+        system.openCsvFile(str(directory / "resumed.csv"))
+        system.openTraceFile(str(directory / "resumed.trace"))
+    system.simulate(printEachSystemState = False, maxSteps = 6, checkpointEvery = 4, checkpointFileName = checkpointFileName,
+            engine = pep.createEngine(system, engineName) if engineName != "python" else None)
+    if (withOutput):
+        system.csvFile.close()
+        system.traceFile.close()
+
+    checkpoint = pep.readCheckpoint(checkpointFileName)
+    assert checkpoint.step == 4
+    system = pep.readInputFile(common.generatedModelFile)
+    system.restoreCheckpoint(checkpoint)
+    if (withOutput):
+        system.openCsvFile(checkpoint.csvFileName, resumeOffset = checkpoint.csvOffset)
+        system.openTraceFile(checkpoint.traceFileName, resumeOffset = checkpoint.traceOffset)
+    system.simulate(printEachSystemState = False, maxSteps = common.NR_STEPS, startStep = checkpoint.step,
+            engine = pep.createEngine(system, engineName) if engineName != "python" else None)
+    if (withOutput):
+        system.csvFile.close()
+        system.traceFile.close()
+    return system
+# end simulateInterrupted()
+
+def test_resumed_simulation_matches_full_simulation(tmp_path):
+    system = simulateInterrupted(tmp_path)
+
+    assert system.getValues() == common.runSimulation(common.generatedModelFile, "python")[-1]
+
+def test_resumed_numpy_simulation(tmp_path):
+    pytest.importorskip("numpy")
+    system = simulateInterrupted(tmp_path, "numpy")
+
+    assert system.getValues() == pytest.approx(common.runSimulation(common.generatedModelFile, "python")[-1], rel = 1e-12)
+
+def test_output_files_are_continued(tmp_path):
+    simulateInterrupted(tmp_path, withOutput = True)
+
+    system = pep.readInputFile(common.generatedModelFile)
+    system.rng = random.Random(common.SEED)
+    system.openCsvFile(str(tmp_path / "full.csv"))
+    system.openTraceFile(str(tmp_path / "full.trace"))
+    system.simulate(printEachSystemState = False, maxSteps = common.NR_STEPS)
+    system.csvFile.close()
+    system.traceFile.close()
+
+    # the steps written after the checkpoint of the interrupted simulation are replaced
+    for extension in ("csv", "trace"):
+        with open(str(tmp_path / ("resumed." + extension)), "rb") as resumedFile, open(str(tmp_path / ("full." + extension)), "rb") as fullFile:
+            assert resumedFile.read() == fullFile.read()
+
+def test_checkpoint_of_other_model_is_rejected(tmp_path):
+    checkpointFileName = str(tmp_path / "run.checkpoint")
+    system = pep.readInputFile(common.generatedModelFile)
+    pep.writeCheckpoint(system.getCheckpoint(0), checkpointFileName)
+
+    other = pep.readInputFile(common.modelFiles[0])
+    with pytest.raises(RuntimeError):
+        other.restoreCheckpoint(pep.readCheckpoint(checkpointFileName))
+
+def test_invalid_checkpoint_file_is_rejected(tmp_path):
+    checkpointFileName = str(tmp_path / "run.checkpoint")
+    with open(checkpointFileName, "wb") as checkpointFile:
+        checkpointFile.write(b"not a checkpoint")
+
+    with pytest.raises(RuntimeError, match = "is not a checkpoint file"):
+        pep.readCheckpoint(checkpointFileName)
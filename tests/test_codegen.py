@@ -0,0 +1,22 @@
+"""Tests of the generated simulation function engine (pep_codegen.py)"""
+
+import os # for paths
+
+import pytest
+
+import common # test models and helpers
+import pep # the simulator
+
+@pytest.mark.parametrize("filename", common.modelFiles, ids = common.modelId)
+def test_codegen_engine_matches_python(filename):
+    assert common.runSimulation(filename, "codegen") == common.runReference(filename)
+
+def test_codegen_run_keeps_the_completed_steps():
+    filename = os.path.join(common.repositoryDirectory, "input_files", "input_example_2.pep")
+    expected = common.runReference(filename, 13)[-1]
+
+    # the power operator overflows in step 14, inside the generated loop
+    simulation = pep.Simulation.fromFile(filename, "codegen", common.SEED)
+    with pytest.raises(OverflowError):
+        simulation.engine.run(20)
+    assert simulation.engine.getValues() == expected
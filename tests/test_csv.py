@@ -0,0 +1,79 @@
+"""Tests of the background csv writer (pep_trace.CsvTraceWriter)"""
+
+import gzip # for reading compressed csv files
+import random # for the random number generator of the P system
+
+import pytest
+
+import common # test models and helpers
+import pep # the simulator
+import pep_trace # csv output
+
+def writeCsv(filename, nrSteps = common.NR_STEPS, **options):
+    """Simulates the generated test model, writing a csv file
+
+    :options: options of NumericalPsystem.openCsvFile()
+    :returns: P system object"""
+
+    system = pep.readInputFile(common.generatedModelFile)
+    system.rng = random.Random(common.SEED)
+    system.openCsvFile(filename, **options)
+    system.simulate(printEachSystemState = False, maxSteps = nrSteps)
+    system.csvFile.close()
+    return system
+# end writeCsv()
+
+def expectedRows(selectedNames, every):
+    """:returns: the csv rows (lists of strings) of the steps written with the given decimation and columns"""
+
+    system = pep.readInputFile(common.generatedModelFile)
+    names = [pobject.name for pobject in system.variables + system.enzymes]
+    trajectory = [system.getValues()] + common.runSimulation(common.generatedModelFile, "python")
+    variableColumns = [column for column, name in enumerate(names[:len(system.variables)]) if name in selectedNames]
+    enzymeColumns = [column for column, name in enumerate(names) if column >= len(system.variables) and name in selectedNames]
+
+    rows = [["step"] + [names[column] for column in variableColumns] + [""] + [names[column] for column in enzymeColumns]]
+    for step, values in enumerate(trajectory):
+        # the initial state is always written, numbered like the first step (as in the original simulator)
+        if (step == 0 or step % every == 0):
+            rows.append([str(max(step, 1))] + [str(values[column]) for column in variableColumns] + [""] + [str(values[column]) for column in enzymeColumns])
+    return rows
+# end expectedRows()
+
+def readRows(lines):
+    """:returns: the rows (lists of strings) of the lines of a csv file, without its description line"""
+
+    assert lines[0].startswith("PeP csv output")
+    return [[field.strip() for field in line.rstrip("\n").split(",")] for line in lines[1:]]
+# end readRows()
+
+def test_csv_contains_every_step(tmp_path):
+    filename = str(tmp_path / "run.csv")
+    system = writeCsv(filename)
+    names = [pobject.name for pobject in system.variables + system.enzymes]
+
+    with open(filename) as csvFile:
+        assert readRows(csvFile.readlines()) == expectedRows(names, 1)
+
+def test_csv_decimation_and_columns(tmp_path):
+    filename = str(tmp_path / "run.csv")
+    system = pep.readInputFile(common.generatedModelFile)
+    selectedNames = [system.variables[2].name, system.variables[0].name] + [pobject.name for pobject in system.enzymes[:1]]
+    writeCsv(filename, every = 3, variableNames = selectedNames)
+
+    with open(filename) as csvFile:
+        assert readRows(csvFile.readlines()) == expectedRows(selectedNames, 3)
+
+def test_csv_compression(tmp_path):
+    filename = str(tmp_path / "run.csv.gz")
+    system = writeCsv(filename, compression = "gzip")
+    names = [pobject.name for pobject in system.variables + system.enzymes]
+
+    with gzip.open(filename, "rt") as csvFile:
+        assert readRows(csvFile.readlines()) == expectedRows(names, 1)
+    with pytest.raises(RuntimeError):
+        system.openCsvFile(filename, compression = "gzip", resumeOffset = 0)
+
+def test_csv_unknown_column(tmp_path):
+    with pytest.raises(RuntimeError, match = "Unknown variable 'unknown'"):
+        pep_trace.CsvTraceWriter(str(tmp_path / "run.csv"), ["x"], [], columns = ["unknown"])
@@ -0,0 +1,45 @@
+"""Tests of the partitioned bulk-synchronous simulation (pep_distributed.py)"""
+
+import pytest
+
+import common # test models and helpers
+import pep # the simulator
+import pep_distributed # partitioned simulation
+
+deterministicModelFiles = [filename for filename in common.modelFiles if pep.readInputFile(filename).isDeterministic()]
+
+def readDescription(filename):
+    with open(filename) as inputFile:
+        return inputFile.read()
+
+@pytest.mark.parametrize("filename", deterministicModelFiles, ids = common.modelId)
+def test_distributed_matches_python(filename):
+    # each partition chooses programs using its own random number generator, so only deterministic models are compared
+    simulation = pep_distributed.DistributedSimulation(readDescription(filename), nrPartitions = 2, seed = common.SEED)
+    try:
+        simulation.run(4)
+        simulation.run(common.NR_STEPS - 4)
+        values = simulation.getValues()
+        summary = simulation.summary()
+    finally:
+        simulation.close()
+
+    assert values == common.runReference(filename)[-1]
+    assert summary["steps"] == common.NR_STEPS
+
+@pytest.mark.parametrize("nrPartitions", [1, 2, 3, 100])
+def test_partitioning(nrPartitions):
+    system = pep.readInputFile(common.generatedModelFile)
+    partitioning = pep_distributed.partitionMembranes(system, nrPartitions)
+
+    # there are at most as many partitions as membranes
+    assert partitioning.nrPartitions == min(nrPartitions, len(system.H))
+    assert len(partitioning.membranePartitions) == len(system.H)
+    assert sorted(set(partitioning.membranePartitions)) == list(range(partitioning.nrPartitions))
+    assert 0 <= partitioning.cutEdges <= partitioning.totalEdges
+    if (partitioning.nrPartitions == 1):
+        assert partitioning.cutEdges == 0
+
+def test_invalid_address():
+    with pytest.raises(RuntimeError):
+        pep_distributed.parseAddress("pipe:somewhere")
@@ -0,0 +1,45 @@
+"""Tests of event tracing (pep_trace.EventTracer and TracedEngine)"""
+
+import json # for the events files
+import os # for paths
+import random # for the random number generator of the P system
+import subprocess # for the command line
+import sys # for the python interpreter
+
+import common # test models and helpers
+import pep # the simulator
+import pep_trace # event tracing
+
+def runCommandLine(directory, arguments):
+    """Runs pep.py on the generated test model, in the given directory"""
+
+    process = subprocess.run([sys.executable, os.path.join(common.repositoryDirectory, "pep.py"), common.generatedModelFile,
+            "--no-report"] + arguments, cwd = str(directory), capture_output = True, text = True, timeout = 60)
+    assert process.returncode == 0, process.stderr
+# end runCommandLine()
+
+def test_traced_engine_matches_python_engine(tmp_path):
+    system = pep.readInputFile(common.generatedModelFile)
+    system.rng = random.Random(common.SEED)
+    tracer = pep_trace.EventTracer(str(tmp_path / "events.jsonl"))
+    engine = pep_trace.TracedEngine(system, tracer, startStep = 5)
+    trajectory = []
+    for step in range(common.NR_STEPS):
+        engine.runSimulationStep()
+        trajectory.append(engine.getValues())
+    tracer.close()
+
+    assert trajectory == common.runSimulation(common.generatedModelFile, "python")
+    with open(str(tmp_path / "events.jsonl")) as eventsFile:
+        events = [json.loads(line) for line in eventsFile]
+    # step numbers continue after startStep
+    assert sorted(set([event["step"] for event in events])) == list(range(6, 6 + common.NR_STEPS))
+
+def test_events_file_is_continued_after_resume(tmp_path):
+    runCommandLine(tmp_path, ["-n", "10", "--seed", "3", "--events", "full.jsonl"])
+    # the interrupted simulation wrote 2 more steps after its last checkpoint
+    runCommandLine(tmp_path, ["-n", "6", "--seed", "3", "--events", "resumed.jsonl", "--checkpoint-every", "4", "checkpoint"])
+    runCommandLine(tmp_path, ["-n", "10", "--resume", "checkpoint"])
+
+    with open(str(tmp_path / "full.jsonl")) as fullFile, open(str(tmp_path / "resumed.jsonl")) as resumedFile:
+        assert resumedFile.read() == fullFile.read()
@@ -0,0 +1,23 @@
+"""Checks the python engine against the trajectories recorded with the original simulator (see record_golden.py)"""
+
+import json # for the golden files
+
+import pytest
+
+import common # test models and helpers
+
+@pytest.mark.parametrize("filename", common.modelFiles, ids = common.modelId)
+def test_python_engine_matches_original(filename):
+    with open(common.goldenFileName(filename)) as goldenFile:
+        golden = json.load(goldenFile)
+    system = common.readModel(filename)
+
+    for step, expected in enumerate(golden["trajectory"], 1):
+        system.runSimulationStep()
+        # repr() also compares the types (int / float) and nan values
+        assert repr(system.getValues()) == repr(expected), "step %d" % step
+
+    if (golden["error"] != None):
+        with pytest.raises(ArithmeticError) as excinfo:
+            system.runSimulationStep()
+        assert type(excinfo.value).__name__ == golden["error"]["type"]
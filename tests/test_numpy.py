@@ -0,0 +1,76 @@
+"""Tests of the NumPy array-backed simulation engines (pep_numpy.py)"""
+
+import os # for paths
+
+import pytest
+
+import common # test models and helpers
+
+np = pytest.importorskip("numpy")
+
+import pep # the simulator
+
+@pytest.mark.parametrize("filename", common.modelFiles, ids = common.modelId)
+def test_vectorized_engine_matches_python(filename):
+    # float64 arithmetic, but trigonometric and logarithmic functions can differ in the last bit
+    np.testing.assert_array_max_ulp(np.array(common.runSimulation(filename, "numpy"), dtype=np.float64),
+            np.array(common.runReference(filename), dtype=np.float64), maxulp = 4)
+
+def test_vectorized_engine_overflow():
+    # the python engine raises OverflowError in the power operator of step 14
+    simulation = pep.Simulation.fromFile(os.path.join(common.repositoryDirectory, "input_files", "input_example_2.pep"), "numpy", common.SEED)
+    with pytest.raises(OverflowError):
+        for step in range(20):
+            simulation.step()
+    assert simulation.stepNr == 13
+
+deterministicModelFiles = [filename for filename in common.modelFiles if pep.readInputFile(filename).isDeterministic()]
+
+@pytest.mark.parametrize("filename", deterministicModelFiles, ids = common.modelId)
+def test_replica_batch_matches_python(filename):
+    import pep_numpy # array-backed simulation engines
+
+    engine = pep_numpy.ReplicaBatchEngine(pep.readInputFile(filename), 3, seed = 1)
+    trace = engine.run(common.NR_STEPS, recordTrace = True)
+    expected = np.array(common.runReference(filename), dtype=np.float64)
+    for replicaNr in range(3):
+        np.testing.assert_array_max_ulp(trace[:, replicaNr], expected, maxulp = 4)
+
+def test_replica_batch_random_choices():
+    import pep_numpy # array-backed simulation engines
+
+    states = []
+    for attempt in range(2):
+        engine = pep_numpy.ReplicaBatchEngine(pep.readInputFile(common.generatedModelFile), 8, seed = 1)
+        engine.run(common.NR_STEPS)
+        states.append(engine.values.copy())
+
+    # the same seed gives the same replicas, but the replicas choose different programs
+    assert np.array_equal(states[0], states[1])
+    assert len(set([tuple(row) for row in states[0].tolist()])) > 1
+
+def test_replica_batch_errors_do_not_stop_the_batch():
+    import pep_numpy # array-backed simulation engines
+
+    engine = pep_numpy.ReplicaBatchEngine(pep.readInputFile(os.path.join(common.repositoryDirectory, "input_files", "input_example_2.pep")), 2, seed = 1)
+    # the power operator overflows in step 14
+    engine.run(20)
+    assert not np.isfinite(engine.values).all()
+
+@pytest.mark.parametrize("filename", common.modelFiles, ids = common.modelId)
+def test_sparse_engine_matches_python(filename):
+    # the contributions to a Pobject are added together before they are added to its value, which can change the last bits
+    np.testing.assert_allclose(np.array(common.runSimulation(filename, "sparse"), dtype=np.float64),
+            np.array(common.runReference(filename), dtype=np.float64), rtol = 1e-12, atol = 1e-12)
+
+def test_csr_matrix():
+    import pep_numpy # array-backed simulation engines
+
+    matrix = pep_numpy.CsrMatrix([[(0, 1.0), (2, 0.5)], [], [(2, 2.0)]], 4)
+    assert matrix.rowCounts.tolist() == [2, 0, 1]
+    assert matrix.selectColumns(np.array([True, True, False])).tolist() == [0, 2]
+    assert matrix.transposeDot(np.array([2.0, 5.0, 3.0])).tolist() == [2.0, 0.0, 7.0, 0.0]
+
+    pattern = pep_numpy.CsrMatrix([[1], [0, 3]], 4, withData = False)
+    assert pattern.data == None
+    assert pattern.selectColumns(np.array([False, True])).tolist() == [0, 3]
@@ -0,0 +1,32 @@
+"""Tests of the expression optimizer (pep.optimizeExpression() and NumericalPsystem.compile(optimize = True))"""
+
+import os # for paths
+
+import pytest
+
+import common # test models and helpers
+import pep # the simulator
+
+def countNodes(node):
+    """:returns: number of nodes of an expression tree"""
+
+    return 1 + sum([countNodes(child) for child in node.children])
+# end countNodes()
+
+@pytest.mark.parametrize("filename", common.modelFiles, ids = common.modelId)
+def test_optimized_python_engine_matches_python(filename):
+    assert common.runSimulation(filename, "python", optimize = True) == common.runReference(filename)
+
+def test_identities_are_simplified():
+    system = pep.readInputFile(os.path.join(common.testsDirectory, "models", "identities.pep"))
+    tree = system.membranes["m1"].programs[0].prodFunction.buildTree()
+    # x_1 + 0 + 8 + (z_1 < 5) * y_1 (x_1 + 0 is kept, because x_1 can be -0.0)
+    assert countNodes(pep.optimizeExpression(tree)) == 11
+    assert countNodes(tree) == 25
+
+def test_shared_subexpressions_are_computed_once():
+    system = pep.readInputFile(os.path.join(common.testsDirectory, "models", "identities.pep"))
+    system.compile(optimize = True)
+    system.runSimulationStep()
+    # x_2 + y_2 appears three times in the production function of m2
+    assert len(system.sharedValues) == 1
@@ -0,0 +1,44 @@
+"""Tests of the multiprocess replica runner (pep_replicas.runReplicas())"""
+
+import random # for the random number generator of the caller
+
+import pytest
+
+import common # test models and helpers
+import pep # the simulator
+import pep_replicas # replicas and parameter sweeps
+
+def runReplicaDirectly(filename, seed, nrSteps):
+    """Runs one replica in the current process
+
+    :returns: list of the values after each step"""
+
+    system = pep.readInputFile(filename)
+    system.rng = random.Random(seed)
+    trajectory = [system.getValues()]
+    for step in range(nrSteps):
+        system.runSimulationStep()
+        trajectory.append(system.getValues())
+    return trajectory
+# end runReplicaDirectly()
+
+@pytest.mark.parametrize("nrWorkers", [1, 2])
+def test_replicas_use_derived_seeds(nrWorkers):
+    system = pep.readInputFile(common.generatedModelFile)
+    results = pep_replicas.runReplicas(system, 4, common.NR_STEPS, nrWorkers, seed = 7, recordTrace = True)
+
+    assert [replicaNr for replicaNr, seed, values, trace in results] == [0, 1, 2, 3]
+    for replicaNr, seed, values, trace in results:
+        assert seed == pep_replicas.deriveReplicaSeed(7, replicaNr)
+        assert trace == runReplicaDirectly(common.generatedModelFile, seed, common.NR_STEPS)
+        assert values == trace[-1]
+
+def test_replicas_restore_the_system():
+    system = pep.readInputFile(common.generatedModelFile)
+    rng = system.rng = random.Random(common.SEED)
+    initialValues = system.getValues()
+
+    pep_replicas.runReplicas(system, 2, common.NR_STEPS, nrWorkers = 1, seed = 7)
+
+    assert system.getValues() == initialValues
+    assert system.rng is rng
@@ -0,0 +1,55 @@
+"""Tests of the state reports written during a simulation (pep.StateReporter)"""
+
+import io # for capturing the reports
+import random # for the random number generator of the P system
+
+import common # test models and helpers
+import pep # the simulator
+
+def simulateWithReporter(reporter, nrSteps = common.NR_STEPS):
+    """:returns: the reports written while simulating the generated test model"""
+
+    reporter.output = io.StringIO()
+    system = common.readModel(common.generatedModelFile)
+    system.simulate(printEachSystemState = False, maxSteps = nrSteps, reporter = reporter)
+    return reporter.output.getvalue()
+# end simulateWithReporter()
+
+def printedStates():
+    """:returns: list of the outputs of NumericalPsystem.print() before and after each simulation step"""
+
+    system = common.readModel(common.generatedModelFile)
+    states = [system.print(toString = True) + "\n"]
+    for step in range(common.NR_STEPS):
+        system.runSimulationStep()
+        states.append(system.print(toString = True) + "\n")
+    return states
+# end printedStates()
+
+def test_reports_match_printed_states():
+    states = printedStates()
+
+    assert simulateWithReporter(pep.StateReporter()) == "".join(states[1:])
+    assert simulateWithReporter(pep.StateReporter(every = 3)) == states[3] + states[6] + states[9]
+
+def test_changes_only():
+    system = pep.readInputFile(common.generatedModelFile)
+    names = [pobject.name for pobject in system.variables + system.enzymes]
+    trajectory = [system.getValues()] + common.runSimulation(common.generatedModelFile, "python")
+    expected = []
+    for step in range(1, len(trajectory)):
+        changed = [index for index in range(len(names)) if trajectory[step][index] != trajectory[step - 1][index]]
+        if (len(changed) > 0):
+            expected.append("step %d: %s\n" % (step, ", ".join(["%s: %.2f" % (names[index], trajectory[step][index]) for index in changed])))
+
+    assert simulateWithReporter(pep.StateReporter(changesOnly = True)) == "".join(expected)
+
+def test_reports_limited_by_time():
+    reporter = pep.StateReporter(every = 0, interval = 2.0)
+    reporter.prepare(pep.readInputFile(common.generatedModelFile), [], currentTime = 100.0)
+
+    assert not reporter.isDue(1, 101.0)
+    assert reporter.isDue(2, 102.0)
+    reporter.lastTime = 102.0
+    assert not reporter.isDue(3, 103.5)
+    assert reporter.isDue(4, 104.0)
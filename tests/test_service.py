@@ -0,0 +1,92 @@
+"""Tests of the simulation service (pep_service.py)"""
+
+import asyncio # for running the service
+import os # for paths
+import subprocess # for the command line
+import sys # for the python interpreter
+
+import pytest
+
+import common # test models and helpers
+import pep # the simulator
+import pep_service # the simulation service
+
+def exchange(tmp_path, requests, segmentSteps = 3):
+    """Starts a service, sends each request on its own connection and stops the service
+
+    :returns: list of the list of responses of each request"""
+
+    address = "unix:%s" % (tmp_path / "service.sock")
+
+    async def run():
+        service = pep_service.SimulationService(nrWorkers = 1, segmentSteps = segmentSteps)
+        server = asyncio.create_task(service.serve(address))
+        try:
+            while (not os.path.exists(str(tmp_path / "service.sock"))):
+                await asyncio.sleep(0.01)
+            responses = []
+            for request in requests:
+                responses.append(await asyncio.to_thread(lambda: list(pep_service.sendRequest(address, request))))
+            return responses
+        finally:
+            server.cancel()
+            service.close()
+
+    return asyncio.run(run())
+# end exchange()
+
+def readDescription(filename):
+    with open(filename) as inputFile:
+        return inputFile.read()
+
+def test_simulate_streams_the_trajectory_in_segments(tmp_path):
+    request = {"op": "simulate", "model": readDescription(common.generatedModelFile), "steps": common.NR_STEPS,
+            "seed": common.SEED, "trace": {"every": 1}}
+    responses, = exchange(tmp_path, [request])
+
+    trajectory = common.runSimulation(common.generatedModelFile, "python")
+    system = pep.readInputFile(common.generatedModelFile)
+    names = [pobject.name for pobject in system.variables + system.enzymes]
+    # one trace chunk per segment of at most 3 steps
+    assert [response["event"] for response in responses] == ["trace"] * 4 + ["result"]
+    assert sum([response["steps"] for response in responses[:-1]], []) == list(range(common.NR_STEPS + 1))
+    assert sum([response["values"] for response in responses[:-1]], []) == [system.getValues()] + trajectory
+    assert responses[-1]["step"] == common.NR_STEPS
+    assert responses[-1]["values"] == dict(reversed(list(zip(names, trajectory[-1]))))
+
+def test_invalid_models_are_not_stored(tmp_path):
+    description = readDescription(common.generatedModelFile)
+    responses = exchange(tmp_path, [
+        {"op": "upload", "model": "garbage"},
+        {"op": "simulate", "model": "num_ps = {", "steps": 1},
+        {"op": "metrics"},
+        {"op": "upload", "model": description},
+        {"op": "metrics"}])
+
+    assert responses[0][0]["event"] == "error"
+    assert responses[1][0]["event"] == "error"
+    assert responses[2][0]["models"] == 0
+    assert responses[3][0] == {"event": "uploaded", "model": pep.getModelCacheKey(description.encode("utf-8"))}
+    assert responses[4][0]["models"] == 1
+
+def test_simulate_by_key(tmp_path):
+    description = readDescription(common.generatedModelFile)
+    key = pep.getModelCacheKey(description.encode("utf-8"))
+    responses = exchange(tmp_path, [
+        {"op": "simulate", "key": key, "steps": 2},
+        {"op": "simulate", "model": description, "steps": 2, "seed": common.SEED},
+        {"op": "simulate", "key": key, "steps": 2, "seed": common.SEED}])
+
+    assert responses[0][0]["event"] == "error"
+    assert "Unknown model key" in responses[0][0]["message"]
+    assert responses[1][0]["event"] == "result"
+    assert responses[2] == [dict(responses[1][0], seconds = responses[2][0]["seconds"])]
+
+def test_segments_have_at_least_one_step():
+    with pytest.raises(RuntimeError):
+        pep_service.SimulationService(segmentSteps = 0)
+
+    process = subprocess.run([sys.executable, os.path.join(common.repositoryDirectory, "pep_service.py"), "--segment", "0"],
+            capture_output = True, text = True, timeout = 60)
+    assert process.returncode == 1
+    assert "--segment" in process.stderr
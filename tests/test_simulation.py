@@ -0,0 +1,53 @@
+"""Tests of the embeddable Simulation API (pep.Simulation)"""
+
+import os # for paths
+
+import pytest
+
+import common # test models and helpers
+import pep # the simulator
+
+activationModelFile = os.path.join(common.testsDirectory, "models", "enzymatic_activation.pep")
+overflowModelFile = os.path.join(common.repositoryDirectory, "input_files", "input_example_2.pep")
+
+def engineOrSkip(engineName):
+    """Skips the test if the engine requires NumPy and it is not installed
+
+    :returns: engineName"""
+
+    if (engineName in ("numpy", "sparse")):
+        pytest.importorskip("numpy")
+    return engineName
+# end engineOrSkip()
+
+@pytest.mark.parametrize("engineName", pep.engineNames)
+def test_run_counts_the_completed_steps(engineName):
+    simulation = pep.Simulation.fromFile(overflowModelFile, engineOrSkip(engineName), common.SEED)
+    simulation.run(5)
+    assert simulation.stepNr == 5
+
+    # the power operator overflows in step 14
+    with pytest.raises(OverflowError):
+        simulation.run(20)
+    assert simulation.stepNr == 13
+    assert simulation.getValues() == pytest.approx(common.runReference(overflowModelFile, 13)[-1])
+
+@pytest.mark.parametrize("engineName", pep.engineNames)
+def test_set_value_changes_the_next_steps(engineName):
+    simulation = pep.Simulation.fromFile(activationModelFile, engineOrSkip(engineName), common.SEED)
+    reference = common.readModel(activationModelFile)
+    handle = simulation.handle("e_1")
+
+    steps = []
+    for step, state in simulation.iterate(6):
+        steps.append(step)
+        reference.runSimulationStep()
+        assert list(state) == reference.getValues()
+
+        # the enzyme activates the programs of m1 from the next step
+        if (step == 1):
+            simulation.setValue(handle, 100)
+            reference.setValues([100 if name == "e_1" else value for name, value in zip(simulation.names, reference.getValues())])
+        assert simulation.getValue(handle) == reference.getValues()[handle]
+
+    assert steps == [1, 2, 3, 4, 5, 6]
@@ -0,0 +1,101 @@
+"""Tests of the fixed point and cycle detection (pep.SteadyStateDetector and NumericalPsystem.simulate())"""
+
+import random # for the random number generator of the P system
+
+import common # test models and helpers
+import pep # the simulator
+
+# x and y swap their values at each step (a cycle of period 2)
+cycleModel = """num_ps = {
+    H = {m1, m2};
+    structure = [m1 [m2 ]m2 ]m1;
+    m1 = {
+        var = {x};
+        pr = {x -> 1|y};
+        var0 = (1);
+    };
+    m2 = {
+        var = {y};
+        pr = {y -> 1|x};
+        var0 = (0);
+    };
+}
+"""
+
+# x converges to 0 (halves at each step) and z stays constant
+convergingModel = """num_ps = {
+    H = {m1, m2};
+    structure = [m1 [m2 ]m2 ]m1;
+    m1 = {
+        var = {x};
+        pr = {0.5 * x -> 1|x};
+        var0 = (64);
+    };
+    m2 = {
+        var = {z};
+        pr = {z -> 1|z};
+        var0 = (3);
+    };
+}
+"""
+
+def simulate(description, nrSteps, **options):
+    """:returns: (description of the detected state, final values) tuple"""
+
+    system = pep.readInputString(description)
+    system.rng = random.Random(common.SEED)
+    detected = system.simulate(printEachSystemState = False, maxSteps = nrSteps, **options)
+    return detected, system.getValues()
+# end simulate()
+
+def test_fixed_point():
+    detected, values = simulate(convergingModel.replace("0.5 * x", "x"), 100, steadyStateTolerance = 0)
+
+    assert detected == "fixed point reached at step 0"
+    assert values == [64, 3]
+
+def test_tolerance():
+    detected, values = simulate(convergingModel, 100, steadyStateTolerance = 0.1)
+
+    # the values of step 9 and step 10 differ by 64 / 2**10 <= 0.1
+    assert detected == "steady state (tolerance 0.1) reached at step 9"
+    assert values == [64 / 2**10, 3]
+
+def test_cycle_without_step_limit():
+    detected, values = simulate(cycleModel, -1, steadyStateTolerance = 0)
+
+    assert detected == "cycle of period 2 detected at step 2 (first state of the cycle at step 0)"
+    assert values == [1, 0]
+
+def test_cycles_are_skipped():
+    for nrSteps in (101, 1000):
+        detected, values = simulate(cycleModel, nrSteps, steadyStateTolerance = 0)
+        assert detected.endswith("skipped %d steps" % ((nrSteps - 2) // 2 * 2))
+        assert values == simulate(cycleModel, nrSteps)[1]
+
+    generatedDescription = open(common.generatedModelFile).read()
+    # the generated model chooses programs randomly, so its states are not checked
+    detected, values = simulate(generatedDescription, common.NR_STEPS, steadyStateTolerance = 0)
+    assert detected == None
+    assert values == common.runSimulation(common.generatedModelFile, "python")[-1]
+
+def test_cycles_are_not_skipped_with_trace_output(tmp_path):
+    system = pep.readInputString(cycleModel)
+    system.openCsvFile(str(tmp_path / "run.csv"))
+    detected = system.simulate(printEachSystemState = False, maxSteps = 101, steadyStateTolerance = 0)
+    system.csvFile.close()
+
+    assert detected.endswith("not skipped")
+    with open(str(tmp_path / "run.csv")) as csvFile:
+        # description, header, initial state and 101 steps
+        assert len(csvFile.readlines()) == 104
+
+def test_detector_history():
+    detector = pep.SteadyStateDetector(maxHistory = 2)
+
+    assert detector.check(0, [1.0, 2.0]) == None
+    assert detector.check(1, [2.0, 1.0]) == None
+    assert detector.check(2, [1.0, 2.0]) == (0, 2)
+    # older states are forgotten once the history is full
+    assert detector.check(3, [5.0, 5.0]) == None
+    assert detector.check(4, [2.0, 1.0]) == None
@@ -0,0 +1,69 @@
+"""Tests of the expression-based stop conditions (pep.StopCondition)"""
+
+import pytest
+
+import common # test models and helpers
+import pep # the simulator
+
+# x counts the simulation steps and y grows by 2 at each step
+counterModel = """num_ps = {
+    H = {m1, m2};
+    structure = [m1 [m2 ]m2 ]m1;
+    par = {limit};
+    par0 = (5);
+    m1 = {
+        var = {x};
+        pr = {x + 1 -> 1|x};
+        var0 = (0);
+    };
+    m2 = {
+        var = {y};
+        pr = {2 -> 1|y};
+        var0 = (0);
+    };
+}
+"""
+
+def simulate(expressions, engineName = "python", stopEvery = 1, nrSteps = 100):
+    """:returns: (description of the met stop conditions, P system) tuple"""
+
+    system = pep.readInputString(counterModel)
+    stopConditions = [pep.StopCondition(system, expression) for expression in expressions]
+    detected = system.simulate(printEachSystemState = False, maxSteps = nrSteps, stopConditions = stopConditions, stopEvery = stopEvery,
+            engine = pep.createEngine(system, engineName) if engineName != "python" else None)
+    return detected, system
+# end simulate()
+
+@pytest.mark.parametrize("engineName", pep.engineNames)
+def test_simulation_stops_when_condition_is_met(engineName):
+    if (engineName in ("numpy", "sparse")):
+        pytest.importorskip("numpy")
+    detected, system = simulate(["x >= limit"], engineName)
+
+    assert detected == "stop condition 'x >= limit' met at step 5"
+    assert system.getValues() == [5, 10]
+
+def test_conditions_checked_every_k_steps():
+    detected, system = simulate(["x >= 5"], stopEvery = 2)
+
+    assert detected == "stop condition 'x >= 5' met at step 6"
+
+def test_several_conditions():
+    detected, system = simulate(["x == 3", "y * 2 > 11", "x > 50"])
+
+    assert detected == "stop condition 'x == 3' and 'y * 2 > 11' met at step 3"
+    detected, system = simulate(["x > 50"], nrSteps = 10)
+    assert detected == None
+
+def test_condition_does_not_consume():
+    system = pep.readInputString(counterModel)
+    condition = pep.StopCondition(system, "(x + y) * 2 <= 0")
+
+    assert condition.isMet()
+    assert not any([pobject.wasConsumed for pobject in system.variables])
+
+@pytest.mark.parametrize("expression", ["x >= 5 -> 1|x", "(x >= 5", "x >= 5)", "x >=", "z > 1"])
+def test_invalid_conditions(expression):
+    system = pep.readInputString(counterModel)
+    with pytest.raises(RuntimeError):
+        pep.StopCondition(system, expression)
@@ -0,0 +1,127 @@
+"""Tests of the parameter sweeps (pep_replicas.sweepParameters())"""
+
+import random # for the random number generator of each point
+
+import pytest
+
+import common # test models and helpers
+import pep # the simulator
+import pep_replicas # replicas and parameter sweeps
+
+parameterModel = """num_ps = {
+    H = {m1, m2};
+    structure = [m1 [m2 ]m2 ]m1;
+    par = {k, x_init, c};
+    par0 = (0.5, 10, 2);
+    m1 = {
+        var = {x_1, y_1};
+        pr = {k * x_1 + c -> 1|x_1 + 1|y_1};
+        var0 = (x_init, 0);
+    };
+    m2 = {
+        var = {z};
+        pr = {z + 1 -> 1|z};
+        pr = {z * k -> 1|z};
+        var0 = (c);
+    };
+}
+"""
+
+# the power of x overflows for large exponents
+overflowModel = """num_ps = {
+    H = {m1};
+    structure = [m1 ]m1;
+    par = {e};
+    par0 = (2);
+    m1 = {
+        var = {x};
+        pr = {x^e -> 1|x};
+        var0 = (3.5);
+    };
+}
+"""
+
+@pytest.fixture
+def parameterModelFile(tmp_path):
+    filename = tmp_path / "parameters.pep"
+    filename.write_text(parameterModel)
+    return str(filename)
+
+def runPointDirectly(filename, point, seed, nrSteps):
+    """Runs one point of a sweep in the current process, on a freshly read P system
+
+    :returns: list of the final values"""
+
+    system = pep.readInputFile(filename)
+    system.setParameters(point)
+    system.rng = random.Random(seed)
+    for step in range(nrSteps):
+        system.runSimulationStep()
+    return system.getValues()
+# end runPointDirectly()
+
+def test_parse_sweep_values():
+    assert pep_replicas.parseSweepValues("1,2,5") == [1, 2, 5]
+    assert pep_replicas.parseSweepValues("0.5,1e1") == [0.5, 10.0]
+    assert pep_replicas.parseSweepValues("0:1:0.25") == [0, 0.25, 0.5, 0.75, 1.0]
+    assert pep_replicas.parseSweepValues("1:10:3") == [1, 4, 7, 10]
+    with pytest.raises(ValueError):
+        pep_replicas.parseSweepValues("0:1:0")
+    with pytest.raises(ValueError):
+        pep_replicas.parseSweepValues("one")
+
+def test_parameter_grid():
+    points = pep_replicas.parameterGrid({"k": [1, 2], "c": [0, 5, 7]})
+
+    assert [list(point.items()) for point in points] == [
+        [("k", 1), ("c", 0)], [("k", 1), ("c", 5)], [("k", 1), ("c", 7)],
+        [("k", 2), ("c", 0)], [("k", 2), ("c", 5)], [("k", 2), ("c", 7)]]
+
+@pytest.mark.parametrize("nrWorkers", [1, 2])
+def test_sweep_matches_separate_runs(parameterModelFile, nrWorkers):
+    system = pep.readInputFile(parameterModelFile)
+    points = pep_replicas.parameterGrid({"k": [0.5, 2], "x_init": [1, 10]})
+    results = pep_replicas.sweepParameters(system, points, common.NR_STEPS, nrWorkers = nrWorkers, seed = 7)
+
+    assert [pointNr for pointNr, point, values in results] == list(range(len(points)))
+    for pointNr, point, values in results:
+        assert point == points[pointNr]
+        assert values == runPointDirectly(parameterModelFile, point, pep_replicas.deriveReplicaSeed(7, pointNr), common.NR_STEPS)
+
+def test_sweep_reports_selected_variables(parameterModelFile):
+    system = pep.readInputFile(parameterModelFile)
+    points = pep_replicas.parameterGrid({"c": [0, 3]})
+    everything = pep_replicas.sweepParameters(system, points, common.NR_STEPS)
+    selected = pep_replicas.sweepParameters(system, points, common.NR_STEPS, variableNames = ["z", "x_1"])
+
+    names = [pobject.name for pobject in system.variables + system.enzymes]
+    for (pointNr, point, allValues), (selectedNr, selectedPoint, values) in zip(everything, selected):
+        assert values == [allValues[names.index("z")], allValues[names.index("x_1")]]
+
+def test_sweep_restores_the_system(parameterModelFile):
+    system = pep.readInputFile(parameterModelFile)
+    rng = system.rng = random.Random(common.SEED)
+    initialValues = system.getValues()
+
+    pep_replicas.sweepParameters(system, pep_replicas.parameterGrid({"x_init": [1, 2]}), common.NR_STEPS, nrWorkers = 2)
+
+    assert system.getValues() == initialValues
+    assert system.parameters["x_init"].value == 10
+    assert system.rng is rng
+
+def test_sweep_rejects_unknown_names(parameterModelFile):
+    system = pep.readInputFile(parameterModelFile)
+    with pytest.raises(RuntimeError, match = "Unknown parameter 'q'"):
+        pep_replicas.sweepParameters(system, [{"q": 1}], common.NR_STEPS)
+    with pytest.raises(RuntimeError, match = "Unknown variable 'w'"):
+        pep_replicas.sweepParameters(system, [{"k": 1}], common.NR_STEPS, variableNames = ["w"])
+
+@pytest.mark.parametrize("nrWorkers", [1, 2])
+def test_sweep_propagates_errors(tmp_path, nrWorkers):
+    filename = tmp_path / "overflow.pep"
+    filename.write_text(overflowModel)
+    system = pep.readInputFile(str(filename))
+
+    with pytest.raises(OverflowError):
+        pep_replicas.sweepParameters(system, pep_replicas.parameterGrid({"e": [1, 20]}), common.NR_STEPS, nrWorkers = nrWorkers)
+    assert system.getValues() == [3.5]
@@ -0,0 +1,105 @@
+"""Tests of the binary and delta trace files (pep_trace.BinaryTraceWriter, DeltaTraceWriter and their readers)"""
+
+import os # for file sizes
+import random # for the random number generator of the P system
+
+import pytest
+
+import common # test models and helpers
+
+np = pytest.importorskip("numpy")
+
+import pep # the simulator
+import pep_trace # trace files
+
+def writeTrace(filename, nrSteps = common.NR_STEPS, **options):
+    """Simulates the generated test model, writing a trace file
+
+    :options: options of NumericalPsystem.openTraceFile()
+    :returns: the values of the initial state"""
+
+    system = pep.readInputFile(common.generatedModelFile)
+    system.rng = random.Random(common.SEED)
+    initialValues = system.getValues()
+    system.openTraceFile(filename, **options)
+    system.simulate(printEachSystemState = False, maxSteps = nrSteps)
+    system.traceFile.close()
+    return initialValues
+# end writeTrace()
+
+def test_binary_trace_matches_trajectory(tmp_path):
+    filename = str(tmp_path / "run.trace")
+    initialValues = writeTrace(filename)
+
+    trace = pep_trace.BinaryTraceReader(filename)
+    try:
+        system = pep.readInputFile(common.generatedModelFile)
+        assert trace.names == [pobject.name for pobject in system.variables + system.enzymes]
+        assert trace.nrVariables == len(system.variables)
+        assert trace.steps.tolist() == list(range(common.NR_STEPS + 1))
+        assert trace.values.tolist() == [initialValues] + common.runSimulation(common.generatedModelFile, "python")
+    finally:
+        trace.close()
+
+def test_binary_trace_read_ranges(tmp_path):
+    filename = str(tmp_path / "run.trace")
+    writeTrace(filename)
+
+    trace = pep_trace.BinaryTraceReader(filename)
+    try:
+        names = [trace.names[3], trace.names[1]]
+        steps, values = trace.read(4, 7, names = names)
+        assert steps.tolist() == [4, 5, 6, 7]
+        assert np.array_equal(values, trace.values[4:8][:, [3, 1]])
+        # consecutive columns are returned as a view of the file
+        steps, values = trace.read(names = trace.names[1:3])
+        assert np.shares_memory(values, trace.values)
+        with pytest.raises(KeyError):
+            trace.read(names = ["unknown"])
+    finally:
+        trace.close()
+
+def test_binary_trace_ignores_incomplete_record(tmp_path):
+    filename = str(tmp_path / "run.trace")
+    writeTrace(filename)
+    # an interrupted simulation can leave a partly written record
+    os.truncate(filename, os.path.getsize(filename) - 3)
+
+    trace = pep_trace.openTraceReader(filename)
+    try:
+        assert isinstance(trace, pep_trace.BinaryTraceReader)
+        assert len(trace) == common.NR_STEPS
+    finally:
+        trace.close()
+
+def test_delta_trace_matches_binary_trace(tmp_path):
+    binaryFileName = str(tmp_path / "run.trace")
+    deltaFileName = str(tmp_path / "run.delta")
+    writeTrace(binaryFileName)
+    writeTrace(deltaFileName, traceFormat = "delta", keyframeEvery = 3)
+
+    binaryTrace = pep_trace.openTraceReader(binaryFileName)
+    deltaTrace = pep_trace.openTraceReader(deltaFileName)
+    try:
+        assert isinstance(deltaTrace, pep_trace.DeltaTraceReader)
+        assert deltaTrace.names == binaryTrace.names
+        steps, values = deltaTrace.read()
+        assert steps.tolist() == list(range(common.NR_STEPS + 1))
+        assert np.array_equal(values, binaryTrace.values)
+        # ranges that start between keyframes
+        steps, values = deltaTrace.read(5, 8, names = deltaTrace.names[1:3])
+        assert steps.tolist() == [5, 6, 7, 8]
+        assert np.array_equal(values, binaryTrace.read(5, 8, names = binaryTrace.names[1:3])[1])
+        assert np.array_equal(deltaTrace.getState(common.NR_STEPS), binaryTrace.values[-1])
+    finally:
+        binaryTrace.close()
+        deltaTrace.close()
+
+def test_delta_trace_is_smaller_for_constant_values(tmp_path):
+    binaryFileName = str(tmp_path / "run.trace")
+    deltaFileName = str(tmp_path / "run.delta")
+    writeTrace(binaryFileName, nrSteps = 100)
+    writeTrace(deltaFileName, nrSteps = 100, traceFormat = "delta")
+
+    # most Pobjects of the generated model do not change at each step
+    assert os.path.getsize(deltaFileName) < os.path.getsize(binaryFileName)